@@ -0,0 +1,98 @@
+"""
+Package for microbenchmarks of the bot's internals.
+
+Each benchmark suite is a module in this package with a run() function, which
+prints its results. Suites are run with `./manage.py bench [suite...]`.
+"""
+
+from importlib import import_module
+import time
+
+import config
+
+# Names of the benchmark suites, in the order they are run by default.
+SUITES = [
+	"pipeline",
+	"perms",
+	"regex",
+]
+
+
+def load_conf(name, conf):
+	"""
+	Load a config from memory, as if it had been read from its file.
+
+	Args:
+		name: the name of the config, e.g. "commands".
+		conf: the parsed contents of the config.
+	"""
+
+	config.apply_config(name, conf)
+
+
+def time_calls(func, n):
+	"""
+	Call a function repeatedly and return the mean time per call, in seconds.
+
+	Args:
+		func: the function to call, with no arguments.
+		n: the number of times to call it.
+	"""
+
+	start = time.perf_counter()
+	for _ in range(n):
+		func()
+
+	return (time.perf_counter() - start) / n
+
+
+def format_secs(secs):
+	"""
+	Format a duration in seconds for display in a results table.
+	"""
+
+	if secs >= 1:
+		return f"{secs:.2f}s"
+
+	if secs >= 1e-3:
+		return f"{secs * 1e3:.2f}ms"
+
+	return f"{secs * 1e6:.1f}us"
+
+
+def print_table(title, headers, rows):
+	"""
+	Print a table of benchmark results.
+
+	Args:
+		title: the title of the table.
+		headers: the column headers.
+		rows: a list of rows, each a list of values for the columns.
+	"""
+
+	rows = [[str(val) for val in row] for row in rows]
+	widths = [
+		max([len(header)] + [len(row[i]) for row in rows])
+		for i, header in enumerate(headers)
+	]
+
+	print(f"\n{title}")
+	print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+	print("  ".join("-" * w for w in widths))
+	for row in rows:
+		print("  ".join(val.ljust(w) for val, w in zip(row, widths)))
+
+
+def run(suites=None):
+	"""
+	Run benchmark suites.
+
+	Args:
+		suites: names of the suites to run. Defaults to all of them.
+	"""
+
+	for suite in suites or SUITES:
+		if suite not in SUITES:
+			raise ValueError(f"Unknown benchmark suite: '{suite}'")
+
+		import_module(f"benchmarks.{suite}").run()
@@ -0,0 +1,644 @@
+"""
+Benchmarks and a differential fuzzer for the permission engine.
+
+Tries are built from generated permission configs of many groups, each with
+many command perms, and their memory use is compared against that of the
+plain layout PermNode used to have: a __dict__ and a children dict for every
+node, a separate copy of every segment name, and a full copy of every
+inherited trie.
+
+Synthetic configs with a tunable number of groups, inheritance depth and
+fanout, wildcard density and negation ratio are used to time building,
+reloading and looking up perms. The same configs, with some users' perm
+overrides added, are used to fuzz every optimized way of checking a perm
+against a reference model, which keeps each group's perms in a flat dict
+rather than a trie, and resolves wildcards by looking up each prefix.
+"""
+
+import gc
+import random
+import time
+import tracemalloc
+
+from benchmarks import format_secs, print_table, time_calls
+import permissions
+from permissions import PermNode
+
+# (groups, perms per group) pairs to measure memory use at.
+MEMORY_SIZES = ((10, 100), (100, 100), (100, 1000))
+
+# The number of groups each group inherits from, where there are enough.
+INHERIT_FANOUT = 2
+
+# Keyword arguments of make_config() for each synthetic config to time.
+SCALING_CONFIGS = {
+	"small": dict(groups=10, depth=3, fanout=2),
+	"many groups": dict(groups=300, depth=4, fanout=2),
+	"deep": dict(groups=100, depth=20, fanout=1),
+	"wide": dict(groups=100, depth=3, fanout=8),
+	"wildcard heavy": dict(groups=100, depth=4, fanout=2, wildcards=0.6),
+	"negation heavy": dict(groups=100, depth=4, fanout=2, negations=0.6),
+	"long chain": dict(groups=1000, depth=1000, fanout=1),
+}
+
+# Lengths of inheritance chains to time building, to check that building
+#   grows linearly with the config.
+CHAIN_LENGTHS = (250, 500, 1000, 2000)
+
+# Number of perms looked up for each lookup measurement.
+NUM_LOOKUPS = 5000
+
+# Number of random configs checked by the fuzzer when run as a benchmark.
+FUZZ_ITERATIONS = 200
+
+
+class PlainPermNode:
+	"""
+	A permission trie node laid out the way PermNode used to be.
+	"""
+
+	def __init__(self, node, offset=0):
+		"""
+		Copy a PermNode and all of its descendants, including shared ones.
+
+		Args:
+			node: the PermNode to copy.
+			offset: the level offset of the node's parent.
+		"""
+
+		offset += node.lvl_offset
+
+		# Segment names used to be split out of each perm separately.
+		self.name = "".join(list(node.name))
+		self.root = node.root
+		self.tvalue = node.tvalue
+		self.wildcard = node.wildcard
+		self.group_lvl = offset + node.group_lvl
+		self.children = {
+			name: PlainPermNode(child, offset)
+			for name, child in node.children.items()
+		}
+
+
+def make_groups(groups, perms):
+	"""
+	Generate a permission config's groups.
+
+	Each group inherits from up to INHERIT_FANOUT groups before it, and has
+	its own command perms, some wildcards and some negations.
+
+	Args:
+		groups: the number of groups.
+		perms: the number of perms of each group.
+	"""
+
+	groups_conf = {}
+	for i in range(groups):
+		own = []
+		for j in range(perms):
+			if j % 10 == 0:
+				own.append(f"-plugin{j}.*")
+			elif j % 7 == 0:
+				own.append(f"plugin{j % 13}.sub{j}.*")
+			else:
+				own.append(f"cmd.command{(i + j) % (perms * 2)}")
+
+		groups_conf[f"group{i}"] = {
+			"perms": own,
+			"inherit": [
+				f"group{j}"
+				for j in range(max(0, i - INHERIT_FANOUT), i)
+			],
+		}
+
+	return groups_conf
+
+
+def measure(build):
+	"""
+	Return the memory allocated by a function, and still held after it.
+
+	Returns: a (result, bytes) pair.
+	"""
+
+	gc.collect()
+	tracemalloc.start()
+	try:
+		result = build()
+		held = tracemalloc.get_traced_memory()[0]
+
+	finally:
+		tracemalloc.stop()
+
+	return result, held
+
+
+def build_tries(groups_conf):
+	"""
+	Build every group's perm trie, without compiling them.
+	"""
+
+	permissions.perm_groups.clear()
+	for group in permissions.order_perm_groups(groups_conf):
+		permissions.make_perm_trie(groups_conf, group)
+
+	return dict(permissions.perm_groups)
+
+
+def count_nodes(node, seen=None):
+	"""
+	Count the distinct nodes of a trie.
+	"""
+
+	if seen is None:
+		seen = set()
+
+	if id(node) not in seen:
+		seen.add(id(node))
+		for child in node.child_vals:
+			count_nodes(child, seen)
+
+	return len(seen)
+
+
+def run_memory():
+	"""
+	Compare the memory use of compact and plain perm tries.
+	"""
+
+	rows = []
+	for groups, perms in MEMORY_SIZES:
+		groups_conf = make_groups(groups, perms)
+
+		tries, compact = measure(lambda: build_tries(groups_conf))
+		plain_tries, plain = measure(lambda: {
+			group: PlainPermNode(trie)
+			for group, trie in tries.items()
+		})
+
+		seen = set()
+		for trie in tries.values():
+			count_nodes(trie, seen)
+
+		rows.append([
+			groups,
+			perms,
+			f"{len(seen):,}",
+			f"{plain / 2**20:.2f}MiB",
+			f"{compact / 2**20:.2f}MiB",
+			f"{plain / compact:.1f}x",
+		])
+
+		del tries, plain_tries
+
+	print_table(
+		"Permission trie memory",
+		[
+			"groups",
+			"perms/group",
+			"compact nodes",
+			"plain",
+			"compact",
+			"saving",
+		],
+		rows,
+	)
+
+
+def make_config(
+	groups=10,
+	depth=3,
+	fanout=2,
+	perms=20,
+	wildcards=0.2,
+	negations=0.2,
+	segments=8,
+	seed=0,
+):
+	"""
+	Generate a synthetic permission config.
+
+	Groups are spread over depth layers of an inheritance DAG, with each
+	group inheriting from up to fanout groups of the layer before its own.
+
+	Args:
+		groups: the number of groups.
+		depth: the number of layers of the inheritance DAG.
+		fanout: the maximum number of groups each group inherits from.
+		perms: the number of perms of each group.
+		wildcards: the fraction of perms which end in a wildcard.
+		negations: the fraction of perms which are negated.
+		segments: the number of distinct names at each level of a perm.
+		seed: the seed for the random generator.
+
+	Returns: the config, as it would be loaded from permissions.yml.
+	"""
+
+	rng = random.Random(seed)
+	layers = [[] for _ in range(max(1, min(depth, groups)))]
+	groups_conf = {}
+
+	for i in range(groups):
+		name = "default" if i == 0 else f"group{i}"
+		layer = i % len(layers)
+		layers[layer].append(name)
+
+		inherit = []
+		if layer:
+			parents = layers[layer - 1]
+			inherit = rng.sample(parents, min(fanout, len(parents)))
+
+		groups_conf[name] = {
+			"perms": [
+				make_perm(rng, wildcards, negations, segments)
+				for _ in range(perms)
+			],
+			"inherit": inherit,
+		}
+
+	return {"groups": groups_conf}
+
+
+def make_perm(rng, wildcards=0.2, negations=0.2, segments=8, length=None):
+	"""
+	Generate a random perm.
+
+	Args:
+		rng: the random.Random to generate it with.
+		wildcards: the chance of the perm ending in a wildcard.
+		negations: the chance of the perm being negated.
+		segments: the number of distinct names at each level of the perm.
+		length: the number of names in the perm. Random if omitted.
+	"""
+
+	if length is None:
+		length = rng.randint(1, 4)
+
+	names = [f"n{rng.randrange(segments)}" for _ in range(length)]
+	if rng.random() < wildcards:
+		names[-1] = PermNode.WILDCARD_NAME
+
+	perm = PermNode.PERM_SEP.join(names)
+	if rng.random() < negations:
+		perm = PermNode.NEG_PREFIX + perm
+
+	return perm
+
+
+def make_lookups(count, segments=8, seed=0):
+	"""
+	Generate perms to look up, some of which won't be in any trie.
+	"""
+
+	rng = random.Random(seed)
+	return [
+		make_perm(rng, 0, 0, segments + 2, rng.randint(1, 5))
+		for _ in range(count)
+	]
+
+
+def flatten_perms(perms, inherited=()):
+	"""
+	Model the trie of some perms and inherited perms as a flat dict.
+
+	Each node the trie would have is keyed by its path, with the same value,
+	wildcard and priority level. Where the perms and an inherited dict have
+	the same path, it keeps its level and takes the inherited value only if
+	it has none of its own, or if the inherited level is lower. The inherited
+	dicts are taken in order, just as inherited tries are merged.
+
+	Args:
+		perms: the perm strings, at level 0.
+		inherited: flat dicts of inherited perms, each a level lower.
+
+	Returns: a dict of the paths of the nodes, as tuples of names, mapped to
+		[tvalue, wildcard, level] lists.
+	"""
+
+	flat = {(): [None, False, 0]}
+	for perm in perms:
+		tvalue = not perm.startswith(PermNode.NEG_PREFIX)
+		if not tvalue:
+			perm = perm[len(PermNode.NEG_PREFIX):]
+
+		path = ()
+		for name in perm.split(PermNode.PERM_SEP):
+			if name == PermNode.WILDCARD_NAME:
+				flat[path][1] = True
+				break
+
+			path += (name,)
+			flat.setdefault(path, [None, False, 0])
+
+		flat[path][0] = tvalue
+
+	for inh in inherited:
+		for path, (tvalue, wildcard, level) in inh.items():
+			level += 1
+			entry = flat.get(path)
+			if entry is None:
+				flat[path] = [tvalue, wildcard, level]
+				continue
+
+			if entry[0] is None or (tvalue is not None and entry[2] > level):
+				entry[0] = tvalue
+
+			entry[1] = entry[1] or wildcard
+
+	return flat
+
+
+def reference_groups(groups_conf):
+	"""
+	Model every group of a permission config with flatten_perms().
+	"""
+
+	flats = {}
+
+	def flatten_group(group):
+		if group not in flats:
+			group_conf = groups_conf[group]
+			flats[group] = flatten_perms(
+				group_conf.get("perms", []),
+				[flatten_group(inh) for inh in group_conf.get("inherit", [])],
+			)
+
+		return flats[group]
+
+	for group in groups_conf:
+		flatten_group(group)
+
+	return flats
+
+
+def reference_decision(flat, perm):
+	"""
+	Decide whether a flat dict from flatten_perms() includes a perm.
+
+	The perm's own node, if it has a value, and the wildcards of the nodes of
+	its proper prefixes are the candidates. The one with the lowest level
+	wins, then the longest, then True over False. Without any, it's False.
+	"""
+
+	names = tuple(perm.split(PermNode.PERM_SEP))
+	candidates = []
+	for length in range(len(names) + 1):
+		entry = flat.get(names[:length])
+		if entry is None:
+			break
+
+		tvalue, wildcard, level = entry
+		if length < len(names) and wildcard:
+			candidates.append((-level, length, tvalue))
+
+		if length == len(names) and tvalue is not None:
+			candidates.append((-level, length, tvalue))
+
+	if not candidates:
+		return False
+
+	return max(candidates)[2]
+
+
+def make_users(rng, wildcards=0.2, negations=0.2, segments=8):
+	"""
+	Generate the "users" section of a permission config.
+
+	Users 1 to 3 have random perm overrides. User 0 has none.
+	"""
+
+	return {
+		user: {
+			"perms": [
+				make_perm(rng, wildcards, negations, segments)
+				for _ in range(rng.randint(0, 6))
+			],
+		}
+		for user in range(1, 4)
+	}
+
+
+def fuzz(iterations=FUZZ_ITERATIONS, seed=0, lookups=200):
+	"""
+	Check every way of checking perms against the reference model.
+
+	Args:
+		iterations: the number of random configs to check.
+		seed: the seed of the first config. Each config has its own seed.
+		lookups: the number of perms to check against each group.
+
+	Returns: a list of (config seed, group, perm, method, expected, actual)
+		tuples, one for each disagreement found.
+	"""
+
+	failures = []
+	for iteration in range(iterations):
+		config_seed = seed + iteration
+		rng = random.Random(config_seed)
+		conf = make_config(
+			groups=rng.randint(1, 12),
+			depth=rng.randint(1, 5),
+			fanout=rng.randint(1, 3),
+			perms=rng.randint(0, 10),
+			wildcards=rng.random(),
+			negations=rng.random(),
+			segments=rng.randint(1, 4),
+			seed=config_seed,
+		)
+		conf["users"] = make_users(
+			rng,
+			wildcards=rng.random(),
+			negations=rng.random(),
+			segments=rng.randint(1, 4),
+		)
+		permissions.construct_perm_tries(conf)
+
+		perms = make_lookups(lookups, 4, config_seed)
+		references = reference_groups(conf["groups"])
+		for group in conf["groups"]:
+			reference = references[group]
+			bulk = permissions.group_has_perms(group, perms)
+			compiled = permissions.compile_group(group)
+			user_references = {
+				user: flatten_perms(user_conf["perms"], [reference])
+				for user, user_conf in conf["users"].items()
+			}
+
+			for perm in perms:
+				expected = reference_decision(reference, perm)
+				actual = {
+					"has_perm": permissions.perm_groups[group].has_perm(perm),
+					"compiled": compiled.has_perm(perm),
+					"group_has_perm": permissions.group_has_perm(group, perm),
+					"group_has_perms": bulk[perm],
+				}
+
+				failures.extend(
+					(config_seed, group, perm, method, expected, decision)
+					for method, decision in actual.items()
+					if bool(decision) != expected
+				)
+
+				# Users without overrides have their group's perms.
+				user_expected = {0: expected, None: expected}
+				user_expected.update(
+					(user, reference_decision(user_reference, perm))
+					for user, user_reference in user_references.items()
+				)
+				failures.extend(check_users(
+					config_seed,
+					group,
+					perm,
+					user_expected,
+				))
+
+		# Users in nonexistent groups only have their own perms.
+		own_references = {
+			user: flatten_perms(user_conf["perms"])
+			for user, user_conf in conf["users"].items()
+		}
+		for perm in perms:
+			failures.extend(check_users(config_seed, "absent", perm, {
+				user: reference_decision(own_reference, perm)
+				for user, own_reference in own_references.items()
+			}))
+
+	return failures
+
+
+def check_users(config_seed, group, perm, expected):
+	"""
+	Check user_has_perm() for some users of a group, for the fuzzer.
+
+	Args:
+		config_seed: the seed of the config being checked.
+		group: the users' permission group.
+		perm: the perm to check.
+		expected: a dict of users mapped to the expected decisions.
+
+	Returns: a list of failures, in the same form as fuzz().
+	"""
+
+	failures = []
+	for user, user_expected in expected.items():
+		decision = permissions.user_has_perm(user, group, perm)
+		if bool(decision) != user_expected:
+			failures.append((
+				config_seed,
+				group,
+				perm,
+				f"user_has_perm({user})",
+				user_expected,
+				decision,
+			))
+
+	return failures
+
+
+def run_scaling():
+	"""
+	Time building, reloading and looking up perms for synthetic configs.
+	"""
+
+	rows = []
+	for name, kwargs in SCALING_CONFIGS.items():
+		conf = make_config(**kwargs)
+
+		start = time.perf_counter()
+		permissions.construct_perm_tries(conf)
+		build = time.perf_counter() - start
+
+		start = time.perf_counter()
+		permissions.construct_perm_tries(conf)
+		reload_time = time.perf_counter() - start
+
+		# Look perms up against the most deeply inheriting group.
+		group = list(conf["groups"])[-1]
+		trie = permissions.perm_groups[group]
+		compiled = permissions.compile_group(group)
+		lookups = make_lookups(NUM_LOOKUPS)
+		perms = iter(lookups * 2)
+
+		def per_sec(func):
+			secs = time_calls(lambda: func(next(perms)), NUM_LOOKUPS)
+			return f"{1 / secs:,.0f}"
+
+		bulk_start = time.perf_counter()
+		trie.has_perms(lookups)
+		bulk = len(lookups) / (time.perf_counter() - bulk_start)
+
+		rows.append([
+			name,
+			format_secs(build),
+			format_secs(reload_time),
+			per_sec(trie.has_perm),
+			per_sec(compiled.has_perm),
+			f"{bulk:,.0f}",
+		])
+
+	print_table(
+		"Permission engine scaling (lookups/sec)",
+		["config", "build", "reload", "trie", "compiled", "bulk"],
+		rows,
+	)
+
+
+def run_chains():
+	"""
+	Time building inheritance chains of increasing length.
+	"""
+
+	rows = []
+	for length in CHAIN_LENGTHS:
+		conf = make_config(groups=length, depth=length, fanout=1)
+
+		# Build from scratch, rather than reusing the previous chain's tries.
+		permissions.construct_perm_tries({"groups": {}})
+
+		start = time.perf_counter()
+		permissions.construct_perm_tries(conf)
+		build = time.perf_counter() - start
+
+		seen = set()
+		for trie in permissions.perm_groups.values():
+			count_nodes(trie, seen)
+
+		rows.append([
+			length,
+			format_secs(build),
+			format_secs(build / length),
+			f"{len(seen) / length:,.0f}",
+		])
+
+	print_table(
+		"Permission inheritance chains",
+		["groups", "build", "per group", "nodes/group"],
+		rows,
+	)
+
+
+def run_fuzz():
+	"""
+	Fuzz the optimized perm checks against the reference tries.
+	"""
+
+	failures = fuzz()
+	print(
+		f"\nPermission fuzzer: {FUZZ_ITERATIONS} configs, "
+		f"{len(failures)} disagreements"
+	)
+	for failure in failures[:10]:
+		print("  seed {}, group {}, perm {}: {} expected {}, got {}".format(
+			*failure
+		))
+
+
+def run():
+	"""
+	Run the permission engine benchmarks.
+	"""
+
+	run_memory()
+	run_scaling()
+	run_chains()
+	run_fuzz()
@@ -0,0 +1,267 @@
+"""
+Benchmarks for the full message pipeline.
+
+Synthetic messages are driven through TerminalMessage and every registered
+MessageHandler, covering commands, static commands, aliases, regex triggers,
+Minecraft bridge rewriting and permission checks. Each subsystem's config is
+then scaled up on its own, to show how the pipeline's throughput scales with
+it.
+"""
+
+import time
+
+from benchmarks import format_secs, load_conf, print_table, time_calls
+import cooldown
+from imps.terminal_bot import TerminalMessage
+from permissions import group_has_perm
+import stats
+
+# Number of messages driven through the pipeline for each measurement.
+NUM_MESSAGES = 2000
+
+# Config sizes to measure each subsystem at.
+SIZES = (10, 100, 1000)
+
+# Size of each subsystem's config when another subsystem is being scaled.
+BASE_SIZE = 10
+
+BRIDGE_NAME = "MCBot"
+
+# The plugins under test, in the order the bot would load them.
+PLUGINS = ["minecraft", "commands", "regex"]
+
+
+class BenchMessage(TerminalMessage):
+	"""
+	A terminal message from an arbitrary sender and permission group.
+	"""
+
+	def __init__(self, msg, sender_name="TERMINAL", sender_group="default"):
+		self._sender = (sender_name, sender_group)
+		super().__init__(msg)
+
+	def _parse(self):
+		self.sender_name, self.sender_group = self._sender
+		super()._parse()
+
+
+def make_configs(aliases=BASE_SIZE, regexes=BASE_SIZE, groups=BASE_SIZE):
+	"""
+	Generate a set of synthetic configs.
+
+	Args:
+		aliases: the number of aliases, and of static commands.
+		regexes: the number of regex triggers.
+		groups: the number of permission groups, each inheriting from the last.
+
+	Returns: a dict of config names mapped to their contents.
+	"""
+
+	group_names = [f"group{i}" for i in range(groups)]
+	perm_groups = {
+		"default": {
+			"perms": ["cmd.*", "-cmd.shutdown", "-cmd.restart", "regex.trigger"],
+		},
+	}
+	for i, name in enumerate(group_names):
+		perm_groups[name] = {
+			"inherit": [group_names[i - 1] if i else "default"],
+			"perms": ["-cmd.shutdown", f"plugin{i}.*", f"-plugin{i}.x"],
+		}
+
+	return {
+		"commands": {
+			"command-prefix": "!",
+			"err-unknown-cmd": False,
+			"registered-cmd-pls": ["meta", "misc"],
+			"statics-cooldown": 0,
+			"static-commands": {f"static{i}": f"resp{i}" for i in range(aliases)},
+			"aliases": {
+				"roll": [f"roll{i}" for i in range(aliases)],
+				"echo": [f"echo{i}" for i in range(aliases)],
+			},
+			"prepend-name": True,
+			"prepend-exceptions": [],
+		},
+		"regex": {
+			"static-cooldown": 0,
+			"statics": {
+				f"trigger{i} (?:\\w+ )?phrase": f"response {i}"
+				for i in range(regexes)
+			},
+		},
+		"permissions": {"groups": perm_groups},
+		"minecraft": {
+			"mc-bridge-name": BRIDGE_NAME,
+			"mc-bridge-form":
+				"^<\\[(?P<RANK>\\w+)\\]-?(?P<NAME>[^>]+)>(?P<MESSAGE>.*)$",
+			"perm-groups": {"default": ["Member"], "staff": ["Mod"]},
+		},
+	}
+
+
+def load_configs(confs):
+	"""
+	Load a set of configs, importing the plugins under test if necessary.
+	"""
+
+	for name, conf in confs.items():
+		load_conf(name, conf)
+
+	for plugin in PLUGINS:
+		__import__("plugins." + plugin)
+
+	# Load once more, now that every plugin's config load handlers are known.
+	for name, conf in confs.items():
+		load_conf(name, conf)
+
+
+def make_scenarios(confs):
+	"""
+	Make the message mixes to measure.
+
+	Returns: a dict of scenario names mapped to lists of (text, sender name,
+		sender group) tuples.
+	"""
+
+	last_group = list(confs["permissions"]["groups"])[-1]
+	last_static = list(confs["commands"]["static-commands"])[-1]
+	last_alias = confs["commands"]["aliases"]["roll"][-1]
+	last_trigger = len(confs["regex"]["statics"]) - 1
+
+	return {
+		"chatter": [
+			("just some ordinary chatter", "user", "default"),
+			("nothing to see here", "user", "default"),
+		],
+		"command": [
+			("!roll 6", "user", "default"),
+			("!choose a b c", "user", "default"),
+			("!echo hello there", "user", "default"),
+		],
+		"static": [(f"!{last_static}", "user", "default")],
+		"alias": [(f"!{last_alias} 2d6+1", "user", "default")],
+		"unknown cmd": [("!nonexistent", "user", "default")],
+		"denied cmd": [("!shutdown", "user", last_group)],
+		"deep group": [("!roll 6", "user", last_group)],
+		"regex": [
+			(f"trigger{last_trigger} some phrase", "user", "default"),
+			("trigger0 phrase", "user", "default"),
+		],
+		"bridge": [
+			("<[Mod]Steve> !roll 6", BRIDGE_NAME, None),
+			("<[Member]Alex> just chatting", BRIDGE_NAME, None),
+		],
+	}
+
+
+def drive(messages, n=NUM_MESSAGES):
+	"""
+	Drive messages through the pipeline, cycling through them.
+
+	Cooldowns are cleared after every message, so that every message takes
+	its full path through the pipeline.
+
+	Args:
+		messages: a list of (text, sender name, sender group) tuples.
+		n: the total number of messages to drive.
+
+	Returns: the number of messages handled per second.
+	"""
+
+	stats.reset()
+	start = time.perf_counter()
+
+	for i in range(n):
+		BenchMessage(*messages[i % len(messages)])
+		cooldown.clear()
+
+	return n / (time.perf_counter() - start)
+
+
+def slowest_stages(count=3):
+	"""
+	Return the recorded stages with the highest p99 latency.
+
+	Returns: a list of (name, summary) pairs.
+	"""
+
+	return sorted(
+		stats.get_stats().items(),
+		key=lambda item: item[1]["p99"],
+		reverse=True,
+	)[:count]
+
+
+def run_scenarios():
+	"""
+	Measure every scenario against the base configs.
+	"""
+
+	confs = make_configs()
+	load_configs(confs)
+
+	rows = []
+	for name, messages in make_scenarios(confs).items():
+		rate = drive(messages)
+		stages = ", ".join(
+			f"{stage} p50 {format_secs(summ['p50'])} "
+			f"p99 {format_secs(summ['p99'])}"
+			for stage, summ in slowest_stages()
+		)
+		rows.append([name, f"{rate:,.0f}", stages])
+
+	print_table(
+		"Message pipeline by scenario",
+		["scenario", "msgs/sec", "slowest stages"],
+		rows,
+	)
+
+
+def run_scaling():
+	"""
+	Measure how each subsystem's throughput scales with its config size.
+	"""
+
+	subsystems = {
+		"aliases": ("alias", "aliases"),
+		"regexes": ("regex", "regexes"),
+		"perm groups": ("deep group", "groups"),
+	}
+
+	rows = []
+	for subsystem, (scenario, kwarg) in subsystems.items():
+		for size in SIZES:
+			confs = make_configs(**{kwarg: size})
+			load_start = time.perf_counter()
+			load_configs(confs)
+			load_time = time.perf_counter() - load_start
+			group = list(confs["permissions"]["groups"])[-1]
+
+			rate = drive(make_scenarios(confs)[scenario])
+			perm_check = time_calls(
+				lambda: group_has_perm(group, "cmd.roll"),
+				NUM_MESSAGES,
+			)
+			rows.append([
+				subsystem,
+				size,
+				f"{rate:,.0f}",
+				format_secs(perm_check),
+				format_secs(load_time),
+			])
+
+	print_table(
+		"Message pipeline scaling by config size",
+		["subsystem", "size", "msgs/sec", "perm check", "config load"],
+		rows,
+	)
+
+
+def run():
+	"""
+	Run the message pipeline benchmarks.
+	"""
+
+	run_scenarios()
+	run_scaling()
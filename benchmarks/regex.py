@@ -0,0 +1,188 @@
+"""
+Benchmarks for matching messages against regex triggers.
+
+Generated trigger sets of increasing size are matched against chat messages,
+most of which match no trigger, both as the single alternation of every
+trigger that the regex plugin used to try on each message, and as a
+TriggerSet, which prefilters them by their literals once there are enough.
+
+Reloading each set after editing one of its triggers is also timed, both by
+compiling every trigger afresh and by reusing the unchanged ones.
+"""
+
+import random
+import re
+import time
+
+from benchmarks import format_secs, print_table, time_calls
+from triggers import FLAGS, TriggerSet
+
+# Numbers of triggers to measure throughput at.
+TRIGGER_COUNTS = (10, 100, 1000, 5000)
+
+# Number of messages matched for each measurement.
+NUM_MESSAGES = 2000
+
+# The fraction of messages which match a trigger.
+MATCH_RATIO = 0.05
+
+WORDS = (
+	"the a pond bot server minecraft anyone online today build house farm "
+	"diamond lag restart what when why how is are was you me we they it "
+	"good bad great thanks lol ok yes no maybe later soon now"
+).split()
+
+
+def make_triggers(count, seed=0):
+	"""
+	Generate regex triggers resembling those of a real config.
+
+	Returns: a list of (pattern, search) pairs.
+	"""
+
+	rng = random.Random(seed)
+	triggers = []
+	for i in range(count):
+		word = rng.choice(WORDS)
+		kind = i % 4
+		if kind == 0:
+			pattern = rf"{word} trigger{i}'?s?(?: please)?"
+		elif kind == 1:
+			pattern = rf"(?:hey|hi) {word}{i}\b"
+		elif kind == 2:
+			pattern = rf"\w+ says? phrase{i}"
+		else:
+			pattern = rf"(key{i})[!?.]*"
+
+		triggers.append((pattern, i % 5 == 0))
+
+	return triggers
+
+
+def make_messages(count, triggers, seed=0):
+	"""
+	Generate chat messages, a few of which match one of the triggers.
+	"""
+
+	rng = random.Random(seed)
+	messages = []
+	for _ in range(count):
+		if rng.random() < MATCH_RATIO:
+			ind = rng.randrange(len(triggers))
+			kind = ind % 4
+			messages.append({
+				0: f"{triggers[ind][0].split()[0]} trigger{ind} please",
+				1: f"hey {rng.choice(WORDS)}{ind}",
+				2: f"pondbot says phrase{ind}",
+				3: f"key{ind}!!",
+			}[kind])
+
+		else:
+			messages.append(" ".join(
+				rng.choice(WORDS)
+				for _ in range(rng.randint(3, 15))
+			))
+
+	return messages
+
+
+def alternation(triggers):
+	"""
+	Compile triggers into a single alternation, as the plugin used to.
+
+	Search triggers are made to match anywhere by a leading lazy wildcard.
+	"""
+
+	return re.compile(
+		"|".join(
+			f"(?P<_t{ind}>{'(?s:.*?)' if search else ''}(?:{pattern}))"
+			for ind, (pattern, search) in enumerate(triggers)
+		),
+		FLAGS,
+	)
+
+
+def run_throughput():
+	"""
+	Measure trigger matching throughput against the number of triggers.
+	"""
+
+	rows = []
+	for count in TRIGGER_COUNTS:
+		triggers = make_triggers(count)
+		messages = make_messages(NUM_MESSAGES, triggers)
+
+		combined = alternation(triggers)
+		trigger_set = TriggerSet(triggers)
+
+		texts = iter(messages * 2)
+		combined_rate = 1 / time_calls(
+			lambda: combined.match(next(texts)),
+			NUM_MESSAGES,
+		)
+		texts = iter(messages * 2)
+		set_rate = 1 / time_calls(
+			lambda: trigger_set.match(next(texts)),
+			NUM_MESSAGES,
+		)
+
+		mean_candidates = sum(
+			len(trigger_set.candidates(text))
+			for text in messages
+		) / len(messages)
+
+		rows.append([
+			count,
+			f"{combined_rate:,.0f}",
+			f"{set_rate:,.0f}",
+			f"{mean_candidates:.2f}",
+		])
+
+	print_table(
+		"Regex trigger matching (msgs/sec)",
+		["triggers", "alternation", "trigger set", "candidates/msg"],
+		rows,
+	)
+
+
+def run_reload():
+	"""
+	Time reloading trigger sets after one of their triggers is edited.
+	"""
+
+	rows = []
+	for count in TRIGGER_COUNTS:
+		triggers = make_triggers(count)
+		old = TriggerSet(triggers)
+
+		edited = list(triggers)
+		pattern, search = edited[count // 2]
+		edited[count // 2] = (pattern + "!", search)
+
+		# Don't let the re module's own cache stand in for recompilation.
+		re.purge()
+		start = time.perf_counter()
+		TriggerSet(edited)
+		full = time.perf_counter() - start
+
+		re.purge()
+		start = time.perf_counter()
+		TriggerSet(edited, reuse=old)
+		incremental = time.perf_counter() - start
+
+		rows.append([count, format_secs(full), format_secs(incremental)])
+
+	print_table(
+		"Regex trigger reload after one edit",
+		["triggers", "full", "incremental"],
+		rows,
+	)
+
+
+def run():
+	"""
+	Run the regex trigger benchmarks.
+	"""
+
+	run_throughput()
+	run_reload()
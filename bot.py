@@ -21,6 +21,11 @@ class Bot:
 		
 		config.load_all_configs()
 		
+		MessageHandler.max_workers = config.configs["general"].get(
+			"handler-threads",
+			MessageHandler.max_workers,
+		)
+		
 		for plugin in config.configs["general"]["plugins"]:
 			__import__("plugins." + plugin)
 		
@@ -63,6 +68,8 @@ class Message:
 		self.sender_id = None
 		# Optionally, the permission group that the user belongs to.
 		self.sender_group = None
+		# Optionally, an id for the channel that this message was sent in.
+		self.channel_id = None
 		# The text of the message that the user sent, with any other data
 		# stripped.
 		self.text_content = None
@@ -0,0 +1,211 @@
+"""
+Module for caching the results of slow or repetitive functions.
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+
+class TTLCache:
+	"""
+	A cache of a loader function's results, which expire after a time to live.
+
+	Once a result expires, it is still served while it's stale (for up to
+	`stale` more seconds), while a single background call to the loader
+	refreshes it. Only once a result is too old to serve do callers wait for
+	the loader. At most one call to the loader is in flight for each key at a
+	time; any other callers wanting the same key wait for its result.
+
+	Attributes:
+		loader: the function whose results are cached. It's called with the
+			key as its only argument.
+		ttl: the number of seconds a result is fresh for.
+		stale: the number of seconds after expiry that a result may still be
+			served while it's refreshed.
+	"""
+
+	def __init__(self, loader, ttl, stale=0, clock=time.monotonic):
+		self.loader = loader
+		self.ttl = ttl
+		self.stale = stale
+		self._clock = clock
+
+		# Keys mapped to (result, time loaded) pairs.
+		self._results = {}
+		# Keys mapped to the in-flight load for them.
+		self._loads = {}
+		self._lock = threading.Lock()
+
+	def get(self, key=None):
+		"""
+		Return the cached result for a key, loading it if necessary.
+
+		Args:
+			key: the key to pass to the loader.
+
+		Returns: the loader's result for the key.
+		"""
+
+		with self._lock:
+			now = self._clock()
+			cached = self._results.get(key)
+			if cached is not None:
+				result, loaded = cached
+				age = now - loaded
+
+				if age < self.ttl:
+					return result
+
+				if age < self.ttl + self.stale:
+					if key not in self._loads:
+						self._start_load(key, background=True)
+
+					return result
+
+			load = self._loads.get(key)
+			if load is None:
+				load = self._start_load(key)
+				load_here = True
+
+			else:
+				load_here = False
+
+		if load_here:
+			self._run_load(key, load)
+
+		else:
+			load["done"].wait()
+
+		if "error" in load:
+			raise load["error"]
+
+		return load["result"]
+
+	def clear(self):
+		"""
+		Discard every cached result.
+		"""
+
+		with self._lock:
+			self._results.clear()
+
+	def _start_load(self, key, background=False):
+		"""
+		Register a new in-flight load for a key. Must hold the lock.
+
+		Args:
+			key: the key to load.
+			background: whether to run the load in a background thread.
+				Otherwise, the caller must run it with _run_load().
+		"""
+
+		load = self._loads[key] = {"done": threading.Event()}
+
+		if background:
+			threading.Thread(
+				target=self._run_load,
+				args=(key, load),
+				daemon=True,
+			).start()
+
+		return load
+
+	def _run_load(self, key, load):
+		"""
+		Call the loader for a key, and save and publish its result.
+		"""
+
+		try:
+			load["result"] = self.loader(key)
+
+		except Exception as ex:
+			load["error"] = ex
+			logging.warning(f"Failed to load {key!r} into cache: {ex!r}")
+
+		with self._lock:
+			if "error" not in load:
+				self._results[key] = (load["result"], self._clock())
+
+			del self._loads[key]
+
+		load["done"].set()
+
+
+class LRUCache:
+	"""
+	A bounded cache which discards its least recently used entries.
+
+	Attributes:
+		maxsize: the maximum number of entries to keep.
+		hits: the number of lookups which found an entry.
+		misses: the number of lookups which didn't.
+	"""
+
+	def __init__(self, maxsize=128):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key, default=None):
+		"""
+		Look up an entry, marking it as recently used.
+
+		Args:
+			key: the key of the entry.
+			default: the value to return if there's no such entry.
+		"""
+
+		with self._lock:
+			try:
+				self._entries.move_to_end(key)
+
+			except KeyError:
+				self.misses += 1
+				return default
+
+			self.hits += 1
+			return self._entries[key]
+
+	def put(self, key, value):
+		"""
+		Add or replace an entry, discarding the least recently used if full.
+
+		Args:
+			key: the key of the entry.
+			value: the value of the entry.
+		"""
+
+		with self._lock:
+			self._entries[key] = value
+			self._entries.move_to_end(key)
+
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+
+	def clear(self):
+		"""
+		Discard every entry. The hit and miss counts are kept.
+		"""
+
+		with self._lock:
+			self._entries.clear()
+
+	def info(self):
+		"""
+		Return a dict of the cache's hits, misses, size and maxsize.
+		"""
+
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"size": len(self._entries),
+			"maxsize": self.maxsize,
+		}
@@ -7,7 +7,7 @@ from os.path import join
 from shutil import copyfile
 import yaml
 
-from handlers import ConfigLoadHandler
+from handlers import ConfigLoadHandler, MessageHandler
 
 configs = {}
 
@@ -35,8 +35,24 @@ def load_config(conf):
 	with open(join("configs", (conf + ".yml"))) as file:
 		config = yaml.load(file.read(), Loader=yaml.FullLoader)
 	
+	apply_config(conf, config)
+
+
+def apply_config(conf, config):
+	"""
+	Fire the handlers for a loaded config, then store it.
+	
+	Args:
+		conf: the name of the config, without the extension.
+		config: the parsed contents of the config file.
+	"""
+	
 	ConfigLoadHandler.fire_handlers(conf, config)
 	configs[conf] = config
+	
+	# Message handler criteria may come from the config, so the handler index
+	#   is rebuilt, now that the new config is in place.
+	MessageHandler.reroute()
 
 
 def make_defaults():
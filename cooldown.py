@@ -1,11 +1,48 @@
 """
 Module for simple cooldown functions.
+
+Cooldowns are timed with time.monotonic(), so they're unaffected by changes
+to the system clock. Expired cooldowns are discarded lazily, so the number of
+stored cooldowns stays bounded by the number which are actually active.
 """
 
-import datetime
+import heapq
+import math
+import threading
+import time
 
+# Keys mapped to the time.monotonic() time at which their cooldown expires.
 _cooldowns = {}
 
+# Heap of (expiry time, key) pairs, for discarding expired cooldowns. Pairs
+# whose key has since been given a different expiry are stale, and skipped.
+_expiries = []
+
+_lock = threading.Lock()
+
+
+def _evict_expired(now):
+	"""
+	Discard cooldowns which have expired. Must hold the lock.
+	
+	Args:
+		now: the current time.monotonic() time.
+	"""
+	
+	while _expiries and _expiries[0][0] <= now:
+		expiry, key = heapq.heappop(_expiries)
+		if _cooldowns.get(key) == expiry:
+			del _cooldowns[key]
+			
+	# If most of the heap is stale, rebuild it from the live cooldowns.
+	if len(_expiries) > 2 * len(_cooldowns) + 16:
+		_expiries[:] = [
+			(expiry, key)
+			for key, expiry in _cooldowns.items()
+			if expiry != math.inf
+		]
+		heapq.heapify(_expiries)
+
 
 def has_cooled_down(key):
 	"""
@@ -18,27 +55,60 @@ def has_cooled_down(key):
 		key: key that may have been previously registered with set_cooldown.
 	"""
 	
-	return key not in _cooldowns or datetime.datetime.now() >= _cooldowns[key]
+	expiry = _cooldowns.get(key)
+	return expiry is None or time.monotonic() >= expiry
 
 
 def set_cooldown(key, seconds=0, forever=False):
 	"""
 	Set a cooldown on the given key for the given amount of time.
-
+	
 	Arguments:
 		key: key that can be checked later for expiration of cooldown.
 		seconds: amount of seconds to wait before the cooldown expires.
 		forever: true if the cooldown should never expire. False otherwise.
 	"""
 	
-	if forever:
-		_cooldowns[key] = datetime.datetime.max
+	now = time.monotonic()
+	
+	with _lock:
+		_evict_expired(now)
 		
-	else:
-		_cooldowns[key] = (
-			datetime.datetime.now()
-			+ datetime.timedelta(seconds=seconds)
-		)
+		if forever:
+			_cooldowns[key] = math.inf
+			
+		else:
+			expiry = _cooldowns[key] = now + seconds
+			heapq.heappush(_expiries, (expiry, key))
+
+
+def claim_cooldown(key, seconds=0):
+	"""
+	Set a cooldown on the given key, if it has cooled down.
+	
+	The check and the set are done together, so of several threads claiming
+	the same key at once, only one can succeed.
+	
+	Args:
+		key: key that can be checked later for expiration of cooldown.
+		seconds: amount of seconds to wait before the cooldown expires.
+	
+	Returns: True if the key had cooled down and now has the new cooldown, or
+		False if it was still cooling down, and is unchanged.
+	"""
+	
+	now = time.monotonic()
+	
+	with _lock:
+		expiry = _cooldowns.get(key)
+		if expiry is not None and now < expiry:
+			return False
+		
+		_evict_expired(now)
+		
+		expiry = _cooldowns[key] = now + seconds
+		heapq.heappush(_expiries, (expiry, key))
+		return True
 
 
 def remove_cooldown(key):
@@ -49,5 +119,39 @@ def remove_cooldown(key):
 		key: key to remove the cooldown of.
 	"""
 	
-	if key in _cooldowns:
-		del _cooldowns[key]
+	with _lock:
+		# Any heap entry for the key is left to go stale.
+		_cooldowns.pop(key, None)
+
+
+def clear():
+	"""
+	Remove every cooldown.
+	"""
+	
+	with _lock:
+		_cooldowns.clear()
+		_expiries.clear()
+
+
+def keys():
+	"""
+	Return a list of the keys which are currently on cooldown.
+	
+	The list is a snapshot, so it's safe to iterate over while cooldowns are
+	set and removed in other threads.
+	"""
+	
+	with _lock:
+		_evict_expired(time.monotonic())
+		return list(_cooldowns)
+
+
+def size():
+	"""
+	Return the number of keys which are currently on cooldown.
+	"""
+	
+	with _lock:
+		_evict_expired(time.monotonic())
+		return len(_cooldowns)
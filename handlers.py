@@ -2,6 +2,12 @@
 Classes for handler decorators.
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import stats
+
 
 class Handler:
 	"""
@@ -22,6 +28,12 @@ class Handler:
 	@ArgsHandler("argument", "another arg")
 	def baz():
 		bork
+	
+	A Handler subclass with dec_takes_args set to False may still be given
+	keyword-only options in its decorator, like:
+	@NoArgsHandler(option=True)
+	def qux():
+		quux
 	"""
 
 	dec_takes_args = False
@@ -38,7 +50,7 @@ class Handler:
 		# handler list, so creation of an actual object is not necessary when
 		# the decorator is applied directly, without arguments. Add the handler
 		# to the list and return it unchanged.
-		if not cls.dec_takes_args:
+		if not cls.dec_takes_args and args:
 			# Only possible first argument is the handler.
 			cls.add_handler(args[0], *args[1:], **kwargs)
 			return args[0]
@@ -51,7 +63,7 @@ class Handler:
 
 	def __init__(self, *args, **kwargs):
 		# Save the provided arguments, for when the decorater is __call__ed.
-		assert self.dec_takes_args
+		assert self.dec_takes_args or not args
 		self.initargs = args
 		self.initkwargs = kwargs
 
@@ -61,7 +73,7 @@ class Handler:
 		"""
 		
 		# Add the handler to the list and return it unchanged.
-		assert self.dec_takes_args
+		assert self.dec_takes_args or not self.initargs
 		self.add_handler(func, *self.initargs, **self.initkwargs)
 		return func
 		
@@ -80,7 +92,8 @@ class Handler:
 		"""
 
 		for handler in cls.handlers:
-			handler(*args, **kwargs)
+			with stats.timed(stats.handler_name(handler)):
+				handler(*args, **kwargs)
 
 
 class MessageHandler(Handler):
@@ -98,23 +111,305 @@ class MessageHandler(Handler):
 	particular event is finished, and no further handlers should be called. If
 	such a value is a string, the bot will use it to reply to the message which
 	incited the event.
+	
+	A handler may be a coroutine function, in which case it is awaited. A
+	regular function which may take a while to run (e.g. one doing network or
+	file I/O) should be decorated with @MessageHandler(blocking=True), so that
+	fire_handlers_async will run it in a worker thread instead of on the event
+	loop.
+	
+	A handler may also declare criteria that a message must match for the
+	handler to be fired at all, e.g. @MessageHandler(prefix="!"). Each
+	criterion is a single value, a collection of values, or a callable
+	returning either; callables are resolved lazily and again after every
+	config load. The criteria are:
+		prefix: the message text must start with one of the values.
+		sender: the sender's id (or name, if it has no id) must be one of the
+			values.
+		group: the sender's permission group must be one of the values.
 	"""
 
-	dec_takes_arg = False
+	dec_takes_args = False
 
 	handlers = []
+	
+	# Options for each handler, keyed by the handler.
+	handler_opts = {}
+	
+	# Names of the criteria that handlers may filter messages by, in the same
+	# order as the message attributes returned by _route_key().
+	CRITERIA = ("sender", "group", "prefix")
+	
+	# The maximum number of worker threads for running blocking handlers.
+	max_workers = 4
+	
+	_executor = None
+	
+	# Index of handlers by their criteria, built lazily by _get_routes().
+	_routes = None
+	
+	# The number of times the index has been discarded. An index which was
+	#   being built while it was discarded may be stale, so isn't kept.
+	_route_generation = 0
+	
+	# Held while discarding the index, and while keeping a new one.
+	_routes_lock = threading.Lock()
+
+	@classmethod
+	def add_handler(cls, handler, blocking=False, **criteria):
+		"""
+		Append the passed handler to the list.
+		
+		Args:
+			handler: the handler to add.
+			blocking: whether the handler should be run in a worker thread when
+				fired asynchronously.
+			**criteria: criteria that messages must match for the handler to be
+				fired. See the class docstring.
+		"""
+		
+		for criterion in criteria:
+			if criterion not in cls.CRITERIA:
+				raise TypeError(f"Unknown message criterion: '{criterion}'")
+		
+		cls.handlers.append(handler)
+		cls.handler_opts[handler] = {
+			"coroutine": asyncio.iscoroutinefunction(handler),
+			"blocking": blocking,
+			"criteria": {k: v for k, v in criteria.items() if v is not None},
+			"stat_name": stats.handler_name(handler),
+		}
+		cls.reroute()
+	
+	@classmethod
+	def executor(cls):
+		"""
+		Return the thread pool that blocking handlers are run in.
+		"""
+		
+		if cls._executor is None:
+			cls._executor = ThreadPoolExecutor(max_workers=cls.max_workers)
+		
+		return cls._executor
+	
+	@classmethod
+	def reroute(cls):
+		"""
+		Discard the handler index, so it will be rebuilt before the next event.
+		"""
+		
+		with cls._routes_lock:
+			cls._route_generation += 1
+			cls._routes = None
+	
+	@staticmethod
+	def _resolve_criterion(value):
+		"""
+		Resolve a handler criterion into a tuple of acceptable values.
+		"""
+		
+		if callable(value):
+			value = value()
+		
+		if isinstance(value, (list, tuple, set, frozenset)):
+			return tuple(value)
+		
+		return (value,)
+	
+	@staticmethod
+	def _route_key(msg):
+		"""
+		Return the attributes of a message which handler criteria look at.
+		"""
+		
+		return (
+			getattr(msg, "sender_id", None) or getattr(msg, "sender_name", None),
+			getattr(msg, "sender_group", None),
+			getattr(msg, "text_content", None),
+		)
+	
+	@classmethod
+	def _get_routes(cls):
+		"""
+		Return the index of handlers by their criteria, building it if needed.
+		
+		Each handler is indexed under only one of its criteria; the rest are
+		checked when a message is routed.
+		"""
+		
+		routes = cls._routes
+		# The handler list may also have been changed without add_handler.
+		if routes is not None and routes["count"] == len(cls.handlers):
+			return routes
+		
+		generation = cls._route_generation
+		routes = {
+			"count": len(cls.handlers),
+			"filtered": False,
+			# Positions of handlers with no criteria.
+			"unfiltered": [],
+			# Criterion values mapped to positions of the handlers which are
+			# indexed by them. Prefixes are keyed by their first character.
+			"sender": {},
+			"group": {},
+			"prefix": {},
+			# Positions mapped to (criterion, values) pairs left to check.
+			"checks": {},
+		}
+		
+		for pos, handler in enumerate(cls.handlers):
+			criteria = {
+				criterion: cls._resolve_criterion(value)
+				for criterion, value in
+				cls.handler_opts[handler]["criteria"].items()
+			}
+			
+			# An empty prefix matches everything, so it filters nothing.
+			if "" in criteria.get("prefix", ()):
+				del criteria["prefix"]
+			
+			indexed_by = next((c for c in cls.CRITERIA if c in criteria), None)
+			if indexed_by is None:
+				routes["unfiltered"].append(pos)
+				continue
+			
+			routes["filtered"] = True
+			for value in criteria.pop(indexed_by):
+				key = value[0] if indexed_by == "prefix" else value
+				routes[indexed_by].setdefault(key, []).append((value, pos))
+			
+			if criteria:
+				routes["checks"][pos] = list(criteria.items())
+		
+		with cls._routes_lock:
+			# Criteria resolved while a config was being reloaded may be stale,
+			#   so the index is only used for this event.
+			if cls._route_generation == generation:
+				cls._routes = routes
+		
+		return routes
+	
+	@classmethod
+	def _candidates(cls, routes, msg):
+		"""
+		Return the sorted positions of the handlers whose criteria msg matches.
+		"""
+		
+		attrs = cls._route_key(msg)
+		sender, group, text = attrs
+		
+		found = set(routes["unfiltered"])
+		found.update(pos for _, pos in routes["sender"].get(sender, ()))
+		found.update(pos for _, pos in routes["group"].get(group, ()))
+		if text:
+			found.update(
+				pos
+				for prefix, pos in routes["prefix"].get(text[0], ())
+				if text.startswith(prefix)
+			)
+		
+		for pos, checks in routes["checks"].items():
+			if pos not in found:
+				continue
+			
+			for criterion, values in checks:
+				attr = attrs[cls.CRITERIA.index(criterion)]
+				if criterion == "prefix":
+					matches = bool(attr) and attr.startswith(values)
+				else:
+					matches = attr in values
+
+				if not matches:
+					found.discard(pos)
+					break
+		
+		return sorted(found)
+	
+	@classmethod
+	def _routed_handlers(cls, msg):
+		"""
+		Yield, in order, the handlers which should be fired for a message.
+		"""
+		
+		routes = cls._get_routes()
+		if not routes["filtered"]:
+			yield from cls.handlers
+			return
+		
+		key = cls._route_key(msg)
+		positions = cls._candidates(routes, msg)
+		i = 0
+		
+		while i < len(positions):
+			pos = positions[i]
+			yield cls.handlers[pos]
+			
+			# Earlier handlers may rewrite the message (e.g. the Minecraft
+			# bridge), so reroute the rest of the chain if that happens.
+			new_key = cls._route_key(msg)
+			if new_key != key:
+				key = new_key
+				positions = [p for p in cls._candidates(routes, msg) if p > pos]
+				i = 0
+			
+			else:
+				i += 1
 
 	@classmethod
 	def fire_handlers(cls, msg):
 		"""
 		Fire message handlers.
 		
+		Coroutine handlers are run to completion on a private event loop, so
+		this must not be called from within a running event loop.
+		
 		Args:
 			msg: the message which provoked the event.
 		"""
 
-		for handler in cls.handlers:
-			resp = handler(msg)
+		for handler in cls._routed_handlers(msg):
+			opts = cls.handler_opts[handler]
+			with stats.timed(opts["stat_name"]):
+				if opts["coroutine"]:
+					loop = asyncio.new_event_loop()
+					try:
+						resp = loop.run_until_complete(handler(msg))
+					finally:
+						loop.close()
+				
+				else:
+					resp = handler(msg)
+			
+			if resp is not None:
+				return resp
+	
+	@classmethod
+	async def fire_handlers_async(cls, msg):
+		"""
+		Fire message handlers without blocking the running event loop.
+		
+		Args:
+			msg: the message which provoked the event.
+		"""
+		
+		loop = asyncio.get_running_loop()
+		
+		for handler in cls._routed_handlers(msg):
+			opts = cls.handler_opts[handler]
+			with stats.timed(opts["stat_name"]):
+				if opts["coroutine"]:
+					resp = await handler(msg)
+				
+				elif opts["blocking"]:
+					resp = await loop.run_in_executor(
+						cls.executor(),
+						handler,
+						msg,
+					)
+				
+				else:
+					resp = handler(msg)
+			
 			if resp is not None:
 				return resp
 		
@@ -125,7 +420,8 @@ class ConfigLoadHandler(Handler):
 	
 	The decorator should be passed a single argument:
 		conf_name: the name of the configuration file (without '.yml') that the
-			handler should be alerted to.
+			handler should be alerted to, or ConfigLoadHandler.ANY_CONF to be
+			alerted to every configuration file.
 	
 	Each handler should accept a single argument:
 		new_conf: the yaml-parsed contents of the newly updated config file.
@@ -134,6 +430,9 @@ class ConfigLoadHandler(Handler):
 	dec_takes_args = True
 
 	handlers = {}
+	
+	# Name to register a handler under in order to fire for every config.
+	ANY_CONF = "*"
 
 	@classmethod
 	def add_handler(cls, handler, conf_name):
@@ -161,5 +460,7 @@ class ConfigLoadHandler(Handler):
 			new_conf: the parsed contents of the new config file.
 		"""
 
-		for handler in cls.handlers.get(conf_name, []):
-			handler(new_conf)
+		handlers = cls.handlers.get(conf_name, [])
+		for handler in handlers + cls.handlers.get(cls.ANY_CONF, []):
+			with stats.timed(stats.handler_name(handler)):
+				handler(new_conf)
@@ -9,15 +9,48 @@ import discord
 import config
 from bot import Bot, Message
 from exceptions import BotShutdownException, BotRestartException
+from handlers import ConfigLoadHandler, MessageHandler
+from imps.role_groups import RoleGroups
+from imps.send_queue import SendQueue
 
 
 client = discord.Client()
 
+# Replies are sent through a queue, to stay within Discord's rate limits.
+send_queue = SendQueue()
+
+# The permission groups given by users' roles.
+role_groups = RoleGroups()
+
 
 def _get_default_channel():
 	return client.get_channel(config.configs["discord"]["default-channel"])
 
 
+@ConfigLoadHandler("discord")
+def configure_send_queue(new_conf):
+	"""
+	Apply the configured outbound rate limit to the send queue.
+	"""
+	
+	send_rate = new_conf.get("send-rate", {})
+	send_queue.configure(
+		send_rate.get("messages", send_queue.capacity),
+		send_rate.get("per", send_queue.per),
+	)
+
+
+@ConfigLoadHandler("discord")
+def index_perm_roles(new_conf):
+	"""
+	Index the configured permission groups by role id.
+	
+	Groups listed earlier in perm-roles take priority over later ones.
+	"""
+	
+	role_groups.load(new_conf.get("perm-roles"))
+
+
 class DiscordBot(Bot):
 	"""
 	A bot implementation for Discord servers.
@@ -57,26 +90,30 @@ class DiscordMessage(Message):
 		self.text_content = msg.content
 		self.sender_name = msg.author.display_name
 		self.sender_id = msg.author.id
+		self.channel_id = msg.channel.id
 		
 		roles = getattr(self.raw_msg.author, "roles", [])
 		
-		for role in roles:
-			perm_role_items = config.configs["discord"]["perm-roles"].items()
-			for group, ranks in perm_role_items:
-				ranks = [int(r) for r in ranks]
-				if role.id in ranks:
-					self.sender_group = group
-					break
+		# Use the highest priority group that any of the user's roles give.
+		group = role_groups.group_for(role.id for role in roles)
+		if group is not None:
+			self.sender_group = group
+	
+	async def handle(self):
+		"""
+		Parse and reply to the message without blocking the event loop.
+		"""
 		
-		self._parse()
+		self.reply_msg = await MessageHandler.fire_handlers_async(self)
+		await self.reply()
 	
 	async def reply(self):
 		"""
-		Reply to a received message.
+		Queue a reply to a received message.
 		"""
 		
 		if self.reply_msg:
-			await self.raw_msg.channel.send(self.reply_msg)
+			send_queue.put(self.raw_msg.channel, self.reply_msg)
 
 
 bot = DiscordBot
@@ -104,8 +141,7 @@ async def on_message(msg):
 		msg: the received message.
 	"""
 	
-	msg = DiscordMessage(msg)
-	await msg.reply()
+	await DiscordMessage(msg).handle()
 
 
 @client.event
@@ -128,6 +164,9 @@ async def on_error(*args, **kwargs):
 	)
 	
 	if error_requires_graceful_stop:
+		# Let any queued replies go out first.
+		await send_queue.join()
+		
 		# Send a parting message when the bot shuts down.
 		if config.configs["discord"].get("shutdown-msg"):
 			await _get_default_channel().send(
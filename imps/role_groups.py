@@ -0,0 +1,57 @@
+"""
+Permission groups given by chat service roles, such as Discord's.
+"""
+
+
+class RoleGroups:
+	"""
+	An index of role ids to the permission groups they give.
+
+	Groups listed earlier in the config take priority over later ones, so a
+	user with roles for several groups gets the earliest listed of them.
+	"""
+
+	def __init__(self):
+		# Role ids mapped to (priority, permission group) pairs, where the
+		#   group with the lowest priority number wins.
+		self._groups = {}
+
+	def __len__(self):
+		return len(self._groups)
+
+	def load(self, perm_roles):
+		"""
+		Index the groups of a perm-roles config section.
+
+		If a role is listed under several groups, it gives the earliest.
+
+		Args:
+			perm_roles: a dict of permission groups mapped to lists of role
+				ids, in priority order. May be None.
+		"""
+
+		groups = {}
+		for priority, (group, roles) in enumerate((perm_roles or {}).items()):
+			for role in roles or []:
+				groups.setdefault(int(role), (priority, group))
+
+		# Replaced whole, so that messages being handled meanwhile see either
+		#   the old index or the new one.
+		self._groups = groups
+
+	def group_for(self, role_ids):
+		"""
+		Return the highest priority group that any of some roles give.
+
+		Args:
+			role_ids: an iterable of a user's role ids.
+
+		Returns: the name of the group, or None if none of the roles give one.
+		"""
+
+		groups = self._groups
+		matched = groups.keys() & set(role_ids)
+		if not matched:
+			return None
+
+		return min(groups[role] for role in matched)[1]
@@ -0,0 +1,148 @@
+"""
+An outbound message queue for chat services with per-channel rate limits.
+"""
+
+import asyncio
+from collections import deque
+import logging
+
+from ratelimit import TokenBucket
+
+
+class SendQueue:
+	"""
+	A queue of outbound messages, sent to each channel by a background task.
+
+	Each channel's sends are limited by its own token bucket. While a channel
+	is waiting on its rate limit, any messages queued up for it are merged
+	into as few sends as possible, each no longer than the maximum length.
+
+	Attributes:
+		capacity: the number of sends a channel may burst up to.
+		per: the number of seconds a channel takes to regain its full capacity.
+		max_length: the maximum number of characters in a single send.
+	"""
+
+	# Separator between queued messages that get merged into one send.
+	MERGE_SEP = "\n"
+
+	def __init__(self, capacity=5, per=5.0, max_length=2000):
+		self.capacity = capacity
+		self.per = per
+		self.max_length = max_length
+
+		# Channel keys mapped to a deque of pending message strings.
+		self._pending = {}
+		# Channel keys mapped to token buckets.
+		self._buckets = {}
+		# Channel keys mapped to the running sender tasks.
+		self._tasks = {}
+
+	@staticmethod
+	def _key(channel):
+		return getattr(channel, "id", channel)
+
+	def configure(self, capacity, per):
+		"""
+		Change the rate limit applied to future sends.
+
+		Args:
+			capacity: the number of sends a channel may burst up to.
+			per: the number of seconds a channel takes to regain its full
+				capacity.
+		"""
+
+		self.capacity = capacity
+		self.per = per
+		self._buckets.clear()
+
+	def put(self, channel, text):
+		"""
+		Queue a message to be sent to a channel.
+
+		Must be called from within the running event loop.
+
+		Args:
+			channel: the channel to send to; anything with an async send().
+			text: the message to send.
+		"""
+
+		key = self._key(channel)
+		self._pending.setdefault(key, deque()).append(text)
+
+		if key not in self._tasks:
+			self._tasks[key] = asyncio.ensure_future(self._sender(channel))
+
+	async def join(self):
+		"""
+		Wait until every queued message has been sent.
+		"""
+
+		while self._tasks:
+			await asyncio.wait(list(self._tasks.values()))
+
+	def _next_batch(self, pending):
+		"""
+		Pop as many pending messages as fit in one send, and merge them.
+
+		A single message too long for one send is split, and the remainder
+		left at the front of the queue.
+		"""
+
+		first = pending.popleft()
+		if len(first) > self.max_length:
+			pending.appendleft(first[self.max_length:])
+			return first[:self.max_length]
+
+		batch = [first]
+		length = len(first)
+		while pending:
+			length += len(self.MERGE_SEP) + len(pending[0])
+			if length > self.max_length:
+				break
+
+			batch.append(pending.popleft())
+
+		return self.MERGE_SEP.join(batch)
+
+	async def _sender(self, channel):
+		"""
+		Send a channel's queued messages, until there are none left.
+		"""
+
+		key = self._key(channel)
+		pending = self._pending[key]
+
+		try:
+			while pending:
+				bucket = self._buckets.get(key)
+				if bucket is None:
+					bucket = self._buckets[key] = TokenBucket(
+						self.capacity,
+						self.capacity / self.per,
+					)
+
+				# Wait for the rate limit first, so that anything queued in
+				# the meantime gets merged into this send.
+				delay = bucket.delay()
+				if delay:
+					await asyncio.sleep(delay)
+
+				bucket.consume()
+				text = self._next_batch(pending)
+
+				try:
+					await channel.send(text)
+
+				except Exception:
+					logging.exception(f"Failed to send message to {key}.")
+
+		finally:
+			del self._tasks[key]
+			if not pending:
+				del self._pending[key]
+
+			# Drop the bucket once it's full again; a fresh one is the same.
+			bucket = self._buckets.get(key)
+			if bucket is not None and not bucket.delay(self.capacity):
+				del self._buckets[key]
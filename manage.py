@@ -11,6 +11,7 @@ import subprocess
 import sys
 import unittest
 
+import benchmarks
 import config
 from exceptions import BotRestartException, BotShutdownException
 
@@ -27,6 +28,7 @@ arg_names = {
 	"kill": "kill",
 	"configs": "make-configs",
 	"runtests": "test",
+	"bench": "bench",
 }
 
 if __name__ == "__main__":
@@ -122,6 +124,10 @@ if __name__ == "__main__":
 				unittest.TextTestRunner(stream=sys.stdout)
 				.run(unittest.defaultTestLoader.discover("tests"))
 			)
+		
+		# Run benchmark suites; all of them, unless some are named.
+		elif command == arg_names["bench"]:
+			benchmarks.run(sys.argv[2:])
 			
 		else:
 			print("Unknown command", usage, sep="\n")
@@ -2,8 +2,11 @@
 Module for permission handling.
 """
 
-from copy import deepcopy
+import sys
+import threading
+from types import MappingProxyType
 
+from caching import LRUCache
 from handlers import ConfigLoadHandler
 
 
@@ -21,8 +24,27 @@ class PermNode:
 			tvalue as this node.
 		children: child nodes of this permission node.
 		group_lvl: the priority of the permission group that this node
-			originally came from.
+			originally came from, relative to the sum of the lvl_offsets of
+			this node and its ancestors.
+		lvl_offset: an amount added to the group_lvl of this node and all of
+			its descendants. This lets a subtree be shared between tries at
+			different group levels, without copying it.
 	"""
+	
+	# Tries can have very many nodes, so they're kept small.
+	__slots__ = (
+		"name",
+		"root",
+		"tvalue",
+		"wildcard",
+		"children",
+		"group_lvl",
+		"lvl_offset",
+	)
+	
+	# The children of every childless node. Nodes only get their own children
+	#   dict once a child is added to them.
+	NO_CHILDREN = MappingProxyType({})
 
 	# The marker for the wildcard node, which gives/negates all descendants if
 	# they are not otherwise specified.
@@ -42,14 +64,17 @@ class PermNode:
 		wildcard=None,
 		children=None,
 		group_lvl=0,
+		lvl_offset=0,
 	):
 		
-		self.name = name
+		# The same names appear in many tries, so share a single copy of each.
+		self.name = sys.intern(name)
 		self.root = root
 		self.tvalue = tvalue
 		self.wildcard = wildcard
-		self.children = children or {}
+		self.children = children or self.NO_CHILDREN
 		self.group_lvl = group_lvl
+		self.lvl_offset = lvl_offset
 	
 	@property
 	def child_vals(self):
@@ -99,20 +124,43 @@ class PermNode:
 	def __eq__(self, other):
 		"""
 		Compare the equality of all PermNode attributes.
+		
+		Group levels are compared by their effective values, so tries which
+		only differ in how their levels are split between group_lvl and
+		lvl_offset are equal.
+		"""
+		
+		if not isinstance(other, PermNode):
+			return NotImplemented
+		
+		return self._equals(other, 0, 0)
+	
+	def _equals(self, other, offset, other_offset):
+		"""
+		Compare two subtrees, given the offsets of their parents.
 		"""
 		
+		offset += self.lvl_offset
+		other_offset += other.lvl_offset
+		
 		eq_attrs = [
 			"name",
 			"root",
 			"tvalue",
 			"wildcard",
-			"group_lvl",
-			"children",
 		]
 		
-		return all(
-			getattr(self, attr) == getattr(other, attr)
-			for attr in eq_attrs
+		return (
+			all(
+				getattr(self, attr) == getattr(other, attr)
+				for attr in eq_attrs
+			)
+			and offset + self.group_lvl == other_offset + other.group_lvl
+			and self.children.keys() == other.children.keys()
+			and all(
+				child._equals(other.children[name], offset, other_offset)
+				for name, child in self.children.items()
+			)
 		)
 	
 	@classmethod
@@ -130,13 +178,17 @@ class PermNode:
 		
 		return self.tvalue is not None
 	
-	def add_perm(self, perm, group_lvl=0):
+	def add_perm(self, perm, group_lvl=0, owned=None):
 		"""
 		Add a single permission to this trie. This node must be the root.
 		
 		Args:
 			perm: the permission string to add to the trie.
 			group_lvl: the group level of perm.
+			owned: a set of the ids of the nodes which only this trie has, if
+				it shares the rest with other tries. Shared nodes along the
+				perm's path are then copied before they're changed, and the
+				copies added to the set. Optional.
 		"""
 
 		if not self.root:
@@ -148,9 +200,11 @@ class PermNode:
 		if not tvalue:
 			perm = perm[len(self.NEG_PREFIX):]
 
-		# Walk the trie until the perm is out of nodes.
+		# Walk the trie until the perm is out of nodes, keeping track of the
+		#   level offset of the current node.
 		cur = self
-		for name in perm.split(self.PERM_SEP):
+		offset = self.lvl_offset
+		for name in map(sys.intern, perm.split(self.PERM_SEP)):
 			# This node is a wildcard; the previous node should be set
 			# accordingly.
 			if name == self.WILDCARD_NAME:
@@ -162,28 +216,85 @@ class PermNode:
 			# If the current perm node isn't in the trie node's children, add
 			# it.
 			if name not in cur.children.keys():
-				cur.children[name] = PermNode(name=name, group_lvl=group_lvl)
+				if cur.children is self.NO_CHILDREN:
+					cur.children = {}
+				
+				child = cur.children[name] = PermNode(
+					name=name,
+					group_lvl=group_lvl - offset,
+				)
+				if owned is not None:
+					owned.add(id(child))
 				
 			# Otherwise, change the group_lvl to the lower of the two.
 			else:
-				cur.children[name].group_lvl = min(
-					cur.children[name].group_lvl,
-					group_lvl,
+				child = cur.children[name]
+				if owned is not None and id(child) not in owned:
+					child = cur.children[name] = child.copy()
+					owned.add(id(child))
+				
+				child.group_lvl = min(
+					child.group_lvl,
+					group_lvl - offset - child.lvl_offset,
 				)
 		
 			cur = cur.children[name]
+			offset += cur.lvl_offset
 
 		cur.tvalue = tvalue
 
-	def merge(self, other):
+	def copy(self):
+		"""
+		Make a copy of this node, which shares its children with it.
+		
+		The copy has its own children dict, so children can be added to it
+		or replaced without affecting this node.
+		"""
+		
+		return PermNode(
+			name=self.name,
+			root=self.root,
+			tvalue=self.tvalue,
+			wildcard=self.wildcard,
+			children=dict(self.children),
+			group_lvl=self.group_lvl,
+			lvl_offset=self.lvl_offset,
+		)
+	
+	def merge(self, other, lvl_offset=0):
 		"""
 		Recursively merge another permission trie with self.
 		
 		Where both tries have a terminal node in the same place, take the
 		values of the one with the higher group priority.
 		
+		Subtrees which only other has are shared with it rather than copied,
+		and other is never modified, so it can be merged into any number of
+		tries.
+		
 		Args:
 			other: the trie to merge with self.
+			lvl_offset: an amount to add to the group_lvl of every node of
+				other, e.g. 1 to merge in an inherited group's trie.
+		"""
+		
+		merged = self._union(other, lvl_offset)
+		
+		self.tvalue = merged.tvalue
+		self.wildcard = merged.wildcard
+		self.children = merged.children
+	
+	def _union(self, other, diff):
+		"""
+		Make a new node merging self and other, sharing their subtrees.
+		
+		Neither node is modified. The new node takes self's place, at the
+		same level offset.
+		
+		Args:
+			other: the node to merge with self.
+			diff: the level offset of other's parent, less that of self's
+				parent.
 		"""
 		
 		# Use other's tvalue if self isn't terminal or other has a higher
@@ -192,23 +303,44 @@ class PermNode:
 			not self.is_terminal()
 			or (
 				other.is_terminal()
-				and self.group_lvl > other.group_lvl
+				and self.lvl_offset + self.group_lvl
+				> diff + other.lvl_offset + other.group_lvl
 			)
 		)
-		if use_other_tvalue:
-			self.tvalue = other.tvalue
 		
-		self.wildcard = self.wildcard or other.wildcard
-
+		children = dict(self.children) if other.children else self.children
+		child_diff = diff + other.lvl_offset - self.lvl_offset
+		
 		# Merge the children together.
-		for name in other.children:
+		for name, child in other.children.items():
 			# If there's already an equivalent node in self, merge the two.
-			if name in self.children:
-				self.children[name].merge(other.children[name])
+			if name in children:
+				children[name] = children[name]._union(child, child_diff)
+			
+			# Otherwise, just adopt it, through a node adjusting its level
+			#   offset if necessary.
+			elif child_diff:
+				children[name] = PermNode(
+					name=child.name,
+					tvalue=child.tvalue,
+					wildcard=child.wildcard,
+					children=child.children,
+					group_lvl=child.group_lvl,
+					lvl_offset=child_diff + child.lvl_offset,
+				)
 			
-			# Otherwise, just adopt it.
 			else:
-				self.children[name] = other.children[name]
+				children[name] = child
+		
+		return PermNode(
+			name=self.name,
+			root=self.root,
+			tvalue=other.tvalue if use_other_tvalue else self.tvalue,
+			wildcard=self.wildcard or other.wildcard,
+			children=children,
+			group_lvl=self.group_lvl,
+			lvl_offset=self.lvl_offset,
+		)
 	
 	def has_perm(self, perm):
 		"""
@@ -231,16 +363,21 @@ class PermNode:
 		max_pri = (float("-inf"), float("-inf"), False)
 		cur = self
 		level = 0
+		offset = self.lvl_offset
 
 		for name in perm.split(self.PERM_SEP):
 			# Set a new max_pri if the current node is a wildcard.
 			if cur.wildcard:
-				max_pri = max(max_pri, (-cur.group_lvl, level, cur.tvalue))
+				max_pri = max(
+					max_pri,
+					(-(offset + cur.group_lvl), level, cur.tvalue),
+				)
 			
 			# If we can continue the search, do so.
 			if name in cur.children:
 				level += 1
 				cur = cur.children[name]
+				offset += cur.lvl_offset
 			
 			# If we've reached the end of the trie without exhausting the perm,
 			#   default to either the last wildcard, or the default value.
@@ -250,132 +387,530 @@ class PermNode:
 		# If the loop didn't break, then the perm was exhausted.
 		else:
 			if cur.is_terminal():
-				max_pri = max(max_pri, (-cur.group_lvl, level, cur.tvalue))
+				max_pri = max(
+					max_pri,
+					(-(offset + cur.group_lvl), level, cur.tvalue),
+				)
 
 		return max_pri[2]
 	
+	def has_perms(self, perms):
+		"""
+		Test whether self includes each of many permissions.
+		
+		The perms are walked in sorted order, so that the trie nodes of a
+		prefix shared by several perms are only visited once.
+		
+		Args:
+			perms: an iterable of perms to test against this perm trie.
+		
+		Returns: a dict of each perm mapped to True if self includes it, or
+			False otherwise. The same as has_perm() would give for each.
+		"""
+		
+		if not self.root:
+			raise Exception(
+				"Cannot verify a perm against a non-root trie node."
+			)
+		
+		decisions = {}
+		walk = sorted(
+			(tuple(perm.split(self.PERM_SEP)), perm)
+			for perm in set(perms)
+		)
+		
+		# The path of the previous perm, and (node, level offset, max_pri
+		#   excluding the node's wildcard) for each node along it from the
+		#   root, as far as it's in the trie.
+		prev = ()
+		no_pri = (float("-inf"), float("-inf"), False)
+		stack = [(self, self.lvl_offset, no_pri)]
+		
+		for names, perm in walk:
+			# Go back to the deepest node shared with the previous perm.
+			shared = 0
+			for name, prev_name in zip(names, prev):
+				if name != prev_name:
+					break
+				shared += 1
+			del stack[shared + 1:]
+			prev = names
+			
+			cur, offset, max_pri = stack[-1]
+			level = len(stack) - 1
+			
+			for name in names[level:]:
+				# Set a new max_pri if the current node is a wildcard.
+				if cur.wildcard:
+					max_pri = max(
+						max_pri,
+						(-(offset + cur.group_lvl), level, cur.tvalue),
+					)
+				
+				# If we can continue the search, do so.
+				if name in cur.children:
+					level += 1
+					cur = cur.children[name]
+					offset += cur.lvl_offset
+					stack.append((cur, offset, max_pri))
+				
+				# If we've reached the end of the trie without exhausting the
+				#   perm, default to either the last wildcard, or the default.
+				else:
+					break
+			
+			# If the loop didn't break, then the perm was exhausted.
+			else:
+				if cur.is_terminal():
+					max_pri = max(
+						max_pri,
+						(-(offset + cur.group_lvl), level, cur.tvalue),
+					)
+			
+			decisions[perm] = max_pri[2]
+		
+		return decisions
+	
+	def compile(self):
+		"""
+		Flatten this trie into a CompiledPerms. This node must be the root.
+		"""
+		
+		if not self.root:
+			raise Exception("Cannot compile a non-root trie node.")
+		
+		return CompiledPerms(self)
+	
 	def increment_group_lvl(self):
 		"""
 		Increment the group_lvl of every node in the trie.
 		"""
 
-		self.group_lvl += 1
+		self.lvl_offset += 1
 
-		for node in self.children.values():
-			node.increment_group_lvl()
+
+class CompiledPerms:
+	"""
+	A flattened, read-only form of a permission trie.
+	
+	Checking a perm against it gives exactly the same result as
+	PermNode.has_perm() on the trie it was compiled from, but costs one dict
+	lookup for the perm, plus one for each of its prefixes tried when the perm
+	isn't itself in the trie.
+	
+	Attributes:
+		exact: perm strings of the trie's terminal nodes, mapped to the
+			decision for exactly that perm.
+		wild: perm strings of the trie's nodes whose wildcards change the
+			decision for perms under them, mapped to that decision.
+		root_wild: the decision for perms with no prefix in wild.
+	"""
+	
+	def __init__(self, trie):
+		"""
+		Compile a permission trie.
+		
+		Args:
+			trie: the root PermNode of the trie to compile.
+		"""
+		
+		self.exact = {}
+		self.wild = {}
+		
+		# The priority tuples are the same as those of PermNode.has_perm().
+		root_pri = (float("-inf"), float("-inf"), False)
+		if trie.wildcard:
+			root_pri = max(
+				root_pri,
+				(-(trie.lvl_offset + trie.group_lvl), 0, trie.tvalue),
+			)
+		self.root_wild = root_pri[2]
+		
+		# Walk the trie, carrying the level offset of each node's parent, and
+		#   the best wildcard priority of its ancestors.
+		stack = [
+			(child, child.name, 1, trie.lvl_offset, root_pri)
+			for child in trie.child_vals
+		]
+		while stack:
+			node, path, level, offset, parent_pri = stack.pop()
+			offset += node.lvl_offset
+			node_lvl = offset + node.group_lvl
+			
+			# A perm ending at this node doesn't consider its wildcard.
+			if node.is_terminal():
+				self.exact[path] = max(
+					parent_pri,
+					(-node_lvl, level, node.tvalue),
+				)[2]
+			
+			pri = parent_pri
+			if node.wildcard:
+				pri = max(pri, (-node_lvl, level, node.tvalue))
+				if pri != parent_pri:
+					self.wild[path] = pri[2]
+			
+			for child in node.child_vals:
+				stack.append((
+					child,
+					path + PermNode.PERM_SEP + child.name,
+					level + 1,
+					offset,
+					pri,
+				))
+	
+	def has_perm(self, perm):
+		"""
+		Test whether the compiled trie includes the given permission.
+		
+		Args:
+			perm: the perm to test.
+		
+		Returns: True if the trie includes perm, False otherwise.
+		"""
+		
+		try:
+			return self.exact[perm]
+		except KeyError:
+			pass
+		
+		# Find the decision of the perm's longest prefix with a wildcard.
+		while True:
+			end = perm.rfind(PermNode.PERM_SEP)
+			if end < 0:
+				return self.root_wild
+			
+			perm = perm[:end]
+			if perm in self.wild:
+				return self.wild[perm]
 
 
 perm_groups = {}
 
+# Group names mapped to the compiled forms of their perm tries. A group's trie
+#   is only compiled once a perm is checked against it, since compiling every
+#   group costs the combined size of all of their tries.
+compiled_groups = {}
 
-@ConfigLoadHandler("permissions")
-def validate_perm_groups(conf):
+# Held while swapping in new tries, and while adding a compiled trie, so that
+#   a trie compiled from a group's old trie isn't added after a reload.
+_tries_lock = threading.Lock()
+
+# The number of times the permissions config has been loaded, in a list so it
+#   can be changed in place. Cached decisions and views are keyed by the
+#   generation they were made in, so that a check which was running while the
+#   config was reloaded can't cache a decision made with the old tries.
+cache_generation = [0]
+
+# (generation, group, perm) triples mapped to whether the group has the perm.
+#   Decisions only change when the permissions config is reloaded.
+decision_cache = LRUCache(maxsize=4096)
+
+# Group names mapped to the definitions their current perm tries were made
+#   from, to find which groups have changed on a reload.
+group_definitions = {}
+
+# User ids mapped to the perm tries of their individual perm overrides.
+user_tries = {}
+
+# (generation, user, group) triples mapped to the compiled form of the user's
+#   overrides layered over the group's trie. Only users with overrides have
+#   entries.
+user_views = LRUCache(maxsize=256)
+
+
+def order_perm_groups(groups):
 	"""
-	Validate the loaded config.
+	Sort permission groups so that every group comes after those it inherits.
+	
+	Every group which inherits from a nonexistent group, and every
+	inheritance loop, is reported in a single exception.
 	
 	Args:
-		conf: the config to validate.
+		groups: the "groups" section of a permissions config.
+	
+	Returns: a list of the group names in dependency order.
 	"""
 	
-	groups = conf["groups"]
+	problems = []
 	
-	# If the default group isn't defined, make it.
-	if "default" not in groups:
-		groups["default"] = {}
-	
-	# Make sure no group inherits from a nonexistent group.
-	for group in groups:
-		for inh in groups[group].get("inherit", []):
+	# The number of existing groups each group inherits from, and the groups
+	#   which inherit from each group.
+	waiting = {}
+	heirs = {group: [] for group in groups}
+	for group, group_conf in groups.items():
+		waiting[group] = 0
+		for inh in group_conf.get("inherit", []):
 			if inh not in groups:
-				raise Exception(
+				problems.append(
 					f"Permission group '{group}' inherits from nonexistent "
 					+ f"group '{inh}'."
 				)
+				continue
+			
+			waiting[group] += 1
+			heirs[inh].append(group)
+	
+	# Take groups once every group they inherit from has been taken.
+	order = [group for group, count in waiting.items() if not count]
+	for group in order:
+		for heir in heirs[group]:
+			waiting[heir] -= 1
+			if not waiting[heir]:
+				order.append(heir)
+	
+	# Any groups left over are in, or inherit from, inheritance loops.
+	if len(order) < len(groups):
+		for loop in find_loops(groups, set(groups) - set(order)):
+			names = ", ".join(f"'{group}'" for group in loop)
+			problems.append(
+				f"Permission inheritance loop including groups {names}."
+			)
 	
-	# Ensure there are no cycles in the inheritance graph.
+	if problems:
+		raise Exception("\n".join(problems))
 	
-	# Keep a record, so we don't go over nodes we've already checked.
-	cleared = set()
+	return order
+
+
+def find_loops(groups, remaining):
+	"""
+	Find every inheritance loop among some permission groups.
 	
-	def cycle_search(node, past):
-		"""
-		Search for a cycle in the inheritance graph.
-		
-		An exception is raised if one is found.
-		
-		Args:
-			node: the current node.
-			past: a set of all nodes that have been encountered in the past.
-		"""
-		
-		if node in past:
-			# We've encountered this node before; we found a cycle.
-			raise Exception(
-				f"Permission inheritance loop including group '{node}'."
-			)
-		
-		if node in cleared:
-			# We've already checked this node and its descendants elsewhere in
-			# the traversal.
-			return None
-		
-		past.add(node)
-		
-		for desc in groups[node].get("inherit", []):
-			cycle_search(desc, past)
-		
-		# Pop the current item off the past stack.
-		past.discard(node)
-		# Mark the current node as cleared.
-		cleared.add(node)
+	This finds the strongly connected components of the inheritance graph
+	with Tarjan's algorithm, without recursing.
+	
+	Args:
+		groups: the "groups" section of a permissions config.
+		remaining: the names of the groups to search.
+	
+	Returns: a list of loops, each a sorted list of the groups in it.
+	"""
 	
-	# Search every group for cycles.
-	for group in groups:
-		cycle_search(group, set())
+	def inherits(group):
+		return [
+			inh
+			for inh in groups[group].get("inherit", [])
+			if inh in remaining
+		]
 	
+	index = {}
+	lowlink = {}
+	stack = []
+	on_stack = set()
+	loops = []
 	
-def make_perm_trie(groups_conf, group):
+	for start in sorted(remaining):
+		if start in index:
+			continue
+		
+		index[start] = lowlink[start] = len(index)
+		stack.append(start)
+		on_stack.add(start)
+		work = [(start, iter(inherits(start)))]
+		
+		while work:
+			group, inhs = work[-1]
+			
+			for inh in inhs:
+				if inh not in index:
+					index[inh] = lowlink[inh] = len(index)
+					stack.append(inh)
+					on_stack.add(inh)
+					work.append((inh, iter(inherits(inh))))
+					break
+				
+				if inh in on_stack:
+					lowlink[group] = min(lowlink[group], index[inh])
+			
+			# Every group this one inherits from has been visited.
+			else:
+				work.pop()
+				if work:
+					parent = work[-1][0]
+					lowlink[parent] = min(lowlink[parent], lowlink[group])
+				
+				if lowlink[group] == index[group]:
+					component = []
+					while True:
+						member = stack.pop()
+						on_stack.discard(member)
+						component.append(member)
+						if member == group:
+							break
+					
+					is_loop = (
+						len(component) > 1
+						or group in groups[group].get("inherit", [])
+					)
+					if is_loop:
+						loops.append(sorted(component))
+	
+	return loops
+
+
+def make_perm_trie(groups_conf, group, tries=None):
 	"""
 	Make the perm trie for the given group.
 	
+	The tries of the groups it inherits from must already be made.
+	
 	Args:
 		groups_conf: the config to create the perm trie with.
 		group: the name of the permission group to make a perm trie for.
+		tries: the dict of group names to perm tries to read inherited tries
+			from and add the new trie to. Defaults to perm_groups.
 	"""
 	
-	if group in perm_groups:
+	if tries is None:
+		tries = perm_groups
+	
+	inherit = groups_conf[group].get("inherit", [])
+	if not inherit:
+		trie = tries[group] = PermNode(root=True)
+		for perm in groups_conf[group].get("perms", []):
+			trie.add_perm(perm)
+		
 		return
 	
-	trie = perm_groups[group] = PermNode(root=True)
+	# Start from the first inherited trie, sharing all of its nodes, with its
+	#   perms at a lower priority than the group's own, and add the group's
+	#   own perms over it. Only the nodes along their paths are copied.
+	trie = tries[group] = tries[inherit[0]].copy()
+	trie.lvl_offset += 1
+	trie.group_lvl = -trie.lvl_offset
+	
+	owned = {id(trie)}
 	for perm in groups_conf[group].get("perms", []):
-		trie.add_perm(perm)
+		trie.add_perm(perm, owned=owned)
 	
-	for g in groups_conf[group].get("inherit", []):
-		if g not in perm_groups:
-			make_perm_trie(groups_conf, g)
-		
-		gt = deepcopy(perm_groups[g])
-		gt.increment_group_lvl()
-		
-		trie.merge(gt)
+	for g in inherit[1:]:
+		# Inherited perms have a lower priority than the group's own.
+		trie.merge(tries[g], lvl_offset=1)
+
+
+def group_definition(group_conf):
+	"""
+	Return a comparable summary of a group's config.
+	"""
+	
+	return (
+		tuple(group_conf.get("perms", [])),
+		tuple(group_conf.get("inherit", [])),
+	)
 
 
 @ConfigLoadHandler("permissions")
 def construct_perm_tries(conf):
 	"""
-	Construct perm tries from the given config.
+	Validate the given config, and construct perm tries from it.
+	
+	On a reload, the tries of groups whose definitions and inherited groups
+	are all unchanged are kept.
 	
 	Args:
 		conf: the config to construct perm tries from.
 	"""
 	
-	# Clear the perm groups, in case this is a reload.
-	perm_groups.clear()
+	groups = conf["groups"]
+	
+	# If the default group isn't defined, make it.
+	if "default" not in groups:
+		groups["default"] = {}
 	
-	for group in conf["groups"]:
-		make_perm_trie(conf["groups"], group)
+	order = order_perm_groups(groups)
+	
+	# The new tries are built on the side, so that checks made meanwhile, e.g.
+	#   by commands running in other threads, still see the old ones.
+	new_tries = {}
+	unchanged = set()
+	for group in order:
+		definition = group_definition(groups[group])
+		keep = (
+			group in perm_groups
+			and group_definitions.get(group) == definition
+			and all(inh in unchanged for inh in definition[1])
+		)
+		
+		if keep:
+			unchanged.add(group)
+			new_tries[group] = perm_groups[group]
+		
+		else:
+			make_perm_trie(groups, group, new_tries)
+	
+	new_users = {}
+	for user, user_conf in (conf.get("users") or {}).items():
+		trie = new_users[user] = PermNode.new()
+		for perm in user_conf.get("perms", []):
+			trie.add_perm(perm)
+	
+	with _tries_lock:
+		# Unchanged groups keep their compiled tries, if they have them.
+		new_compiled = {
+			group: compiled_groups[group]
+			for group in unchanged
+			if group in compiled_groups
+		}
+		
+		swap_in(perm_groups, new_tries)
+		swap_in(compiled_groups, new_compiled)
+		swap_in(user_tries, new_users)
+		swap_in(group_definitions, {
+			group: group_definition(groups[group])
+			for group in order
+		})
+		
+		# Decisions made with the old tries may be stale. Any check still
+		#   running with them caches its decision under the old generation,
+		#   where it's never looked up.
+		cache_generation[0] += 1
+	
+	decision_cache.clear()
+	user_views.clear()
+
+
+def swap_in(current, new):
+	"""
+	Replace the contents of a dict in place, without ever emptying it.
+	
+	Args:
+		current: the dict to replace the contents of.
+		new: the dict to replace them with.
+	"""
+	
+	current.update(new)
+	for key in current.keys() - new.keys():
+		current.pop(key, None)
+
+
+def compile_group(group):
+	"""
+	Return the compiled form of a group's perm trie, compiling it if need be.
+	
+	Args:
+		group: the name of the permission group.
+	
+	Returns: the group's CompiledPerms, or None if the group doesn't exist.
+	"""
+	
+	compiled = compiled_groups.get(group)
+	if compiled is not None:
+		return compiled
+	
+	trie = perm_groups.get(group)
+	if trie is None:
+		return None
+	
+	compiled = trie.compile()
+	with _tries_lock:
+		# The config may have been reloaded while compiling.
+		if perm_groups.get(group) is trie:
+			compiled_groups[group] = compiled
+	
+	return compiled
+
 
-			
 def group_has_perm(group, perm):
 	"""
 	Return true if the given group has the given perm, or False otherwise.
@@ -385,12 +920,87 @@ def group_has_perm(group, perm):
 		perm: the perm to test.
 	"""
 	
+	if group is None:
+		# Give the default group if no other is specified.
+		group = "default"
+	
+	key = (cache_generation[0], group, perm)
+	decision = decision_cache.get(key)
+	if decision is not None:
+		return decision
+	
+	# If the user somehow has a non-specified permission group, assume false.
+	compiled = compile_group(group)
+	if compiled is None:
+		decision = False
+	
+	else:
+		decision = bool(compiled.has_perm(perm))
+	
+	decision_cache.put(key, decision)
+	return decision
+
+
+def group_has_perms(group, perms):
+	"""
+	Return which of many perms the given group has, in a single pass.
+	
+	Args:
+		group: the group to test for permission inclusion.
+		perms: an iterable of perms to test, e.g. every command's perm.
+	
+	Returns: a dict of each perm mapped to True if the group has it, or False
+		otherwise.
+	"""
+	
 	if group is None:
 		# Give the default group if no other is specified.
 		group = "default"
 	
 	# If the user somehow has a non-specified permission group, assume false.
-	if group not in perm_groups:
-		return False
+	trie = perm_groups.get(group)
+	if trie is None:
+		return dict.fromkeys(perms, False)
+	
+	return {
+		perm: bool(decision)
+		for perm, decision in trie.has_perms(perms).items()
+	}
+
+
+def user_has_perm(user, group, perm):
+	"""
+	Return whether the given user has the given perm, or False otherwise.
+	
+	A user's individual perm overrides take priority over the perms of their
+	group. Users without overrides are checked with group_has_perm().
+	
+	Args:
+		user: the id of the user, e.g. a message's sender_id. May be None.
+		group: the user's permission group.
+		perm: the perm to test.
+	"""
+	
+	if user not in user_tries:
+		return group_has_perm(group, perm)
+	
+	if group is None:
+		# Give the default group if no other is specified.
+		group = "default"
+	
+	key = (cache_generation[0], user, group)
+	view = user_views.get(key)
+	if view is None:
+		view = PermNode.new()
+		view.merge(user_tries.get(user) or PermNode.new())
+		
+		# If the user somehow has a non-specified permission group, they only
+		#   have their own perms.
+		group_trie = perm_groups.get(group)
+		if group_trie is not None:
+			view.merge(group_trie, lvl_offset=1)
+		
+		view = view.compile()
+		user_views.put(key, view)
 	
-	return perm_groups[group].has_perm(perm)
+	return bool(view.has_perm(perm))
@@ -7,6 +7,8 @@ Commands:
 	reload [conf...]
 	shutdown
 	restart
+	stats [prefix]
+	commands
 """
 
 import config
@@ -14,10 +16,20 @@ from cooldown import (
 	set_cooldown,
 	has_cooled_down,
 	remove_cooldown,
-	_cooldowns as cooldown_list
+	keys as cooldown_keys,
 )
 from exceptions import BotRestartException, BotShutdownException
-from plugins.commands import Command, CommandException, delegate_command
+from permissions import group_has_perms, user_has_perm, user_tries
+from plugins.commands import (
+	Command,
+	CommandException,
+	delegate_command,
+	dynamic_commands,
+)
+from stats import get_stats
+
+# The maximum number of entries to show in the output of the stats command.
+MAX_STATS_SHOWN = 10
 
 
 @Command(args_usage="[cmd...]")
@@ -66,17 +78,18 @@ def enable(*cmds):
 	
 	# Don't need to check whether c is cooled down, because removing it won't
 	# have any affect anything even if it is.
-	disabled_cmds = filter(
-		lambda c: c.startswith("cmd."),
-		# Accessing private vars is sketchy, but it's useful here.
-		cooldown_list.keys()
-	)
+	# Commands run in several threads at once, so take a snapshot of the keys.
+	disabled_cmds = [
+		key
+		for key in cooldown_keys()
+		if key.startswith("cmd.")
+	]
 	
 	if not cmds:
 		if has_cooled_down("cmds") and not disabled_cmds:
 			raise CommandException("No disabled commands.")
 		
-		for cmd in ["cmds"] + list(disabled_cmds):
+		for cmd in ["cmds"] + disabled_cmds:
 			remove_cooldown(cmd)
 		
 		return "All commands re-enabled."
@@ -137,3 +150,66 @@ def restart():
 	"""
 	
 	raise BotRestartException
+
+
+@Command(
+	name="stats",
+	args_val=(lambda *args: len(args) <= 1),
+	args_usage="[prefix]",
+)
+def show_stats(prefix=""):
+	"""
+	Show latency statistics for the slowest handlers and commands.
+	
+	Args:
+		prefix: only show entries whose names start with this, e.g. "cmd.".
+	"""
+	
+	summaries = sorted(
+		get_stats(prefix).items(),
+		key=lambda item: item[1]["p99"],
+		reverse=True,
+	)
+	
+	if not summaries:
+		raise CommandException("No statistics recorded.")
+	
+	def ms(secs):
+		return f"{secs * 1000:.1f}ms"
+	
+	return "\n".join(
+		f"{name}: {summ['count']} calls, p50 {ms(summ['p50'])}, "
+		f"p95 {ms(summ['p95'])}, p99 {ms(summ['p99'])}, max {ms(summ['max'])}"
+		for name, summ in summaries[:MAX_STATS_SHOWN]
+	)
+
+
+@Command(
+	name="commands",
+	args_val=(lambda *args: not args),
+	args_usage="",
+	pass_msg=True,
+)
+def list_commands(msg):
+	"""
+	List the commands that the sender has permission to use.
+	"""
+	
+	names = list(dynamic_commands)
+	perms = ["cmd.statics"] + [f"cmd.{name}" for name in names]
+	if msg.sender_id in user_tries:
+		allowed = {
+			perm: user_has_perm(msg.sender_id, msg.sender_group, perm)
+			for perm in perms
+		}
+	else:
+		allowed = group_has_perms(msg.sender_group, perms)
+	
+	usable = [name for name in names if allowed[f"cmd.{name}"]]
+	if allowed["cmd.statics"]:
+		usable.extend(config.configs["commands"]["static-commands"])
+	
+	if not usable:
+		raise CommandException("You can't use any commands.")
+	
+	return "Commands: " + ", ".join(sorted(usable))
@@ -2,10 +2,45 @@
 Commands which are generally useful for a Minecraft server.
 """
 
-import requests
+import collections
+import json
+from urllib.request import urlopen
 
+from caching import TTLCache
+import config
+from exceptions import CommandException
+from handlers import ConfigLoadHandler
 from plugins.commands import Command
-import collections
+
+
+def fetch_statuses(url):
+	"""
+	Fetch the statuses of Mojang's servers.
+	
+	Args:
+		url: the URL of Mojang's status API.
+	
+	Returns: the parsed response from the status API.
+	"""
+	
+	timeout = config.configs["minecraft"].get("status-timeout", 5)
+	with urlopen(url, timeout=timeout) as resp:
+		return json.loads(resp.read().decode("utf-8"))
+
+
+# Server statuses, keyed by status API URL.
+server_statuses = TTLCache(fetch_statuses, ttl=60, stale=300)
+
+
+@ConfigLoadHandler("minecraft")
+def configure_status_cache(new_conf):
+	"""
+	Apply the configured cache lifetimes to the server status cache.
+	"""
+	
+	server_statuses.ttl = new_conf.get("status-ttl", server_statuses.ttl)
+	server_statuses.stale = new_conf.get("status-stale", server_statuses.stale)
+	server_statuses.clear()
 
 
 @Command(args_val=(lambda *args: args), args_usage="<name>")
@@ -21,6 +56,8 @@ def welcome(*name):
 @Command(
 	args_val=(lambda *args: len(args) == 1 and args[0].isdigit()),
 	args_usage="<# of items>",
+	pure=True,
+	cache_key=(lambda items: int(items)),
 )
 def stacks(items):
 	"""
@@ -42,6 +79,8 @@ def stacks(items):
 @Command(
 	args_val=(lambda *args: len(args) == 1 and args[0].isdigit()),
 	args_usage="<# of stacks>",
+	pure=True,
+	cache_key=(lambda stacks: int(stacks)),
 )
 def items(stacks):
 	"""
@@ -63,13 +102,21 @@ def mcstatus():
 	Check the status of Mojang's servers.
 	"""
 	
-	server_statuses = requests.get("http://status.mojang.com/check").json()
+	url = config.configs["minecraft"].get(
+		"status-url",
+		"http://status.mojang.com/check",
+	)
+	
+	try:
+		statuses = server_statuses.get(url)
+	except (OSError, ValueError):
+		raise CommandException("Couldn't get the status of Mojang's servers.")
 	
 	# Mojang's status API has a weird format. Instead of a single multi-key
 	# dict, it's an array of single-key dictionaries.
 	down_servers = [
 		server
-		for server, status in collections.ChainMap(*server_statuses).items()
+		for server, status in collections.ChainMap(*statuses).items()
 		if status != "green"
 	]
 	
@@ -132,6 +132,8 @@ def echo(*args):
 @Command(
 	args_val=(lambda *args: len(args) == 2 and args[1].lower() in ("c", "f")),
 	args_usage="<degrees> <C|F>",
+	pure=True,
+	cache_key=(lambda degrees, units: (degrees, units.lower())),
 )
 def temp(degrees, units):
 	"""
@@ -159,7 +161,7 @@ def temp(degrees, units):
 		raise CommandException("Unknown degree format: %s" % units)
 
 
-@Command(args_val=(lambda *args: args), args_usage="<search term>")
+@Command(args_val=(lambda *args: args), args_usage="<search term>", pure=True)
 def lmgtfy(*search):
 	"""
 	Get the LMGTFY link for the given text.
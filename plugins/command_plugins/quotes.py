@@ -13,6 +13,7 @@ from datetime import datetime
 import json
 import os
 import random
+import threading
 
 import config
 from exceptions import CommandException
@@ -35,6 +36,10 @@ quotes = {}
 # String path to the used quotes file
 QUOTES_FILE = os.path.join(os.path.dirname(__file__), "quotes.json")
 
+# Commands run in several threads at once, so the quote commands hold this
+#   while they use the quotes list or write the quotes file.
+_lock = threading.Lock()
+
 
 @ConfigLoadHandler("quotes")
 def load_quote_list(_):
@@ -42,23 +47,24 @@ def load_quote_list(_):
 	Load the quotes from the quote file and save them as quote_list.
 	"""
 	
-	# If the file doesn't exist yet, create an empty one.
-	if not os.path.isfile(QUOTES_FILE):
-		write_quotes()
-	
-	with open(QUOTES_FILE, "r") as file:
-		quotes.clear()
-		# Writing dicts to json automatically converts int keys to strings.
-		# We want them as ints, so undo that as it's read in.
-		quotes.update({
-			int(k): v
-			for k, v in json.load(file).items()
-		})
+	with _lock:
+		# If the file doesn't exist yet, create an empty one.
+		if not os.path.isfile(QUOTES_FILE):
+			write_quotes()
+		
+		with open(QUOTES_FILE, "r") as file:
+			quotes.clear()
+			# Writing dicts to json automatically converts int keys to
+			# strings. We want them as ints, so undo that as it's read in.
+			quotes.update({
+				int(k): v
+				for k, v in json.load(file).items()
+			})
 
 
 def write_quotes():
 	"""
-	Write the quotes list to the quotes file.
+	Write the quotes list to the quotes file. Must hold the lock.
 	"""
 	
 	with open(QUOTES_FILE, "w") as file:
@@ -97,23 +103,24 @@ def quote(qid=None):
 		retrieved.
 	"""
 	
-	if qid:
-		qid = int(qid)
-		if qid not in quotes or not quotes[qid].get("display", True):
-			return "That quote isn't on the list."
-	
-	else:
-		qs = {
-			k: v
-			for k, v in quotes.items()
-			if v.get("display", True)
-		}
-		if not qs:
-			return "The quote list is empty."
+	with _lock:
+		if qid:
+			qid = int(qid)
+			if qid not in quotes or not quotes[qid].get("display", True):
+				return "That quote isn't on the list."
 		
-		qid = random.choice(list(qs.keys()))
-	
-	return "Quote #{}: {}".format(qid, quotes[qid]["content"])
+		else:
+			qs = {
+				k: v
+				for k, v in quotes.items()
+				if v.get("display", True)
+			}
+			if not qs:
+				return "The quote list is empty."
+			
+			qid = random.choice(list(qs.keys()))
+		
+		return "Quote #{}: {}".format(qid, quotes[qid]["content"])
 
 
 @Command(args_val=(lambda *args: args), args_usage="<quote>")
@@ -125,15 +132,17 @@ def addquote(*text):
 		text: the text of the quote to be saved, as a string that's been split.
 	"""
 	
-	qid = max(quotes) + 1 if quotes else 0
 	quo = {
 		"content": " ".join(text),
 		"date": str(datetime.now()),
 		"display": True,
 	}
 	
-	quotes[qid] = quo
-	write_quotes()
+	with _lock:
+		qid = max(quotes) + 1 if quotes else 0
+		quotes[qid] = quo
+		write_quotes()
+	
 	return "Quote #%s saved." % qid
 
 
@@ -155,30 +164,31 @@ def remquote(*nums):
 	pres = config.configs["quotes"]["preserve-deled-qs"]
 	nums = [int(num) for num in nums]
 	
-	for num in nums:
-		# If the specified number isn't in the quotes list, *or* (it is but set
-		# to nondisplay *and* config is set to preserve deleted). In this way,
-		# preserved quotes will only be permanently deleted if preserve has
-		# since been set to false.
-		quote_cant_display = (
-			num not in quotes
-			or (
-				pres
-				and not quotes[num].get("display", True)
-			)
-		)
-		if quote_cant_display:
-			raise CommandException(
-				f"There isn't any quote #{num} on the list.",
+	with _lock:
+		for num in nums:
+			# If the specified number isn't in the quotes list, *or* (it is but
+			# set to nondisplay *and* config is set to preserve deleted). In
+			# this way, preserved quotes will only be permanently deleted if
+			# preserve has since been set to false.
+			quote_cant_display = (
+				num not in quotes
+				or (
+					pres
+					and not quotes[num].get("display", True)
+				)
 			)
-	
-	for num in nums:
-		if pres:
-			quotes[num]["display"] = False
-		else:
-			del quotes[num]
-	
-	write_quotes()
+			if quote_cant_display:
+				raise CommandException(
+					f"There isn't any quote #{num} on the list.",
+				)
+		
+		for num in nums:
+			if pres:
+				quotes[num]["display"] = False
+			else:
+				del quotes[num]
+		
+		write_quotes()
 	
 	quote_numbers = ", ".join(f"#{num}" for num in nums)
 	return f"Quote{'s' if len(nums) > 1 else ''} deleted: {quote_numbers}"
@@ -204,14 +214,15 @@ def resquote(*nums):
 		for num in nums
 	]
 	
-	for num in nums:
-		if num not in quotes or quotes[num].get("display", True):
-			raise CommandException(f"Quote #{num} is not restorable.")
-	
-	for num in nums:
-		quotes[num]["display"] = True
-	
-	write_quotes()
+	with _lock:
+		for num in nums:
+			if num not in quotes or quotes[num].get("display", True):
+				raise CommandException(f"Quote #{num} is not restorable.")
+		
+		for num in nums:
+			quotes[num]["display"] = True
+		
+		write_quotes()
 	
 	quote_numbers = ", ".join(f"#{num}" for num in nums)
 	return f"Quote{'s' if len(nums) > 1 else ''} restored: {quote_numbers}"
@@ -4,9 +4,14 @@ Commands pertaining to the regex plugin.
 
 from copy import copy
 
+import config
 from exceptions import CommandException
 from plugins.commands import Command
-from plugins.regex import regex_msg_handler
+from plugins.regex import dump_trigger_stats, regex_msg_handler, trigger_stats
+
+# The maximum number of triggers to show in the output of the regexstats
+#   command.
+MAX_STATS_SHOWN = 10
 
 
 @Command(
@@ -19,9 +24,11 @@ def regex(msg, *args):
 	Force-trigger a regex for the provided message.
 	"""
 	
+	# Trigger as a default user, without any of the sender's own perms.
 	msg = copy(msg)
 	msg.text_content = " ".join(args)
 	msg.sender_group = "default"
+	msg.sender_id = None
 	
 	resp = regex_msg_handler(msg)
 	
@@ -29,3 +36,40 @@ def regex(msg, *args):
 		raise CommandException("No regex found.")
 
 	return resp
+
+
+@Command(
+	args_val=(lambda *args: not args),
+	args_usage="",
+)
+def regexstats():
+	"""
+	Show how often the regex triggers match, and how long they take.
+	
+	The stats of every trigger are also written to the regex config's
+	stats-file, if it's set.
+	"""
+	
+	stats = trigger_stats()
+	if not stats:
+		raise CommandException("No regexes loaded.")
+	
+	out_file = config.configs["regex"].get("stats-file")
+	if out_file:
+		dump_trigger_stats(out_file)
+	
+	hottest = sorted(
+		(entry for entry in stats if entry["matched"]),
+		key=lambda entry: entry["matched"],
+		reverse=True,
+	)
+	dead = len(stats) - len(hottest)
+	
+	lines = [
+		f"{entry['pattern']}: {entry['matched']} matches, "
+		f"{entry['tried']} tries, {entry['seconds'] * 1000:.1f}ms"
+		for entry in hottest[:MAX_STATS_SHOWN]
+	]
+	lines.append(f"{dead} of {len(stats)} regexes have never matched.")
+	
+	return "\n".join(lines)
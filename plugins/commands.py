@@ -3,15 +3,32 @@ Manage chat command interactions in the bot.
 """
 
 import functools
+import time
+from types import MappingProxyType
 
+from caching import LRUCache
 import config
 import cooldown
+import stats
 from exceptions import CommandException, UnknownCommandException
-from handlers import MessageHandler
-from permissions import group_has_perm
+from handlers import ConfigLoadHandler, MessageHandler
+from permissions import user_has_perm
+from ratelimit import KeyedLimiter
 
 dynamic_commands = {}
 
+# Rate limiters for command use, keyed by what they limit: "user", "channel"
+#   or "user-command". Limits which aren't configured are absent.
+rate_limiters = {}
+
+# Result caches of pure commands, keyed by command name.
+pure_caches = {}
+
+# _dispatch_table is a list containing a single mapping, so that the table can
+#   be swapped out wholesale. A value of None means the table is stale and
+#   should be rebuilt on next use.
+_dispatch_table = [None]
+
 
 def register_commands():
 	"""
@@ -35,6 +52,7 @@ def deregister_command(command):
 	"""
 	
 	del dynamic_commands[command]
+	_dispatch_table[0] = None
 
 
 def register_com_mod(mod_name):
@@ -48,39 +66,168 @@ def register_com_mod(mod_name):
 	__import__(f"plugins.command_plugins.{mod_name}")
 
 
+def make_static_command(name, resp, cooldown_secs):
+	"""
+	Make a callable command which always replies with the same string.
+	
+	Args:
+		name: the name of the static command.
+		resp: the string that the command replies with.
+		cooldown_secs: minimum number of seconds between uses of the command.
+	
+	Returns: the callable static command.
+	"""
+	
+	StaticCommand = Command(
+		static=True,
+		cooldown=cooldown_secs,
+		name=name,
+		args_val=lambda *args: True,
+	)
+	return StaticCommand(lambda *args: resp)
+
+
+def build_dispatch_table(com_conf):
+	"""
+	Build a table mapping every command name and alias to its callable.
+	
+	Args:
+		com_conf: the commands config to build the table from.
+	
+	Returns: an immutable mapping of command names and aliases to callables.
+	"""
+	
+	table = {
+		name: make_static_command(name, resp, com_conf["statics-cooldown"])
+		for name, resp in com_conf["static-commands"].items()
+	}
+	
+	# Dynamic commands take precedence over static commands of the same name.
+	table.update(dynamic_commands)
+	
+	# Aliases take precedence over command names, but may only refer to base
+	# command names, not to other aliases.
+	base_commands = dict(table)
+	for com, aliases in com_conf["aliases"].items():
+		if com in base_commands:
+			for alias in aliases:
+				table[alias] = base_commands[com]
+	
+	return MappingProxyType(table)
+
+
+@ConfigLoadHandler(ConfigLoadHandler.ANY_CONF)
+def clear_pure_caches(_):
+	"""
+	Clear the results of pure commands, since they may depend on config.
+	"""
+	
+	for cache in pure_caches.values():
+		cache.clear()
+
+
+def pure_cache_info():
+	"""
+	Return the hits, misses and sizes of pure commands' result caches.
+	
+	Returns: a dict of command names mapped to dicts, as from LRUCache.info().
+	"""
+	
+	return {name: cache.info() for name, cache in pure_caches.items()}
+
+
+@ConfigLoadHandler("commands")
+def load_dispatch_table(new_conf):
+	"""
+	Rebuild the command dispatch table from a newly loaded commands config.
+	"""
+	
+	_dispatch_table[0] = build_dispatch_table(new_conf)
+
+
+@ConfigLoadHandler("commands")
+def load_rate_limiters(new_conf):
+	"""
+	Make new rate limiters from a newly loaded commands config.
+	"""
+	
+	rate_limiters.clear()
+	
+	for scope, limit in (new_conf.get("rate-limits") or {}).items():
+		if limit:
+			rate_limiters[scope] = KeyedLimiter(
+				limit["capacity"],
+				limit["refill"],
+			)
+
+
+def within_rate_limits(msg, cmd_name=None):
+	"""
+	Use up rate limit tokens for a command use, if the limits allow it.
+	
+	Tokens are only taken if every limit allows the use, so a use that's
+	rejected by one limit doesn't count against the others.
+	
+	Args:
+		msg: the message in which the command was used.
+		cmd_name: the name of the command, to also check the per-user
+			per-command limit. If omitted, only the per-user and per-channel
+			limits are checked.
+	
+	Returns: True if the command may be used, or False otherwise.
+	"""
+	
+	user = msg.sender_id or msg.sender_name
+	
+	keys = [("user", user), ("channel", msg.channel_id)]
+	if cmd_name is not None:
+		keys.append(("user-command", (user, cmd_name)))
+	
+	limits = []
+	for scope, key in keys:
+		limiter = rate_limiters.get(scope)
+		
+		# Messages which aren't from a channel aren't limited per channel.
+		if limiter is not None and key is not None:
+			limits.append((limiter, key))
+	
+	now = time.monotonic()
+	if not all(limiter.allows(key, now=now) for limiter, key in limits):
+		return False
+	
+	for pos, (limiter, key) in enumerate(limits):
+		if not limiter.consume(key, now=now):
+			# Another use took the last token since the check.
+			for taken_limiter, taken_key in limits[:pos]:
+				taken_limiter.refund(taken_key)
+			
+			return False
+	
+	return True
+
+
 def delegate_command(cmd):
 	"""
 	Retrieve a callable command from its string name.
 	
 	Args:
-		cmd: the name of the command to retrieve.
+		cmd: the name or alias of the command to retrieve.
 		
 	Returns: the callable for the desired command.
 
 	"""
 	
-	com_conf = config.configs["commands"]
+	table = _dispatch_table[0]
+	if table is None:
+		# A command has been [de]registered since the table was last built.
+		table = build_dispatch_table(config.configs["commands"])
+		_dispatch_table[0] = table
 	
-	# Check if the command is an alias for another command.
-	for com in com_conf["aliases"]:
-		if cmd in com_conf["aliases"][com]:
-			cmd = com
+	command = table.get(cmd)
+	if command is None:
+		raise UnknownCommandException("Unknown command: " + cmd)
 	
-	if cmd in dynamic_commands:
-		return dynamic_commands[cmd]
-		
-	elif cmd in com_conf["static-commands"]:
-		StaticCommand = Command(
-			static=True,
-			cooldown=com_conf["statics-cooldown"],
-			name=cmd,
-			args_val=lambda *args: True,
-		)
-		return StaticCommand(
-			lambda *args: com_conf["static-commands"][cmd],
-		)
-			
-	raise UnknownCommandException("Unknown command: " + cmd)
+	return command
 
 
 def validate_command_args(cmd, args, alias=None):
@@ -104,7 +251,16 @@ def validate_command_args(cmd, args, alias=None):
 		)
 
 
-@MessageHandler
+def command_prefix():
+	"""
+	Return the configured command prefix.
+	"""
+	
+	return config.configs["commands"]["command-prefix"]
+
+
+# Commands may do network or file I/O, so keep them off the event loop.
+@MessageHandler(blocking=True, prefix=command_prefix)
 def cmd_msg_handler(msg):
 	"""
 	Message event handler for commands.
@@ -135,12 +291,27 @@ def cmd_msg_handler(msg):
 			args = [arg[:20] for arg in args]
 			
 			# Find and run the proper command function.
-			command = delegate_command(cmd_name)
+			try:
+				command = delegate_command(cmd_name)
+			
+			except UnknownCommandException:
+				# Unknown commands still count against the user and channel
+				# limits, so that they can't be spammed for error messages.
+				if not within_rate_limits(msg):
+					return
+				
+				raise
+			
 			name = "cmd." + command.meta["name"]
 			
+			# Silently drop commands from users or channels sending too many.
+			if not within_rate_limits(msg, command.meta["name"]):
+				return
+			
 			# If commands are disabled or this particular command hasn't cooled
 			# down, stop resolution. Either way, never disable the 'enable'
-			# command.
+			# command. The command's cooldown is checked again, atomically,
+			# just before it runs.
 			disableable = (
 				name == "cmd.enable"
 				or (
@@ -157,7 +328,8 @@ def cmd_msg_handler(msg):
 				perm = name
 			
 			# Check that the user has perms.
-			if not group_has_perm(msg.sender_group, perm):
+			allowed = user_has_perm(msg.sender_id, msg.sender_group, perm)
+			if not allowed:
 				if command.meta["no_perms_msg"]:
 					raise CommandException(command.meta["no_perms_msg"])
 				raise CommandException("Insufficient permissions.")
@@ -166,9 +338,23 @@ def cmd_msg_handler(msg):
 			
 			if command.meta["pass_msg"]:
 				args = [msg] + args
-				
-			resp = command(*args)
-			cooldown.set_cooldown(name, command.meta["cooldown"])
+			
+			# Commands run in worker threads, so claim the cooldown before
+			# running the command, so that concurrent uses can't both get
+			# past it.
+			if name == "cmd.enable":
+				cooldown.set_cooldown(name, command.meta["cooldown"])
+			elif not cooldown.claim_cooldown(name, command.meta["cooldown"]):
+				return
+			
+			try:
+				resp = command(*args)
+			
+			except Exception:
+				# Failed uses don't put the command on cooldown.
+				cooldown.remove_cooldown(name)
+				raise
+			
 			if resp:
 				# XOR
 				prepend_name = (
@@ -192,6 +378,10 @@ def cmd_msg_handler(msg):
 				return f"{msg.sender_name}: Error - {ex.args[0]}"
 
 
+# Marker for a cache miss, since None is a valid command reply.
+_MISSING = object()
+
+
 class Command:
 	"""
 	Used as a decorator to define command objects.
@@ -222,6 +412,14 @@ class Command:
 				command without the proper permissions.
 			pass_msg: whether to pass the Message object that triggered this
 				command to the command function.
+			pure: whether the command's reply depends only on its arguments
+				(and config), so that replies can be cached. Incompatible with
+				pass_msg.
+			cache_size: the maximum number of replies to cache for a pure
+				command.
+			cache_key: for a pure command, a callable that normalises the
+				command arguments into a hashable key, e.g. to ignore case;
+				by default, the tuple of arguments.
 		"""
 		
 		# Provide some defaults for kwargs.
@@ -232,9 +430,15 @@ class Command:
 			"args_usage": "<arguments>",
 			"name": None,
 			"no_perms_msg": None,
-			"pass_msg": False
+			"pass_msg": False,
+			"pure": False,
+			"cache_size": 128,
+			"cache_key": lambda *args: args,
 		}
 		self.meta.update(kwargs)
+		
+		if self.meta["pure"] and self.meta["pass_msg"]:
+			raise ValueError("A command which is passed messages can't be pure.")
 	
 	def __call__(self, cmd):
 		"""
@@ -246,15 +450,31 @@ class Command:
 		Returns: The wrapped function.
 		"""
 		
-		@functools.wraps(cmd)
-		def wrapped_func(*args):
+		cache = LRUCache(self.meta["cache_size"]) if self.meta["pure"] else None
+		
+		def call_cmd(*args):
 			if self.meta["static"]:
 				# Don't bother passing any received arguments.
 				return cmd()
 			
 			return cmd(*args)
 		
+		@functools.wraps(cmd)
+		def wrapped_func(*args):
+			with stats.timed("cmd." + str(self.meta["name"])):
+				if cache is None:
+					return call_cmd(*args)
+				
+				key = () if self.meta["static"] else self.meta["cache_key"](*args)
+				resp = cache.get(key, _MISSING)
+				if resp is _MISSING:
+					resp = call_cmd(*args)
+					cache.put(key, resp)
+				
+				return resp
+		
 		wrapped_func.meta = self.meta
+		wrapped_func.cache = cache
 		
 		# Don't save static commands to the list
 		if not self.meta["static"]:
@@ -263,6 +483,10 @@ class Command:
 			# Save it as the given name or, failing that, the name of the
 			# function.
 			dynamic_commands[self.meta["name"]] = wrapped_func
+			_dispatch_table[0] = None
+			
+			if cache is not None:
+				pure_caches[self.meta["name"]] = cache
 		
 		return wrapped_func
 
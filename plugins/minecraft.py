@@ -4,28 +4,91 @@ Translate messages from a Minecraft bridge to the bot's format.
 
 import re
 
-import config
-from handlers import MessageHandler
+from handlers import ConfigLoadHandler, MessageHandler
 
+# Bridge bot names mapped to (compiled message format, rank->group dict) pairs,
+#   in a list so that the dict can be replaced whole on a reload.
+_bridges = [{}]
 
-@MessageHandler
+
+def compile_bridge(form, perm_groups):
+	"""
+	Compile a bridge's settings for fast parsing of its messages.
+	
+	Args:
+		form: the bridge's message format, as a regex.
+		perm_groups: permission groups mapped to the bridge ranks in them.
+	
+	Returns: a (compiled format, rank->group dict) pair. Where a rank is in
+		more than one group, the group listed first is used.
+	"""
+	
+	rank_groups = {}
+	for group, ranks in (perm_groups or {}).items():
+		for rank in ranks or []:
+			rank_groups.setdefault(rank, group)
+	
+	return re.compile(form), rank_groups
+
+
+@ConfigLoadHandler("minecraft")
+def compile_bridges(new_conf):
+	"""
+	Compile the settings of every configured bridge.
+	
+	Bridges are configured either as a list under "bridges", or as a single
+	bridge with the top-level mc-bridge-* and perm-groups settings.
+	"""
+	
+	bridges = new_conf.get("bridges")
+	if bridges is None:
+		bridges = [{
+			"name": new_conf["mc-bridge-name"],
+			"form": new_conf["mc-bridge-form"],
+			"perm-groups": new_conf.get("perm-groups"),
+		}]
+	
+	compiled = {}
+	for bridge in bridges:
+		compiled[bridge["name"]] = compile_bridge(
+			bridge["form"],
+			bridge.get("perm-groups"),
+		)
+	
+	# Replaced whole, so that messages handled during a reload, e.g. one run
+	#   in a worker thread, see either the old bridges or the new ones.
+	_bridges[0] = compiled
+
+
+def bridge_names():
+	"""
+	Return the names of the configured Minecraft bridge bots.
+	"""
+	
+	return list(_bridges[0])
+
+
+@MessageHandler(sender=bridge_names)
 def mc_msg_handler(msg):
 	"""
 	Intercept bridge-bot messages and normalise them.
 	"""
 	
-	conf = config.configs["minecraft"]
-	
-	sender = msg.sender_id or msg.sender_name
-	if sender == conf["mc-bridge-name"]:
-		m = re.match(conf["mc-bridge-form"], msg.text_content)
-		if m:
-			match = m.groupdict()
-			msg.sender_name = match["NAME"]
-			msg.text_content = match["MESSAGE"]
-			rank = match.get("RANK")
-			if rank:
-				for group, ranks in conf["perm-groups"].items():
-					if rank in ranks:
-						msg.sender_group = group
-						break
+	bridge = _bridges[0].get(msg.sender_id or msg.sender_name)
+	if bridge is None:
+		return
+	
+	form, rank_groups = bridge
+	m = form.match(msg.text_content)
+	if m:
+		match = m.groupdict()
+		# The message is the player's, not the bridge bot's, so mustn't be
+		# identified as the bot's, e.g. for per-user perms or rate limits.
+		msg.sender_id = None
+		msg.sender_name = match["NAME"]
+		msg.text_content = match["MESSAGE"]
+		rank = match.get("RANK")
+		if rank:
+			group = rank_groups.get(rank)
+			if group is not None:
+				msg.sender_group = group
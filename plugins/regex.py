@@ -2,59 +2,173 @@
 React to messages which match certain regex.
 """
 
-import re
+import json
+import threading
 
 import config
 import cooldown
 from handlers import MessageHandler, ConfigLoadHandler
-from permissions import group_has_perm
+from permissions import user_has_perm
+from triggers import TriggerPool, TriggerSet
 
-# _regexes is a list containing a single re, instead of just a straight re,
-#   because it needs to be mutable in order for inner scopes to assign to it.
+# The number of worker processes that messages are matched in.
+MATCH_WORKERS = 2
+
+# _regexes is a list containing a single (trigger set, responses) pair, instead
+#   of just a straight pair, because it needs to be mutable in order for inner
+#   scopes to assign to it. The trigger set is a PooledTriggerSet or TriggerSet,
+#   and the responses are (pattern, response, cooldown key) triples for each
+#   trigger, in the same order. Both are replaced together, so that a message
+#   matched during a reload sees either the old triggers or the new, never a
+#   mix.
 _regexes = []
-_resps = []
+
+# Worker processes are only started once messages are matched in them.
+_pool = TriggerPool(workers=MATCH_WORKERS)
+
+# Patterns mapped to [matches, tries, seconds spent trying] lists.
+_trigger_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_trigger(pattern, value):
+	"""
+	Parse a trigger from the config.
+	
+	Args:
+		pattern: the trigger's regex.
+		value: either the trigger's response, or a dict with its "response"
+			and whether to "search" for the trigger anywhere in a message,
+			rather than only matching it at the start.
+	
+	Returns: a ((pattern, search), response) pair.
+	"""
+	
+	if isinstance(value, dict):
+		return (pattern, bool(value.get("search"))), value["response"]
+	
+	return (pattern, False), value
 
 
 @ConfigLoadHandler("regex")
 def compose_regexes(new_conf):
 	"""
 	Compose the set of regexes from the config.
+	
+	When more than one trigger matches a message, the first in the config
+	wins. Messages are matched in worker processes, under a time budget of
+	match-timeout seconds, unless it's 0 or missing, as in configs from before
+	it existed.
+	
+	Triggers that are unchanged since the last load are not compiled again.
 	"""
 	
-	_regexes.clear()
-	regs, _resps[:] = new_conf["statics"].keys(), new_conf["statics"].values()
+	parsed = [
+		parse_trigger(pattern, value)
+		for pattern, value in new_conf["statics"].items()
+	]
+	triggers = [trigger for trigger, _ in parsed]
+	resps = [
+		(pattern, resp, f"regex.{ind}")
+		for ind, ((pattern, _), resp) in enumerate(parsed)
+	]
+	
+	timeout = new_conf.get("match-timeout", 0)
+	if timeout:
+		_pool.timeout = timeout
+		trigger_set = _pool.load(triggers)
+	
+	else:
+		old = _regexes[0][0] if _regexes else None
+		trigger_set = TriggerSet(
+			triggers,
+			reuse=old if isinstance(old, TriggerSet) else None,
+		)
+	
+	with _stats_lock:
+		patterns = {pattern for pattern, _ in triggers}
+		for pattern in list(_trigger_stats):
+			if pattern not in patterns:
+				del _trigger_stats[pattern]
+	
+	_regexes[:] = [(trigger_set, resps)]
 
-	_regexes.append(
-		re.compile(
-			"|".join(f"({s})" for s in regs),
-			flags=re.IGNORECASE,
-		),
-	)
 
+def record_timings(resps, timings):
+	"""
+	Record how each trigger tried on a message fared.
+	
+	Args:
+		resps: the (pattern, response, cooldown key) triples of the triggers.
+		timings: (index, seconds, matched) triples of the triggers tried.
+	"""
+	
+	with _stats_lock:
+		for ind, secs, matched in timings:
+			entry = _trigger_stats.get(resps[ind][0])
+			if entry is None:
+				entry = _trigger_stats[resps[ind][0]] = [0, 0, 0.0]
+			
+			entry[0] += matched
+			entry[1] += 1
+			entry[2] += secs
+
+
+def trigger_stats():
+	"""
+	Return how each trigger has fared since it was added.
+	
+	Returns: a list of dicts, one for each trigger in priority order, with
+		its "pattern" and "response", the number of messages it has
+		"matched" and been "tried" on, and the total "seconds" spent trying
+		it. Messages which other triggers win before it's tried don't count,
+		and neither do those which no trigger matches when the triggers are
+		few enough to be tried as a single alternation in-process.
+	"""
+	
+	resps = _regexes[0][1] if _regexes else []
+	
+	with _stats_lock:
+		return [
+			dict(zip(
+				("pattern", "response", "matched", "tried", "seconds"),
+				[pattern, resp] + _trigger_stats.get(pattern, [0, 0, 0.0]),
+			))
+			for pattern, resp, _ in resps
+		]
 
-@MessageHandler
+
+def dump_trigger_stats(path):
+	"""
+	Write the stats of every trigger to a JSON file.
+	"""
+	
+	with open(path, "w") as file:
+		json.dump(trigger_stats(), file, indent="\t")
+
+
+@MessageHandler(blocking=True)
 def regex_msg_handler(msg):
 	"""
 	Trigger regex responses on appropriate messages.
 	"""
 	
-	if not group_has_perm(msg.sender_group, "regex.trigger"):
+	allowed = user_has_perm(msg.sender_id, msg.sender_group, "regex.trigger")
+	if not allowed:
+		return
+	
+	if not _regexes:
 		return
 	
-	m = _regexes[0].match(msg.text_content)
-	
-	if m:
-		# Find which regex got matched.
-		ind = None
-		for ind, val in enumerate(m.groups()):
-			if val:
-				break
-
-		# ind now equals the index of the first non-None value.
-		cdk = f"regex.{ind}"
-		if cooldown.has_cooled_down(cdk):
-			cooldown.set_cooldown(
-				cdk,
-				config.configs["regex"]["static-cooldown"],
-			)
-			return f"{msg.sender_name} - {_resps[ind]}"
+	trigger_set, resps = _regexes[0]
+	ind, timings = trigger_set.evaluate(msg.text_content)
+	record_timings(resps, timings)
+	
+	if ind is not None:
+		_, resp, cdk = resps[ind]
+		cooled_down = cooldown.claim_cooldown(
+			cdk,
+			config.configs["regex"]["static-cooldown"],
+		)
+		if cooled_down:
+			return f"{msg.sender_name} - {resp}"
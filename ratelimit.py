@@ -0,0 +1,202 @@
+"""
+Module for rate limiting.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TokenBucket:
+	"""
+	A bucket of tokens which refills continuously, up to a capacity.
+
+	Each action consumes a token, so actions can burst up to the capacity,
+	but are limited to the refill rate over time.
+
+	Attributes:
+		capacity: the maximum number of tokens the bucket can hold.
+		rate: the number of tokens the bucket regains per second.
+		tokens: the number of tokens in the bucket as of the last update.
+		updated: the time.monotonic() time of the last update.
+	"""
+
+	def __init__(self, capacity, rate, now=None):
+		"""
+		Make a full bucket.
+
+		Args:
+			capacity: the maximum number of tokens the bucket can hold.
+			rate: the number of tokens the bucket regains per second.
+			now: the current time.monotonic() time. Optional.
+		"""
+
+		self.capacity = capacity
+		self.rate = rate
+		self.tokens = capacity
+		self.updated = time.monotonic() if now is None else now
+
+	def refill(self, now=None):
+		"""
+		Add the tokens regained since the last update.
+
+		Args:
+			now: the current time.monotonic() time. Optional.
+		"""
+
+		if now is None:
+			now = time.monotonic()
+
+		elapsed = max(0.0, now - self.updated)
+		self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+		self.updated = now
+
+	def consume(self, tokens=1, now=None):
+		"""
+		Take tokens from the bucket, if it has enough.
+
+		Args:
+			tokens: the number of tokens to take.
+			now: the current time.monotonic() time. Optional.
+
+		Returns: True if the tokens were taken, or False if there weren't
+			enough, in which case none are taken.
+		"""
+
+		self.refill(now)
+		if self.tokens >= tokens:
+			self.tokens -= tokens
+			return True
+
+		return False
+
+	def delay(self, tokens=1, now=None):
+		"""
+		Return the number of seconds until the bucket will have enough tokens.
+
+		Args:
+			tokens: the number of tokens wanted.
+			now: the current time.monotonic() time. Optional.
+		"""
+
+		self.refill(now)
+		if self.tokens >= tokens:
+			return 0.0
+
+		return (tokens - self.tokens) / self.rate
+
+
+class KeyedLimiter:
+	"""
+	A token bucket for each of many keys, e.g. one for each user.
+
+	Buckets are only stored while they're in use. A bucket which has been idle
+	for long enough to refill completely is no different from a new one, so
+	such buckets are discarded, keeping memory bounded by the number of keys
+	used recently.
+
+	Attributes:
+		capacity: the maximum number of tokens each bucket can hold.
+		rate: the number of tokens each bucket regains per second.
+	"""
+
+	def __init__(self, capacity, rate):
+		self.capacity = capacity
+		self.rate = rate
+
+		# Keys mapped to (tokens, time.monotonic() time of last update) pairs,
+		# least recently updated first.
+		self._buckets = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._buckets)
+
+	def _available(self, key, now):
+		"""
+		Return the number of tokens in a key's bucket. Must hold the lock.
+		"""
+
+		bucket = self._buckets.get(key)
+		if bucket is None:
+			return self.capacity
+
+		available, updated = bucket
+		elapsed = max(0.0, now - updated)
+		return min(self.capacity, available + elapsed * self.rate)
+
+	def allows(self, key, tokens=1, now=None):
+		"""
+		Return whether a key's bucket has enough tokens, without taking any.
+
+		Args:
+			key: the key whose bucket to check.
+			tokens: the number of tokens wanted.
+			now: the current time.monotonic() time. Optional.
+		"""
+
+		if now is None:
+			now = time.monotonic()
+
+		with self._lock:
+			return self._available(key, now) >= tokens
+
+	def refund(self, key, tokens=1):
+		"""
+		Give back tokens taken from a key's bucket, up to its capacity.
+
+		Args:
+			key: the key whose bucket to give tokens to.
+			tokens: the number of tokens to give back.
+		"""
+
+		with self._lock:
+			bucket = self._buckets.get(key)
+			if bucket is not None:
+				available, updated = bucket
+				available = min(self.capacity, available + tokens)
+				self._buckets[key] = (available, updated)
+
+	def consume(self, key, tokens=1, now=None):
+		"""
+		Take tokens from a key's bucket, if it has enough.
+
+		Args:
+			key: the key whose bucket to take from.
+			tokens: the number of tokens to take.
+			now: the current time.monotonic() time. Optional.
+
+		Returns: True if the tokens were taken, or False if there weren't
+			enough, in which case none are taken.
+		"""
+
+		if now is None:
+			now = time.monotonic()
+
+		with self._lock:
+			self._expire(now)
+
+			available = self._available(key, now)
+			self._buckets.pop(key, None)
+
+			allowed = available >= tokens
+			if allowed:
+				available -= tokens
+
+			self._buckets[key] = (available, now)
+			return allowed
+
+	def _expire(self, now):
+		"""
+		Discard buckets which have refilled completely. Must hold the lock.
+		"""
+
+		# The longest that any bucket can take to refill.
+		refill_time = self.capacity / self.rate
+
+		while self._buckets:
+			key, (_, updated) = next(iter(self._buckets.items()))
+			if now - updated < refill_time:
+				break
+
+			del self._buckets[key]
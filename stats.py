@@ -0,0 +1,191 @@
+"""
+Module for recording latency statistics of handlers and commands.
+"""
+
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+
+class Histogram:
+	"""
+	A fixed-memory histogram of durations.
+
+	Durations are counted in logarithmically-sized buckets, so percentiles are
+	estimates, accurate to within one bucket's width (about 19%).
+
+	Attributes:
+		buckets: the number of recorded durations in each bucket.
+		count: the total number of recorded durations.
+		total: the sum of all recorded durations, in seconds.
+		max: the longest recorded duration, in seconds.
+	"""
+
+	# Durations up to this many seconds all fall into the first bucket.
+	MIN_SECS = 1e-6
+
+	# The number of buckets for every doubling of duration.
+	BUCKETS_PER_DOUBLING = 4
+
+	# The total number of buckets. Durations too long for the last bucket are
+	# counted in it anyway; with the above, that's over an hour.
+	NUM_BUCKETS = 128
+
+	def __init__(self):
+		self.buckets = [0] * self.NUM_BUCKETS
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def bucket_index(self, secs):
+		"""
+		Return the index of the bucket that the given duration falls into.
+		"""
+
+		if secs <= self.MIN_SECS:
+			return 0
+
+		ind = math.ceil(
+			math.log2(secs / self.MIN_SECS) * self.BUCKETS_PER_DOUBLING
+		)
+		return min(ind, self.NUM_BUCKETS - 1)
+
+	def bucket_bound(self, ind):
+		"""
+		Return the upper bound of the bucket at the given index, in seconds.
+		"""
+
+		return self.MIN_SECS * 2 ** (ind / self.BUCKETS_PER_DOUBLING)
+
+	def record(self, secs):
+		"""
+		Record a single duration.
+
+		Args:
+			secs: the duration to record, in seconds.
+		"""
+
+		self.buckets[self.bucket_index(secs)] += 1
+		self.count += 1
+		self.total += secs
+		if secs > self.max:
+			self.max = secs
+
+	def percentile(self, pct):
+		"""
+		Estimate the given percentile of the recorded durations.
+
+		Args:
+			pct: the percentile to estimate, from 0 to 100.
+
+		Returns: the estimated duration in seconds, or 0 if nothing has been
+			recorded.
+		"""
+
+		if not self.count:
+			return 0.0
+
+		# The rank of the duration that the percentile falls on.
+		rank = max(1, math.ceil(self.count * pct / 100))
+		seen = 0
+		for ind, num in enumerate(self.buckets):
+			seen += num
+			if seen >= rank:
+				return min(self.bucket_bound(ind), self.max)
+
+		return self.max
+
+	def summary(self):
+		"""
+		Return a dict summarising the recorded durations, in seconds.
+		"""
+
+		return {
+			"count": self.count,
+			"mean": self.total / self.count if self.count else 0.0,
+			"p50": self.percentile(50),
+			"p95": self.percentile(95),
+			"p99": self.percentile(99),
+			"max": self.max,
+		}
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def record(name, secs):
+	"""
+	Record a duration under the given name.
+
+	Args:
+		name: the name to record the duration under, e.g. "cmd.roll".
+		secs: the duration, in seconds.
+	"""
+
+	with _lock:
+		hist = _histograms.get(name)
+		if hist is None:
+			hist = _histograms[name] = Histogram()
+
+		hist.record(secs)
+
+
+@contextmanager
+def timed(name):
+	"""
+	Context manager which records how long its body takes to run.
+
+	The duration is recorded even if the body raises an exception.
+
+	Args:
+		name: the name to record the duration under.
+	"""
+
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		record(name, time.perf_counter() - start)
+
+
+def get_stats(prefix=""):
+	"""
+	Return summaries of recorded durations.
+
+	Args:
+		prefix: if given, only include names starting with this string.
+
+	Returns: a dict of names mapped to summaries, as from Histogram.summary().
+	"""
+
+	with _lock:
+		return {
+			name: hist.summary()
+			for name, hist in _histograms.items()
+			if name.startswith(prefix)
+		}
+
+
+def reset():
+	"""
+	Discard all recorded durations.
+	"""
+
+	with _lock:
+		_histograms.clear()
+
+
+def handler_name(handler):
+	"""
+	Return the name that a handler's durations are recorded under.
+
+	Args:
+		handler: the handler function.
+	"""
+
+	module = getattr(handler, "__module__", None)
+	name = getattr(handler, "__qualname__", None) or repr(handler)
+
+	return f"handler.{module}.{name}" if module else f"handler.{name}"
@@ -0,0 +1,178 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import time
+from unittest import TestCase
+
+import config
+
+# plugins.commands registers its command modules on import, so it needs a
+# commands config to exist first.
+config.configs.setdefault("commands", {"registered-cmd-pls": []})
+
+from caching import LRUCache, TTLCache
+from exceptions import CommandException
+from plugins.command_plugins import minecraft
+
+
+class FakeClock:
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+
+class CountingLoader:
+	def __init__(self, delay=0):
+		self.calls = 0
+		self.delay = delay
+
+	def __call__(self, key):
+		self.calls += 1
+		time.sleep(self.delay)
+		return f"{key}:{self.calls}"
+
+
+class TestTTLCache(TestCase):
+
+	def test_fresh_result_is_reused(self):
+		clock, loader = FakeClock(), CountingLoader()
+		cache = TTLCache(loader, ttl=10, clock=clock)
+		self.assertEqual(cache.get("a"), "a:1")
+		clock.now = 9
+		self.assertEqual(cache.get("a"), "a:1")
+		self.assertEqual(loader.calls, 1)
+
+	def test_expired_result_is_reloaded(self):
+		clock, loader = FakeClock(), CountingLoader()
+		cache = TTLCache(loader, ttl=10, clock=clock)
+		cache.get("a")
+		clock.now = 10
+		self.assertEqual(cache.get("a"), "a:2")
+
+	def test_stale_result_is_served_while_refreshing(self):
+		clock, loader = FakeClock(), CountingLoader(delay=0.05)
+		cache = TTLCache(loader, ttl=10, stale=10, clock=clock)
+		cache.get("a")
+		clock.now = 15
+		self.assertEqual(cache.get("a"), "a:1")
+		self.assertEqual(cache.get("a"), "a:1")
+		time.sleep(0.2)
+		self.assertEqual(cache.get("a"), "a:2")
+		self.assertEqual(loader.calls, 2)
+
+	def test_concurrent_misses_share_one_load(self):
+		loader = CountingLoader(delay=0.1)
+		cache = TTLCache(loader, ttl=10)
+		results = []
+		threads = [
+			threading.Thread(target=lambda: results.append(cache.get("a")))
+			for _ in range(5)
+		]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(results, ["a:1"] * 5)
+		self.assertEqual(loader.calls, 1)
+
+	def test_load_errors_propagate_and_are_not_cached(self):
+		calls = []
+		def failing(key):
+			calls.append(key)
+			raise OSError("unreachable")
+
+		cache = TTLCache(failing, ttl=10)
+		self.assertRaises(OSError, cache.get, "a")
+		self.assertRaises(OSError, cache.get, "a")
+		self.assertEqual(len(calls), 2)
+
+
+class TestLRUCache(TestCase):
+
+	def test_missing_key_gives_default(self):
+		cache = LRUCache()
+		self.assertIsNone(cache.get("a"))
+		self.assertEqual(cache.get("a", 1), 1)
+		self.assertEqual(cache.misses, 2)
+
+	def test_least_recently_used_is_discarded(self):
+		cache = LRUCache(maxsize=2)
+		cache.put("a", 1)
+		cache.put("b", 2)
+		cache.get("a")
+		cache.put("c", 3)
+		self.assertEqual(cache.get("a"), 1)
+		self.assertIsNone(cache.get("b"))
+		self.assertEqual(cache.get("c"), 3)
+		self.assertEqual(len(cache), 2)
+
+	def test_info(self):
+		cache = LRUCache(maxsize=3)
+		cache.put("a", 1)
+		cache.get("a")
+		cache.get("b")
+		self.assertEqual(
+			cache.info(),
+			{"hits": 1, "misses": 1, "size": 1, "maxsize": 3},
+		)
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+	requests = 0
+	delay = 0
+	statuses = [{"session.minecraft.net": "green"}, {"api.mojang.com": "red"}]
+
+	def do_GET(self):
+		type(self).requests += 1
+		time.sleep(self.delay)
+		body = json.dumps(self.statuses).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class TestMcstatus(TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.server = HTTPServer(("127.0.0.1", 0), StatusHandler)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.url = f"http://127.0.0.1:{cls.server.server_port}/check"
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+
+	def setUp(self):
+		StatusHandler.requests = 0
+		StatusHandler.delay = 0
+		config.configs["minecraft"] = {
+			"status-url": self.url,
+			"status-timeout": 0.5,
+		}
+		minecraft.configure_status_cache({"status-ttl": 60, "status-stale": 0})
+
+	def test_reports_down_servers(self):
+		self.assertEqual(minecraft.mcstatus(), "Possibly down: api.mojang.com")
+
+	def test_repeated_calls_use_cache(self):
+		minecraft.mcstatus()
+		minecraft.mcstatus()
+		minecraft.mcstatus()
+		self.assertEqual(StatusHandler.requests, 1)
+
+	def test_slow_upstream_times_out(self):
+		StatusHandler.delay = 1
+		self.assertRaises(CommandException, minecraft.mcstatus)
+
+	def test_unreachable_upstream_raises_command_exception(self):
+		config.configs["minecraft"]["status-url"] = "http://127.0.0.1:1/check"
+		self.assertRaises(CommandException, minecraft.mcstatus)
@@ -0,0 +1,314 @@
+from unittest import TestCase
+
+import config
+import cooldown
+import permissions
+
+# plugins.commands registers its command modules on import, so it needs a
+# commands config to exist first.
+config.configs.setdefault("commands", {"registered-cmd-pls": []})
+
+from exceptions import CommandException, UnknownCommandException
+from plugins import commands
+from plugins.commands import Command
+from ratelimit import KeyedLimiter
+
+
+@Command()
+def dispatch_test_cmd(*args):
+	return "dynamic"
+
+
+@Command(name="dispatch_test_shadowed")
+def dispatch_test_shadowing(*args):
+	return "dynamic shadow"
+
+
+com_conf = {
+	"statics-cooldown": 30,
+	"static-commands": {
+		"foo": "bar",
+		"dispatch_test_shadowed": "static shadow",
+	},
+	"aliases": {
+		"dispatch_test_cmd": ["dtc", "dt"],
+		"foo": ["fu"],
+		"nonexistent": ["nope"],
+	},
+}
+
+
+class TestDispatchTable(TestCase):
+
+	def setUp(self):
+		commands.load_dispatch_table(com_conf)
+
+	def test_dynamic_command_by_name(self):
+		cmd = commands.delegate_command("dispatch_test_cmd")
+		self.assertEqual(cmd(), "dynamic")
+
+	def test_alias_resolves_to_same_callable(self):
+		self.assertIs(
+			commands.delegate_command("dtc"),
+			commands.delegate_command("dispatch_test_cmd"),
+		)
+		self.assertIs(
+			commands.delegate_command("dt"),
+			commands.delegate_command("dispatch_test_cmd"),
+		)
+
+	def test_static_command_is_prebuilt(self):
+		cmd = commands.delegate_command("foo")
+		self.assertIs(cmd, commands.delegate_command("foo"))
+		self.assertIs(cmd, commands.delegate_command("fu"))
+		self.assertTrue(cmd.meta["static"])
+		self.assertEqual(cmd.meta["name"], "foo")
+		self.assertEqual(cmd.meta["cooldown"], 30)
+		self.assertEqual(cmd("ignored", "args"), "bar")
+		self.assertFalse(cmd.meta["pure"])
+		self.assertNotIn("foo", commands.pure_caches)
+
+	def test_dynamic_command_shadows_static(self):
+		cmd = commands.delegate_command("dispatch_test_shadowed")
+		self.assertEqual(cmd(), "dynamic shadow")
+
+	def test_unknown_command_raises(self):
+		self.assertRaises(
+			UnknownCommandException,
+			commands.delegate_command,
+			"absent",
+		)
+		self.assertRaises(
+			UnknownCommandException,
+			commands.delegate_command,
+			"nope",
+		)
+
+	def test_table_is_immutable(self):
+		table = commands.build_dispatch_table(com_conf)
+		with self.assertRaises(TypeError):
+			table["new"] = None
+
+	def test_registration_refreshes_table(self):
+		config.configs["commands"] = dict(
+			config.configs["commands"],
+			**com_conf,
+		)
+
+		@Command(name="dispatch_test_late")
+		def late():
+			return "late"
+
+		try:
+			self.assertEqual(
+				commands.delegate_command("dispatch_test_late")(),
+				"late",
+			)
+		finally:
+			commands.deregister_command("dispatch_test_late")
+
+		self.assertRaises(
+			UnknownCommandException,
+			commands.delegate_command,
+			"dispatch_test_late",
+		)
+
+
+pure_calls = []
+
+
+@Command(name="pure_test_cmd", pure=True, cache_size=2)
+def pure_test_cmd(*args):
+	pure_calls.append(args)
+	return " ".join(args)
+
+
+@Command(
+	name="pure_test_keyed",
+	pure=True,
+	cache_key=(lambda word: word.lower()),
+)
+def pure_test_keyed(word):
+	pure_calls.append(word)
+	return word.lower()
+
+
+class TestPureCommands(TestCase):
+
+	def setUp(self):
+		pure_calls.clear()
+		pure_test_cmd.cache.clear()
+		pure_test_keyed.cache.clear()
+
+	def test_repeated_calls_are_cached(self):
+		self.assertEqual(pure_test_cmd("a", "b"), "a b")
+		self.assertEqual(pure_test_cmd("a", "b"), "a b")
+		self.assertEqual(pure_calls, [("a", "b")])
+
+	def test_cache_is_bounded(self):
+		for args in ("a", "b", "c", "a"):
+			pure_test_cmd(args)
+		self.assertEqual(pure_calls, [("a",), ("b",), ("c",), ("a",)])
+		self.assertEqual(len(pure_test_cmd.cache), 2)
+
+	def test_cache_key_normalises_args(self):
+		pure_test_keyed("Foo")
+		self.assertEqual(pure_test_keyed("FOO"), "foo")
+		self.assertEqual(pure_calls, ["Foo"])
+
+	def test_cache_counts_hits_and_misses(self):
+		hits = pure_test_cmd.cache.hits
+		misses = pure_test_cmd.cache.misses
+		pure_test_cmd("x")
+		pure_test_cmd("x")
+		info = commands.pure_cache_info()["pure_test_cmd"]
+		self.assertEqual(info["hits"], hits + 1)
+		self.assertEqual(info["misses"], misses + 1)
+
+	def test_config_load_clears_cache(self):
+		pure_test_cmd("x")
+		commands.clear_pure_caches(None)
+		pure_test_cmd("x")
+		self.assertEqual(pure_calls, [("x",), ("x",)])
+
+	def test_pure_commands_cannot_be_passed_messages(self):
+		self.assertRaises(ValueError, Command, pure=True, pass_msg=True)
+
+
+class LimitedMessage:
+	
+	def __init__(self, sender, channel):
+		self.sender_id = sender
+		self.sender_name = None
+		self.channel_id = channel
+
+
+class TestRateLimits(TestCase):
+	
+	def setUp(self):
+		commands.load_rate_limiters({
+			"rate-limits": {
+				"user": {"capacity": 2, "refill": 0.001},
+				"channel": {"capacity": 3, "refill": 0.001},
+				"user-command": None,
+			},
+		})
+	
+	def tearDown(self):
+		commands.load_rate_limiters({})
+	
+	def test_unconfigured_limits_are_absent(self):
+		self.assertEqual(set(commands.rate_limiters), {"user", "channel"})
+		self.assertIsInstance(commands.rate_limiters["user"], KeyedLimiter)
+	
+	def test_user_limit(self):
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(1, None)))
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(1, None)))
+		self.assertFalse(commands.within_rate_limits(LimitedMessage(1, None)))
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(2, None)))
+	
+	def test_channel_limit(self):
+		for sender in range(3):
+			self.assertTrue(commands.within_rate_limits(LimitedMessage(sender, 9)))
+		self.assertFalse(commands.within_rate_limits(LimitedMessage(3, 9)))
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(3, 8)))
+	
+	def test_user_command_limit(self):
+		commands.load_rate_limiters({
+			"rate-limits": {"user-command": {"capacity": 1, "refill": 0.001}},
+		})
+		msg = LimitedMessage(1, None)
+		self.assertTrue(commands.within_rate_limits(msg, "roll"))
+		self.assertFalse(commands.within_rate_limits(msg, "roll"))
+		self.assertTrue(commands.within_rate_limits(msg, "flip"))
+	
+	def test_rejected_uses_take_no_tokens(self):
+		# Use up channel 9's limit with other senders.
+		for sender in range(3):
+			commands.within_rate_limits(LimitedMessage(sender, 9))
+		
+		for _ in range(3):
+			self.assertFalse(commands.within_rate_limits(LimitedMessage(5, 9)))
+		
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(5, 8)))
+		self.assertTrue(commands.within_rate_limits(LimitedMessage(5, 8)))
+	
+	def test_user_command_limit_is_checked_first(self):
+		commands.load_rate_limiters({
+			"rate-limits": {
+				"user": {"capacity": 2, "refill": 0.001},
+				"user-command": {"capacity": 1, "refill": 0.001},
+			},
+		})
+		msg = LimitedMessage(1, None)
+		self.assertTrue(commands.within_rate_limits(msg, "roll"))
+		self.assertFalse(commands.within_rate_limits(msg, "roll"))
+		self.assertTrue(commands.within_rate_limits(msg, "flip"))
+	
+	def test_bridged_players_are_limited_separately(self):
+		first = LimitedMessage(None, None)
+		first.sender_name = "Steve"
+		second = LimitedMessage(None, None)
+		second.sender_name = "Alex"
+		self.assertTrue(commands.within_rate_limits(first))
+		self.assertTrue(commands.within_rate_limits(first))
+		self.assertFalse(commands.within_rate_limits(first))
+		self.assertTrue(commands.within_rate_limits(second))
+	
+	def test_no_limits_configured(self):
+		commands.load_rate_limiters({"rate-limits": None})
+		for _ in range(10):
+			self.assertTrue(commands.within_rate_limits(LimitedMessage(1, 1)))
+
+
+@Command(name="cooldown_test_cmd", cooldown=30)
+def cooldown_test_cmd(*args):
+	if args:
+		raise CommandException("failed")
+	
+	return "ran"
+
+
+class CommandMessage(LimitedMessage):
+	
+	def __init__(self, text):
+		super().__init__(1, None)
+		self.sender_name = "Steve"
+		self.sender_group = "default"
+		self.text_content = text
+
+
+class TestCommandCooldowns(TestCase):
+	
+	def setUp(self):
+		self.old_conf = config.configs["commands"]
+		config.configs["commands"] = dict(com_conf, **{
+			"command-prefix": "!",
+			"err-unknown-cmd": False,
+			"prepend-name": False,
+			"prepend-exceptions": [],
+		})
+		commands.load_dispatch_table(config.configs["commands"])
+		commands.load_rate_limiters({})
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["cmd.*"]}}}
+		)
+		cooldown.clear()
+	
+	def tearDown(self):
+		config.configs["commands"] = self.old_conf
+		cooldown.clear()
+	
+	def run_cmd(self, text):
+		return commands.cmd_msg_handler(CommandMessage(text))
+	
+	def test_command_cools_down(self):
+		self.assertEqual(self.run_cmd("!cooldown_test_cmd"), "ran")
+		self.assertIsNone(self.run_cmd("!cooldown_test_cmd"))
+	
+	def test_failed_uses_do_not_cool_down(self):
+		self.assertEqual(
+			self.run_cmd("!cooldown_test_cmd x"),
+			"Steve: Error - failed",
+		)
+		self.assertEqual(self.run_cmd("!cooldown_test_cmd"), "ran")
@@ -0,0 +1,111 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import cooldown
+
+
+class FakeClock:
+	def __init__(self):
+		self.now = 1000.0
+	
+	def __call__(self):
+		return self.now
+
+
+class TestCooldown(TestCase):
+	
+	def setUp(self):
+		cooldown.clear()
+		self.clock = FakeClock()
+		patcher = patch.object(cooldown.time, "monotonic", self.clock)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+	
+	def test_unknown_key_has_cooled_down(self):
+		self.assertTrue(cooldown.has_cooled_down("absent"))
+	
+	def test_cooldown_expires(self):
+		cooldown.set_cooldown("a", 5)
+		self.assertFalse(cooldown.has_cooled_down("a"))
+		self.clock.now += 4.9
+		self.assertFalse(cooldown.has_cooled_down("a"))
+		self.clock.now += 0.1
+		self.assertTrue(cooldown.has_cooled_down("a"))
+	
+	def test_forever_cooldown_never_expires(self):
+		cooldown.set_cooldown("a", forever=True)
+		self.clock.now += 10 ** 9
+		self.assertFalse(cooldown.has_cooled_down("a"))
+		self.assertEqual(cooldown.size(), 1)
+	
+	def test_claim_cooldown(self):
+		self.assertTrue(cooldown.claim_cooldown("a", 5))
+		self.assertFalse(cooldown.has_cooled_down("a"))
+		self.assertFalse(cooldown.claim_cooldown("a", 1))
+		self.clock.now += 5
+		self.assertTrue(cooldown.claim_cooldown("a", 1))
+	
+	def test_forever_cooldown_cannot_be_claimed(self):
+		cooldown.set_cooldown("a", forever=True)
+		self.assertFalse(cooldown.claim_cooldown("a", 5))
+	
+	def test_concurrent_claims_succeed_once(self):
+		results = []
+		barrier = threading.Barrier(8)
+		
+		def claim():
+			barrier.wait()
+			results.append(cooldown.claim_cooldown("a", 5))
+		
+		threads = [threading.Thread(target=claim) for _ in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		
+		self.assertEqual(sorted(results), [False] * 7 + [True])
+	
+	def test_remove_cooldown(self):
+		cooldown.set_cooldown("a", 5)
+		cooldown.remove_cooldown("a")
+		cooldown.remove_cooldown("absent")
+		self.assertTrue(cooldown.has_cooled_down("a"))
+	
+	def test_resetting_cooldown_extends_it(self):
+		cooldown.set_cooldown("a", 5)
+		self.clock.now += 3
+		cooldown.set_cooldown("a", 5)
+		self.clock.now += 3
+		self.assertFalse(cooldown.has_cooled_down("a"))
+		self.assertEqual(cooldown.size(), 1)
+	
+	def test_expired_cooldowns_are_evicted(self):
+		for i in range(100):
+			cooldown.set_cooldown(f"regex.{i}", 1)
+		self.assertEqual(cooldown.size(), 100)
+		self.clock.now += 1
+		cooldown.set_cooldown("cmd.roll", 5)
+		self.assertEqual(cooldown.size(), 1)
+		self.assertEqual(list(cooldown._cooldowns), ["cmd.roll"])
+	
+	def test_keys_are_a_snapshot_of_live_cooldowns(self):
+		cooldown.set_cooldown("cmd.roll", 5)
+		cooldown.set_cooldown("cmds", forever=True)
+		cooldown.set_cooldown("regex.a", 1)
+		self.clock.now += 1
+		keys = cooldown.keys()
+		self.assertEqual(sorted(keys), ["cmd.roll", "cmds"])
+		
+		# Changing the cooldowns doesn't change the snapshot.
+		for key in keys:
+			cooldown.remove_cooldown(key)
+			cooldown.set_cooldown(key + ".new", 5)
+		self.assertEqual(sorted(keys), ["cmd.roll", "cmds"])
+	
+	def test_stale_expiries_are_bounded(self):
+		for _ in range(1000):
+			cooldown.set_cooldown("a", 60)
+			self.clock.now += 0.01
+		self.assertLess(len(cooldown._expiries), 100)
+		self.assertFalse(cooldown.has_cooled_down("a"))
@@ -1,5 +1,8 @@
+import asyncio
+import threading
 from unittest import TestCase
 
+import config
 from handlers import MessageHandler, ConfigLoadHandler
 
 def nothing(_):
@@ -64,6 +67,195 @@ class TestMessageHandler(TestCase):
 		self.assertEqual(self.swap_msg.swapcase(), self.fire(self.swap_msg))
 	
 
+async def async_msg_quack(msg):
+	await asyncio.sleep(0)
+	return msg_quack(msg)
+
+handler_threads = []
+def blocking_record_thread(msg):
+	handler_threads.append(threading.current_thread())
+
+
+class TestAsyncMessageHandler(TestCase):
+	quack_msg = "quackisquack"
+	noquack_msg = "noquack"
+	
+	def setUp(self):
+		MessageHandler.handlers.clear()
+		handler_threads.clear()
+	
+	def fire(self, msg):
+		loop = asyncio.new_event_loop()
+		try:
+			return loop.run_until_complete(
+				MessageHandler.fire_handlers_async(msg),
+			)
+		finally:
+			loop.close()
+	
+	def test_decorator_with_options_does_not_change_object(self):
+		self.assertIs(
+			blocking_record_thread,
+			MessageHandler(blocking=True)(blocking_record_thread),
+		)
+		self.assertIn(blocking_record_thread, MessageHandler.handlers)
+	
+	def test_coroutine_handler_gives_resp(self):
+		MessageHandler(async_msg_quack)
+		self.assertIsNone(self.fire(self.noquack_msg))
+		self.assertEqual(quack, self.fire(self.quack_msg))
+	
+	def test_sync_fire_runs_coroutine_handler(self):
+		MessageHandler(async_msg_quack)
+		self.assertEqual(quack, MessageHandler.fire_handlers(self.quack_msg))
+	
+	def test_blocking_handler_runs_off_loop_thread(self):
+		MessageHandler(blocking=True)(blocking_record_thread)
+		self.assertIsNone(self.fire(self.quack_msg))
+		self.assertEqual(len(handler_threads), 1)
+		self.assertIsNot(handler_threads[0], threading.current_thread())
+	
+	def test_nonblocking_handler_runs_on_loop_thread(self):
+		MessageHandler(blocking_record_thread)
+		self.fire(self.quack_msg)
+		self.assertIs(handler_threads[0], threading.current_thread())
+	
+	def test_resp_short_circuits_later_handlers(self):
+		MessageHandler(async_msg_quack)
+		MessageHandler(blocking=True)(blocking_record_thread)
+		MessageHandler(msg_swap_case)
+		self.assertEqual(quack, self.fire(self.quack_msg))
+		self.assertEqual(handler_threads, [])
+		self.assertEqual(
+			self.noquack_msg.swapcase(),
+			self.fire(self.noquack_msg),
+		)
+		self.assertEqual(len(handler_threads), 1)
+
+
+class RoutedMsg:
+	def __init__(self, text, sender_name="user", sender_group=None):
+		self.text_content = text
+		self.sender_id = None
+		self.sender_name = sender_name
+		self.sender_group = sender_group
+
+fired = []
+def record_fired(name, resp=None):
+	def handler(msg):
+		fired.append(name)
+		return resp
+	return handler
+
+def bridge_rewrite(msg):
+	fired.append("bridge")
+	msg.sender_name, msg.text_content = msg.text_content.split(": ", 1)
+
+
+class TestRoutedMessageHandler(TestCase):
+	fire = MessageHandler.fire_handlers
+	
+	def setUp(self):
+		MessageHandler.handlers.clear()
+		fired.clear()
+	
+	def test_prefix_criterion(self):
+		MessageHandler(prefix="!")(record_fired("cmd"))
+		MessageHandler(record_fired("all"))
+		self.fire(RoutedMsg("hello"))
+		self.assertEqual(fired, ["all"])
+		fired.clear()
+		self.fire(RoutedMsg("!roll"))
+		self.assertEqual(fired, ["cmd", "all"])
+	
+	def test_multiple_prefixes(self):
+		MessageHandler(prefix=["!", "?"])(record_fired("cmd"))
+		self.fire(RoutedMsg("?roll"))
+		self.fire(RoutedMsg("!roll"))
+		self.fire(RoutedMsg(".roll"))
+		self.assertEqual(fired, ["cmd", "cmd"])
+	
+	def test_sender_and_group_criteria(self):
+		MessageHandler(sender="bridge")(record_fired("sender"))
+		MessageHandler(group=("staff", "devs"))(record_fired("group"))
+		self.fire(RoutedMsg("hi", sender_name="bridge"))
+		self.fire(RoutedMsg("hi", sender_group="devs"))
+		self.fire(RoutedMsg("hi", sender_group="default"))
+		self.assertEqual(fired, ["sender", "group"])
+	
+	def test_all_criteria_must_match(self):
+		MessageHandler(sender="bridge", prefix="!")(record_fired("both"))
+		self.fire(RoutedMsg("!hi", sender_name="someone"))
+		self.fire(RoutedMsg("hi", sender_name="bridge"))
+		self.assertEqual(fired, [])
+		self.fire(RoutedMsg("!hi", sender_name="bridge"))
+		self.assertEqual(fired, ["both"])
+	
+	def test_order_and_short_circuit_preserved(self):
+		MessageHandler(record_fired("first"))
+		MessageHandler(prefix="!")(record_fired("cmd", "resp"))
+		MessageHandler(record_fired("last"))
+		self.assertEqual(self.fire(RoutedMsg("!roll")), "resp")
+		self.assertEqual(fired, ["first", "cmd"])
+	
+	def test_callable_criteria_resolve_after_reroute(self):
+		prefix = ["!"]
+		MessageHandler(prefix=lambda: prefix[0])(record_fired("cmd"))
+		self.fire(RoutedMsg("?roll"))
+		self.assertEqual(fired, [])
+		prefix[0] = "?"
+		MessageHandler.reroute()
+		self.fire(RoutedMsg("?roll"))
+		self.assertEqual(fired, ["cmd"])
+	
+	def test_config_is_stored_before_rerouting(self):
+		config.configs["routetest"] = {"prefix": "!"}
+		self.addCleanup(config.configs.pop, "routetest")
+		MessageHandler(
+			prefix=lambda: config.configs["routetest"]["prefix"],
+		)(record_fired("cmd"))
+		
+		# A message routed once the new config's handlers have all been fired,
+		#   but before it's stored.
+		def route_during_load(_):
+			self.fire(RoutedMsg("?roll"))
+		
+		ConfigLoadHandler(ConfigLoadHandler.ANY_CONF)(route_during_load)
+		self.addCleanup(
+			ConfigLoadHandler.handlers[ConfigLoadHandler.ANY_CONF].remove,
+			route_during_load,
+		)
+		
+		config.apply_config("routetest", {"prefix": "?"})
+		self.assertEqual(fired, [])
+		self.fire(RoutedMsg("?roll"))
+		self.assertEqual(fired, ["cmd"])
+	
+	def test_routes_rerouted_while_built_are_not_kept(self):
+		def rerouting_prefix():
+			# As if a config was reloaded in another thread meanwhile.
+			MessageHandler.reroute()
+			return "!"
+		
+		MessageHandler(prefix=rerouting_prefix)(record_fired("cmd"))
+		self.fire(RoutedMsg("!roll"))
+		self.assertEqual(fired, ["cmd"])
+		self.assertIsNone(MessageHandler._routes)
+	
+	def test_rewritten_message_is_rerouted(self):
+		MessageHandler(sender="bridge")(bridge_rewrite)
+		MessageHandler(prefix="!")(record_fired("cmd"))
+		self.fire(RoutedMsg("player: !roll", sender_name="bridge"))
+		self.assertEqual(fired, ["bridge", "cmd"])
+	
+	def test_unknown_criterion_raises(self):
+		self.assertRaises(
+			TypeError,
+			MessageHandler(colour="blue"),
+			record_fired("never"),
+		)
+
+
 def cl_val_data(new_conf):
 	if "badkey" in new_conf:
 		raise Exception("There's a badkey.")
@@ -0,0 +1,120 @@
+from unittest import TestCase
+
+import permissions
+from plugins import minecraft
+
+FORM = r"^<\[(?P<RANK>\w+)\]-?(?P<NAME>[^>]+)>(?P<MESSAGE>.*)$"
+
+
+class BridgeMessage:
+	
+	def __init__(self, text, sender_name, sender_id=None):
+		self.text_content = text
+		self.sender_name = sender_name
+		self.sender_id = sender_id
+		self.sender_group = None
+
+
+class TestBridges(TestCase):
+	
+	def setUp(self):
+		minecraft.compile_bridges({
+			"mc-bridge-name": "MCBot",
+			"mc-bridge-form": FORM,
+			"perm-groups": {"staff": ["Mod", "Admin"], "devs": ["Admin"]},
+		})
+	
+	def translate(self, text, sender="MCBot"):
+		msg = BridgeMessage(text, sender)
+		minecraft.mc_msg_handler(msg)
+		return msg.sender_name, msg.text_content, msg.sender_group
+	
+	def test_single_bridge_settings(self):
+		self.assertEqual(minecraft.bridge_names(), ["MCBot"])
+		self.assertEqual(
+			self.translate("<[Mod]Steve>!roll"),
+			("Steve", "!roll", "staff"),
+		)
+	
+	def test_first_listed_group_wins(self):
+		self.assertEqual(self.translate("<[Admin]Alex>hi")[2], "staff")
+	
+	def test_unknown_rank_keeps_group(self):
+		self.assertEqual(
+			self.translate("<[Guest]Alex>hi"),
+			("Alex", "hi", None),
+		)
+	
+	def test_other_senders_are_ignored(self):
+		self.assertEqual(
+			self.translate("<[Mod]Steve>hi", sender="Steve"),
+			("Steve", "<[Mod]Steve>hi", None),
+		)
+	
+	def test_unmatched_messages_are_unchanged(self):
+		self.assertEqual(
+			self.translate("server restarting"),
+			("MCBot", "server restarting", None),
+		)
+	
+	def test_bridged_players_are_not_the_bridge(self):
+		msg = BridgeMessage("<[Mod]Steve>!roll", "MCBot", sender_id=1234)
+		minecraft.compile_bridges({
+			"mc-bridge-name": 1234,
+			"mc-bridge-form": FORM,
+		})
+		minecraft.mc_msg_handler(msg)
+		self.assertIsNone(msg.sender_id)
+		self.assertEqual(msg.sender_name, "Steve")
+	
+	def test_bridged_players_lack_the_bridges_own_perms(self):
+		permissions.construct_perm_tries({
+			"groups": {"default": {"perms": []}},
+			"users": {1234: {"perms": ["cmd.ban"]}},
+		})
+		minecraft.compile_bridges({
+			"mc-bridge-name": 1234,
+			"mc-bridge-form": FORM,
+		})
+		msg = BridgeMessage("<[Guest]Steve>!ban Alex", "MCBot", sender_id=1234)
+		minecraft.mc_msg_handler(msg)
+		self.assertFalse(
+			permissions.user_has_perm(msg.sender_id, "default", "cmd.ban")
+		)
+	
+	def test_reloads_replace_bridges_whole(self):
+		# The bridges a message is being handled with, when a reload starts.
+		bridges = minecraft._bridges[0]
+		minecraft.compile_bridges({
+			"mc-bridge-name": "OtherBot",
+			"mc-bridge-form": FORM,
+		})
+		self.assertEqual(list(bridges), ["MCBot"])
+		self.assertEqual(minecraft.bridge_names(), ["OtherBot"])
+	
+	def test_several_bridges(self):
+		minecraft.compile_bridges({
+			"bridges": [
+				{
+					"name": "MCBot",
+					"form": FORM,
+					"perm-groups": {"staff": ["Mod"]},
+				},
+				{
+					"name": "OtherBot",
+					"form": r"^(?P<NAME>\w+): (?P<MESSAGE>.*)$",
+				},
+			],
+		})
+		self.assertEqual(
+			sorted(minecraft.bridge_names()),
+			["MCBot", "OtherBot"],
+		)
+		self.assertEqual(
+			self.translate("<[Mod]Steve>hi"),
+			("Steve", "hi", "staff"),
+		)
+		self.assertEqual(
+			self.translate("Alex: hello", sender="OtherBot"),
+			("Alex", "hello", None),
+		)
@@ -1,6 +1,16 @@
+from copy import deepcopy
+from itertools import product
+import random
 from unittest import TestCase
 import yaml
 
+from benchmarks.perms import (
+	flatten_perms,
+	fuzz,
+	make_config,
+	reference_decision,
+	reference_groups,
+)
 import permissions
 from permissions import PermNode
 
@@ -154,6 +164,116 @@ class TestPermTrie(TestCase):
 		
 		lower.merge(higher)
 		self.assertTrue(lower.has_perm("a.absent"))
+	
+	def test_nodes_are_compact(self):
+		trie = PermNode.new()
+		trie.add_perm("".join(["c", "md"]) + ".roll")
+		other = PermNode.new()
+		other.add_perm("cmd.flip")
+		
+		self.assertFalse(hasattr(trie, "__dict__"))
+		self.assertIs(
+			next(iter(trie.children)),
+			next(iter(other.children)),
+		)
+		self.assertIs(
+			trie.children["cmd"].children["roll"].children,
+			other.children["cmd"].children["flip"].children,
+		)
+		with self.assertRaises(TypeError):
+			trie.children["cmd"].children["roll"].children["a"] = PermNode("a")
+	
+	def test_merge_with_offset(self):
+		trie = PermNode.new()
+		trie.add_perm("a.b")
+		other = PermNode.new()
+		other.add_perm("-a.*")
+		other.add_perm("c.d")
+		
+		offset_copy = PermNode.new()
+		offset_copy.merge(other)
+		offset_copy.increment_group_lvl()
+		
+		trie.merge(other, lvl_offset=1)
+		manual_trie = PermNode(
+			root=True,
+			children={
+				"a": PermNode(
+					"a",
+					tvalue=False,
+					wildcard=True,
+					children={"b": PermNode("b", tvalue=True)},
+				),
+				"c": PermNode(
+					"c",
+					group_lvl=1,
+					children={"d": PermNode("d", tvalue=True, group_lvl=1)},
+				),
+			},
+		)
+		
+		self.assertEqual(trie, manual_trie)
+		self.assertEqual(
+			offset_copy,
+			PermNode(
+				root=True,
+				group_lvl=1,
+				children={
+					"a": PermNode("a", tvalue=False, wildcard=True, group_lvl=1),
+					"c": PermNode(
+						"c",
+						group_lvl=1,
+						children={
+							"d": PermNode("d", tvalue=True, group_lvl=1),
+						},
+					),
+				},
+			),
+		)
+	
+	def test_merge_shares_and_preserves_other(self):
+		trie = PermNode.new()
+		trie.add_perm("a.b")
+		other = PermNode.new()
+		other.add_perm("a.c")
+		other.add_perm("d.e.f")
+		
+		expected = PermNode.new()
+		expected.add_perm("a.c")
+		expected.add_perm("d.e.f")
+		
+		trie.merge(other)
+		self.assertEqual(other, expected)
+		self.assertIs(trie.children["d"], other.children["d"])
+		
+		inheriting = PermNode.new()
+		inheriting.add_perm("a.b")
+		inheriting.merge(other, lvl_offset=1)
+		self.assertEqual(other, expected)
+		self.assertIs(
+			inheriting.children["d"].children,
+			other.children["d"].children,
+		)
+	
+	def test_add_perm_copies_shared_nodes(self):
+		shared = PermNode.new()
+		shared.add_perm("a.b")
+		shared.add_perm("d.e")
+		expected = PermNode.new()
+		expected.add_perm("a.b")
+		expected.add_perm("d.e")
+		
+		trie = shared.copy()
+		owned = {id(trie)}
+		trie.add_perm("-a.c", owned=owned)
+		trie.add_perm("a.b.*", owned=owned)
+		
+		self.assertEqual(shared, expected)
+		self.assertIs(trie.children["d"], shared.children["d"])
+		self.assertIsNot(trie.children["a"], shared.children["a"])
+		self.assertFalse(trie.has_perm("a.c"))
+		self.assertTrue(trie.has_perm("a.b.x"))
+		self.assertFalse(shared.has_perm("a.b.x"))
 		
 
 class TestGroupPermissions(TestCase):
@@ -221,6 +341,476 @@ class TestGroupPermissions(TestCase):
 		self.assertNotGHP("mod", "baz.absent")
 
 
+class TestPermGroupOrder(TestCase):
+	
+	def test_groups_follow_inherited_groups(self):
+		groups = {
+			"c": {"inherit": ["b", "a"]},
+			"b": {"inherit": ["a"]},
+			"a": {},
+		}
+		order = permissions.order_perm_groups(groups)
+		self.assertEqual(order, ["a", "b", "c"])
+	
+	def test_deep_chain_does_not_recurse(self):
+		groups = {"g0": {"perms": ["a.*", "-a.b"]}}
+		for i in range(1, 5000):
+			groups[f"g{i}"] = {"inherit": [f"g{i - 1}"]}
+		groups["g4999"]["perms"] = ["a.b"]
+		
+		permissions.construct_perm_tries({"groups": groups})
+		self.assertTrue(permissions.group_has_perm("g4998", "a.c"))
+		self.assertFalse(permissions.group_has_perm("g4998", "a.b"))
+		self.assertTrue(permissions.group_has_perm("g4999", "a.b"))
+	
+	def test_every_problem_is_reported(self):
+		groups = {
+			"a": {"inherit": ["b"]},
+			"b": {"inherit": ["a"]},
+			"c": {"inherit": ["c", "missing"]},
+			"d": {"inherit": ["a", "gone"]},
+			"e": {"inherit": ["f"]},
+			"f": {"inherit": ["g"]},
+			"g": {"inherit": ["e"]},
+		}
+		with self.assertRaises(Exception) as cm:
+			permissions.order_perm_groups(groups)
+		
+		problems = str(cm.exception).splitlines()
+		self.assertEqual(
+			sorted(problems),
+			sorted([
+				"Permission group 'c' inherits from nonexistent group "
+				+ "'missing'.",
+				"Permission group 'd' inherits from nonexistent group 'gone'.",
+				"Permission inheritance loop including groups 'a', 'b'.",
+				"Permission inheritance loop including groups 'c'.",
+				"Permission inheritance loop including groups 'e', 'f', 'g'.",
+			]),
+		)
+	
+	def test_reload_keeps_unchanged_groups(self):
+		conf = yaml.load(fixture, Loader=yaml.FullLoader)
+		permissions.construct_perm_tries(conf)
+		old = dict(permissions.perm_groups)
+		
+		conf = yaml.load(fixture, Loader=yaml.FullLoader)
+		conf["groups"]["mod"]["perms"].append("new.perm")
+		permissions.construct_perm_tries(conf)
+		
+		for group in ["default", "dev", "muted", "nocmds"]:
+			self.assertIs(permissions.perm_groups[group], old[group])
+		for group in ["mod", "admin"]:
+			self.assertIsNot(permissions.perm_groups[group], old[group])
+		self.assertTrue(permissions.group_has_perm("admin", "new.perm"))
+
+
+class TestDecisionCache(TestCase):
+	
+	def setUp(self):
+		permissions.construct_perm_tries(
+			yaml.load(fixture, Loader=yaml.FullLoader)
+		)
+	
+	def test_repeated_checks_are_cached(self):
+		hits = permissions.decision_cache.hits
+		permissions.group_has_perm("default", "cmd.roll")
+		permissions.group_has_perm("default", "cmd.roll")
+		self.assertEqual(permissions.decision_cache.hits, hits + 1)
+	
+	def test_reload_invalidates_decisions(self):
+		self.assertTrue(permissions.group_has_perm("default", "cmd.roll"))
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["-cmd.*"]}}}
+		)
+		self.assertFalse(permissions.group_has_perm("default", "cmd.roll"))
+	
+	def test_decisions_from_before_a_reload_are_not_used(self):
+		# A check which started before the reload, and caches its decision
+		#   after it, caches it under the old generation.
+		generation = permissions.cache_generation[0]
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["-cmd.*"]}}}
+		)
+		key = (generation, "default", "cmd.roll")
+		permissions.decision_cache.put(key, True)
+		self.assertFalse(permissions.group_has_perm("default", "cmd.roll"))
+	
+	def test_reload_updates_tries_in_place(self):
+		tries = permissions.perm_groups
+		compiled = permissions.compiled_groups
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["-cmd.*"]}}}
+		)
+		self.assertIs(permissions.perm_groups, tries)
+		self.assertIs(permissions.compiled_groups, compiled)
+		self.assertEqual(set(permissions.perm_groups), {"default"})
+	
+	def test_tries_are_compiled_when_checked(self):
+		self.assertNotIn("mod", permissions.compiled_groups)
+		permissions.group_has_perm("mod", "cmd.kick")
+		compiled = permissions.compiled_groups["mod"]
+		self.assertIs(permissions.compile_group("mod"), compiled)
+		self.assertIsNone(permissions.compile_group("absent"))
+	
+	def test_unchanged_groups_keep_compiled_tries(self):
+		permissions.group_has_perm("default", "cmd.roll")
+		compiled = permissions.compiled_groups["default"]
+		conf = yaml.load(fixture, Loader=yaml.FullLoader)
+		conf["groups"]["mod"]["perms"].append("new.perm")
+		permissions.construct_perm_tries(conf)
+		self.assertIs(permissions.compiled_groups["default"], compiled)
+		self.assertNotIn("mod", permissions.compiled_groups)
+	
+	def test_unknown_groups_are_denied(self):
+		self.assertFalse(permissions.group_has_perm("absent", "cmd.roll"))
+		self.assertFalse(permissions.group_has_perm("absent", "cmd.roll"))
+	
+	def test_cache_is_bounded(self):
+		for i in range(permissions.decision_cache.maxsize + 10):
+			permissions.group_has_perm("default", f"absent.{i}")
+		self.assertEqual(
+			len(permissions.decision_cache),
+			permissions.decision_cache.maxsize,
+		)
+
+
+class TestUserPermissions(TestCase):
+	
+	def setUp(self):
+		conf = yaml.load(fixture, Loader=yaml.FullLoader)
+		conf["users"] = {
+			1: {"perms": ["cmd.kick", "-fred"]},
+			2: {"perms": ["-*"]},
+		}
+		permissions.construct_perm_tries(conf)
+	
+	def test_user_perms_override_group(self):
+		self.assertTrue(permissions.user_has_perm(1, "default", "cmd.kick"))
+		self.assertFalse(permissions.user_has_perm(1, "default", "fred"))
+		self.assertTrue(permissions.user_has_perm(1, "default", "baz.bork"))
+		self.assertFalse(permissions.user_has_perm(2, "dev", "anything"))
+	
+	def test_users_without_overrides_use_group(self):
+		self.assertFalse(permissions.user_has_perm(3, "default", "cmd.kick"))
+		self.assertFalse(permissions.user_has_perm(None, None, "cmd.kick"))
+		self.assertTrue(permissions.user_has_perm(None, "mod", "cmd.kick"))
+		self.assertEqual(len(permissions.user_views), 0)
+	
+	def test_views_are_cached_per_user_and_group(self):
+		permissions.user_has_perm(1, "default", "fred")
+		key = (permissions.cache_generation[0], 1, "default")
+		view = permissions.user_views.get(key)
+		permissions.user_has_perm(1, "default", "thud")
+		permissions.user_has_perm(1, "mod", "thud")
+		self.assertIs(permissions.user_views.get(key), view)
+		self.assertEqual(len(permissions.user_views), 2)
+	
+	def test_reload_drops_overrides(self):
+		permissions.user_has_perm(1, "default", "fred")
+		permissions.construct_perm_tries(
+			yaml.load(fixture, Loader=yaml.FullLoader)
+		)
+		self.assertEqual(len(permissions.user_views), 0)
+		self.assertTrue(permissions.user_has_perm(1, "default", "fred"))
+
+
+def random_perm(rng, segments="abc"):
+	perm = ".".join(
+		rng.choice(segments)
+		for _ in range(rng.randint(1, 3))
+	)
+	
+	if rng.random() < 0.3:
+		perm = "*" if rng.random() < 0.1 else perm + ".*"
+	
+	if rng.random() < 0.3:
+		perm = "-" + perm
+	
+	return perm
+
+
+def random_groups(rng, count=6):
+	groups = {}
+	for i in range(count):
+		groups[f"g{i}"] = {
+			"perms": [random_perm(rng) for _ in range(rng.randint(0, 8))],
+			# Only inherit from earlier groups, so there are no cycles.
+			"inherit": rng.sample(
+				[f"g{j}" for j in range(i)],
+				rng.randint(0, min(i, 3)),
+			),
+		}
+	
+	return {"groups": groups}
+
+
+def all_perms(segments="abcz", depth=4):
+	for length in range(1, depth + 1):
+		for path in product(segments, repeat=length):
+			yield ".".join(path)
+
+
+class TestCompiledPerms(TestCase):
+	
+	def assertEquivalent(self, trie):
+		compiled = trie.compile()
+		for perm in all_perms():
+			self.assertEqual(
+				compiled.has_perm(perm),
+				trie.has_perm(perm),
+				msg=f"Compiled trie disagrees on '{perm}'.",
+			)
+	
+	def test_fixture_groups(self):
+		permissions.construct_perm_tries(
+			yaml.load(fixture, Loader=yaml.FullLoader)
+		)
+		for group, trie in permissions.perm_groups.items():
+			compiled = permissions.compile_group(group)
+			for perm in list(all_perms("abcdfgijk", 3)) + [
+				"cmd.kick", "cmd.absent", "regex.trigger", "fred", "thud",
+				"baz.bork", "foo.bar", "foo.absent", "l.a.b", "absent",
+			]:
+				self.assertEqual(compiled.has_perm(perm), trie.has_perm(perm))
+	
+	def test_random_tries(self):
+		rng = random.Random(12)
+		for _ in range(50):
+			trie = PermNode.new()
+			for _ in range(rng.randint(0, 12)):
+				trie.add_perm(random_perm(rng), group_lvl=rng.randint(0, 2))
+			self.assertEquivalent(trie)
+	
+	def test_random_inherited_groups(self):
+		rng = random.Random(34)
+		for _ in range(20):
+			permissions.construct_perm_tries(random_groups(rng))
+			for trie in permissions.perm_groups.values():
+				self.assertEquivalent(trie)
+	
+	def test_inherited_tries_are_unchanged(self):
+		rng = random.Random(56)
+		for _ in range(20):
+			conf = random_groups(rng)
+			permissions.construct_perm_tries(conf)
+			
+			for group, group_conf in conf["groups"].items():
+				own = PermNode.new()
+				for perm in group_conf.get("perms", []):
+					own.add_perm(perm)
+				
+				if not group_conf.get("inherit"):
+					self.assertEqual(permissions.perm_groups[group], own)
+	
+	def test_bulk_checks_match_single_checks(self):
+		rng = random.Random(78)
+		perms = list(all_perms())
+		for _ in range(50):
+			trie = PermNode.new()
+			for _ in range(rng.randint(0, 12)):
+				trie.add_perm(random_perm(rng), group_lvl=rng.randint(0, 2))
+			
+			rng.shuffle(perms)
+			self.assertEqual(
+				trie.has_perms(perms),
+				{perm: trie.has_perm(perm) for perm in perms},
+			)
+	
+	def test_group_bulk_checks(self):
+		permissions.construct_perm_tries(
+			yaml.load(fixture, Loader=yaml.FullLoader)
+		)
+		perms = ["cmd.kick", "cmd.absent", "foo.bar", "a.b.c", "a.b", "a"]
+		for group in ["default", "mod", "admin", "absent", None]:
+			self.assertEqual(
+				permissions.group_has_perms(group, perms),
+				{
+					perm: permissions.group_has_perm(group, perm)
+					for perm in perms
+				},
+			)
+	
+	def test_fuzz_synthetic_configs(self):
+		self.assertEqual(fuzz(iterations=30, seed=100), [])
+	
+	def test_reference_model(self):
+		conf = yaml.load(fixture, Loader=yaml.FullLoader)
+		flats = reference_groups(conf["groups"])
+		for group, perm, expected in [
+			("default", "cmd.roll", True),
+			("default", "cmd.kick", False),
+			("default", "a.b.c", True),
+			("default", "a.b.x", False),
+			("default", "absent", False),
+			("mod", "cmd.kick", True),
+			("mod", "regex.trigger", False),
+		]:
+			self.assertEqual(
+				reference_decision(flats[group], perm),
+				expected,
+				msg=f"Reference model disagrees on '{perm}' for '{group}'.",
+			)
+		
+		user = flatten_perms(["cmd.kick", "-a.*"], [flats["default"]])
+		self.assertTrue(reference_decision(user, "cmd.kick"))
+		self.assertFalse(reference_decision(user, "a.b.c"))
+		self.assertTrue(reference_decision(user, "cmd.roll"))
+	
+	def test_compiling_non_root_raises(self):
+		self.assertRaises(Exception, PermNode("a").compile)
+
+
+class BaselineNode:
+	"""
+	A perm trie node as it was before tries shared inherited subtrees, when
+	every inherited trie was deep copied and had its group levels rewritten.
+	"""
+	
+	def __init__(self, name="", group_lvl=0):
+		self.name = name
+		self.tvalue = None
+		self.wildcard = None
+		self.children = {}
+		self.group_lvl = group_lvl
+	
+	def add_perm(self, perm):
+		tvalue = not perm.startswith("-")
+		if not tvalue:
+			perm = perm[1:]
+		
+		cur = self
+		for name in perm.split("."):
+			if name == "*":
+				cur.wildcard = True
+				break
+			
+			if name not in cur.children:
+				cur.children[name] = BaselineNode(name)
+			else:
+				cur.children[name].group_lvl = min(
+					cur.children[name].group_lvl,
+					0,
+				)
+			
+			cur = cur.children[name]
+		
+		cur.tvalue = tvalue
+	
+	def merge(self, other):
+		use_other_tvalue = (
+			self.tvalue is None
+			or (
+				other.tvalue is not None
+				and self.group_lvl > other.group_lvl
+			)
+		)
+		if use_other_tvalue:
+			self.tvalue = other.tvalue
+		
+		self.wildcard = self.wildcard or other.wildcard
+		
+		for name in other.children:
+			if name in self.children:
+				self.children[name].merge(other.children[name])
+			else:
+				self.children[name] = other.children[name]
+	
+	def increment_group_lvl(self):
+		self.group_lvl += 1
+		for node in self.children.values():
+			node.increment_group_lvl()
+	
+	def has_perm(self, perm):
+		max_pri = (float("-inf"), float("-inf"), False)
+		cur = self
+		level = 0
+		for name in perm.split("."):
+			if cur.wildcard:
+				max_pri = max(max_pri, (-cur.group_lvl, level, cur.tvalue))
+			
+			if name in cur.children:
+				level += 1
+				cur = cur.children[name]
+			else:
+				break
+		
+		else:
+			if cur.tvalue is not None:
+				max_pri = max(max_pri, (-cur.group_lvl, level, cur.tvalue))
+		
+		return max_pri[2]
+
+
+def baseline_tries(groups_conf):
+	tries = {}
+	for group in permissions.order_perm_groups(groups_conf):
+		trie = tries[group] = BaselineNode()
+		for perm in groups_conf[group].get("perms", []):
+			trie.add_perm(perm)
+		
+		for inh in groups_conf[group].get("inherit", []):
+			inherited = deepcopy(tries[inh])
+			inherited.increment_group_lvl()
+			trie.merge(inherited)
+	
+	return tries
+
+
+def flatten(node, offset=0, path=""):
+	"""
+	Map the paths of a trie's nodes to their values and effective levels.
+	"""
+	
+	offset += getattr(node, "lvl_offset", 0)
+	flat = {path: (node.tvalue, bool(node.wildcard), offset + node.group_lvl)}
+	for name, child in node.children.items():
+		flat.update(flatten(child, offset, f"{path}.{name}"))
+	
+	return flat
+
+
+class TestSharedInheritance(TestCase):
+	
+	def assertMatchesBaseline(self, conf):
+		permissions.construct_perm_tries(conf)
+		baseline = baseline_tries(conf["groups"])
+		perms = list(all_perms("abcz", 3))
+		for group, trie in baseline.items():
+			self.assertEqual(
+				flatten(permissions.perm_groups[group]),
+				flatten(trie),
+			)
+			for perm in perms:
+				self.assertEqual(
+					bool(permissions.group_has_perm(group, perm)),
+					bool(trie.has_perm(perm)),
+					msg=f"Group '{group}' disagrees on '{perm}'.",
+				)
+	
+	def test_random_groups_match_deep_copies(self):
+		rng = random.Random(90)
+		for _ in range(40):
+			self.assertMatchesBaseline(random_groups(rng, rng.randint(1, 8)))
+	
+	def test_synthetic_configs_match_deep_copies(self):
+		for seed in range(10):
+			rng = random.Random(seed)
+			self.assertMatchesBaseline(make_config(
+				groups=rng.randint(1, 12),
+				depth=rng.randint(1, 5),
+				fanout=rng.randint(1, 3),
+				perms=rng.randint(0, 10),
+				wildcards=rng.random(),
+				negations=rng.random(),
+				segments=3,
+				seed=seed,
+			))
+	
+	def test_fixture_matches_deep_copies(self):
+		self.assertMatchesBaseline(yaml.load(fixture, Loader=yaml.FullLoader))
+
+
 # yaml-formatted permission config.
 fixture = """
 groups:
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import config
+
+# plugins.commands registers its command modules on import, so it needs a
+# commands config to exist first.
+config.configs.setdefault("commands", {"registered-cmd-pls": []})
+
+from plugins.command_plugins import quotes
+
+
+class TestConcurrentQuotes(TestCase):
+	
+	def setUp(self):
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		self.file = os.path.join(tmp.name, "quotes.json")
+		patcher = patch.object(quotes, "QUOTES_FILE", self.file)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		
+		self.old_conf = config.configs.get("quotes")
+		config.configs["quotes"] = {
+			"preserve-deled-qs": False,
+			"quotelist": {"file": None, "url": None},
+		}
+		quotes.load_quote_list(config.configs["quotes"])
+	
+	def tearDown(self):
+		config.configs["quotes"] = self.old_conf
+		quotes.quotes.clear()
+	
+	def test_concurrent_additions_get_unique_ids(self):
+		barrier = threading.Barrier(16)
+		
+		def add(i):
+			barrier.wait()
+			for j in range(5):
+				quotes.addquote(f"quote {i}.{j}")
+		
+		threads = [
+			threading.Thread(target=add, args=(i,))
+			for i in range(16)
+		]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		
+		self.assertEqual(sorted(quotes.quotes), list(range(80)))
+		with open(self.file) as file:
+			self.assertEqual(len(json.load(file)), 80)
+	
+	def test_quotes_can_be_read_while_removed(self):
+		for i in range(50):
+			quotes.addquote(f"quote {i}")
+		
+		errors = []
+		
+		def read():
+			try:
+				for _ in range(200):
+					quotes.quote()
+			except Exception as e:
+				errors.append(e)
+		
+		reader = threading.Thread(target=read)
+		reader.start()
+		for i in range(50):
+			quotes.remquote(str(i))
+		reader.join()
+		
+		self.assertEqual(errors, [])
+		self.assertEqual(quotes.quotes, {})
@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from ratelimit import KeyedLimiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+	
+	def test_bucket_starts_full(self):
+		bucket = TokenBucket(3, 1, now=0)
+		for _ in range(3):
+			self.assertTrue(bucket.consume(now=0))
+		self.assertFalse(bucket.consume(now=0))
+	
+	def test_bucket_refills_at_rate(self):
+		bucket = TokenBucket(2, 4, now=0)
+		bucket.consume(2, now=0)
+		self.assertFalse(bucket.consume(now=0.2))
+		self.assertTrue(bucket.consume(now=0.25))
+	
+	def test_bucket_does_not_overfill(self):
+		bucket = TokenBucket(2, 1, now=0)
+		bucket.refill(now=100)
+		self.assertEqual(bucket.tokens, 2)
+	
+	def test_failed_consume_takes_nothing(self):
+		bucket = TokenBucket(2, 1, now=0)
+		self.assertFalse(bucket.consume(3, now=0))
+		self.assertEqual(bucket.tokens, 2)
+	
+	def test_delay_until_tokens(self):
+		bucket = TokenBucket(1, 2, now=0)
+		self.assertEqual(bucket.delay(now=0), 0)
+		bucket.consume(now=0)
+		self.assertAlmostEqual(bucket.delay(now=0), 0.5)
+		self.assertAlmostEqual(bucket.delay(now=0.25), 0.25)
+
+
+class TestKeyedLimiter(TestCase):
+	
+	def test_keys_are_limited_separately(self):
+		limiter = KeyedLimiter(2, 1)
+		self.assertTrue(limiter.consume("a", now=0))
+		self.assertTrue(limiter.consume("a", now=0))
+		self.assertFalse(limiter.consume("a", now=0))
+		self.assertTrue(limiter.consume("b", now=0))
+	
+	def test_keys_refill_at_rate(self):
+		limiter = KeyedLimiter(1, 2)
+		limiter.consume("a", now=0)
+		self.assertFalse(limiter.consume("a", now=0.4))
+		self.assertTrue(limiter.consume("a", now=0.5))
+	
+	def test_allows_takes_nothing(self):
+		limiter = KeyedLimiter(1, 1)
+		self.assertTrue(limiter.allows("a", now=0))
+		self.assertTrue(limiter.allows("a", now=0))
+		self.assertTrue(limiter.consume("a", now=0))
+		self.assertFalse(limiter.allows("a", now=0))
+	
+	def test_refund_gives_tokens_back(self):
+		limiter = KeyedLimiter(1, 1)
+		limiter.consume("a", now=0)
+		limiter.refund("a")
+		self.assertTrue(limiter.consume("a", now=0))
+		limiter.refund("a", 5)
+		self.assertTrue(limiter.consume("a", now=0))
+		self.assertFalse(limiter.consume("a", now=0))
+	
+	def test_idle_keys_are_discarded(self):
+		limiter = KeyedLimiter(2, 1)
+		for i in range(100):
+			limiter.consume(i, now=i * 0.1)
+		self.assertLessEqual(len(limiter), 21)
+		limiter.consume("late", now=100)
+		self.assertEqual(len(limiter), 1)
+	
+	def test_discarded_keys_start_full(self):
+		limiter = KeyedLimiter(2, 1)
+		limiter.consume("a", 2, now=0)
+		limiter.consume("b", now=2)
+		self.assertEqual(len(limiter), 1)
+		self.assertTrue(limiter.consume("a", 2, now=2))
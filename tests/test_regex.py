@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import config
+
+# plugins.commands registers its command modules on import, so it needs a
+# commands config to exist first.
+config.configs.setdefault("commands", {"registered-cmd-pls": []})
+
+import cooldown
+import permissions
+from plugins import regex
+from plugins.command_plugins import regex as regex_commands
+from triggers import TriggerSet
+
+
+class TriggerMessage:
+	
+	def __init__(self, text):
+		self.text_content = text
+		self.sender_name = "Steve"
+		self.sender_id = None
+		self.sender_group = None
+
+
+regex_conf = {
+	"static-cooldown": 45,
+	"match-timeout": 0,
+	"statics": {
+		"(a)(b)(c)": "first",
+		"x(?:y)?": "second",
+		"(d)|(e)": "third",
+		"f(?P<inner>g)": "fourth",
+		"needle": {"response": "found", "search": True},
+		"": "fallback",
+	},
+}
+
+
+class TestRegexTriggers(TestCase):
+	
+	@classmethod
+	def setUpClass(cls):
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["regex.trigger"]}}}
+		)
+	
+	def setUp(self):
+		cooldown.clear()
+		regex._trigger_stats.clear()
+		config.configs["regex"] = regex_conf
+		regex.compose_regexes(regex_conf)
+	
+	def trigger(self, text):
+		return regex.regex_msg_handler(TriggerMessage(text))
+	
+	def test_inner_groups_do_not_shift_triggers(self):
+		self.assertEqual(self.trigger("abc"), "Steve - first")
+		self.assertEqual(self.trigger("xy"), "Steve - second")
+		self.assertEqual(self.trigger("e"), "Steve - third")
+		self.assertEqual(self.trigger("fg"), "Steve - fourth")
+	
+	def test_search_triggers(self):
+		self.assertEqual(self.trigger("a needle here"), "Steve - found")
+		self.assertEqual(self.trigger("abc needle"), "Steve - first")
+	
+	def test_empty_match_triggers(self):
+		self.assertEqual(self.trigger("zzz"), "Steve - fallback")
+	
+	def test_matches_are_case_insensitive(self):
+		self.assertEqual(self.trigger("ABC"), "Steve - first")
+	
+	def test_cooldown_is_per_trigger(self):
+		self.assertEqual(self.trigger("abc"), "Steve - first")
+		self.assertIsNone(self.trigger("abc"))
+		self.assertEqual(self.trigger("xy"), "Steve - second")
+		self.assertFalse(cooldown.has_cooled_down("regex.0"))
+		self.assertFalse(cooldown.has_cooled_down("regex.1"))
+	
+	def test_reload_reuses_unchanged_triggers(self):
+		old, _ = regex._regexes[0]
+		statics = dict(regex_conf["statics"], zzz="new")
+		regex.compose_regexes(dict(regex_conf, statics=statics))
+		new, _ = regex._regexes[0]
+		self.assertIs(new.triggers[0], old.triggers[0])
+		self.assertEqual(len(new), len(statics))
+	
+	def test_matches_and_tries_are_counted(self):
+		self.trigger("abc")
+		cooldown.clear()
+		self.trigger("abc")
+		self.trigger("zzz")
+		stats = {entry["pattern"]: entry for entry in regex.trigger_stats()}
+		self.assertEqual(stats["(a)(b)(c)"]["matched"], 2)
+		self.assertEqual(stats["(a)(b)(c)"]["tried"], 2)
+		self.assertEqual(stats[""]["matched"], 1)
+		self.assertEqual(stats["x(?:y)?"]["tried"], 0)
+	
+	def test_stats_are_dumped(self):
+		self.trigger("fg")
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "stats.json")
+			regex.dump_trigger_stats(path)
+			with open(path) as file:
+				dumped = json.load(file)
+		
+		self.assertEqual(
+			[entry["pattern"] for entry in dumped],
+			list(regex_conf["statics"]),
+		)
+		self.assertEqual(dumped[3]["matched"], 1)
+	
+	def test_no_triggers(self):
+		regex.compose_regexes({"statics": {}})
+		self.assertIsInstance(regex._regexes[0][0], TriggerSet)
+		self.assertIsNone(self.trigger("abc"))
+	
+	def test_forced_triggers_ignore_the_senders_own_perms(self):
+		permissions.construct_perm_tries({
+			"groups": {"default": {"perms": ["regex.trigger"]}},
+			"users": {42: {"perms": ["-regex.trigger"]}},
+		})
+		try:
+			msg = TriggerMessage("abc")
+			msg.sender_id = 42
+			msg.sender_group = "default"
+			self.assertIsNone(regex.regex_msg_handler(msg))
+			self.assertEqual(
+				regex_commands.regex(msg, "abc"),
+				"Steve - first",
+			)
+		
+		finally:
+			self.setUpClass()
+	
+	def test_denied_senders_are_ignored(self):
+		msg = TriggerMessage("abc")
+		msg.sender_group = "muted"
+		self.assertIsNone(regex.regex_msg_handler(msg))
+
+
+class TestPooledRegexTriggers(TestCase):
+	
+	@classmethod
+	def setUpClass(cls):
+		permissions.construct_perm_tries(
+			{"groups": {"default": {"perms": ["regex.trigger"]}}}
+		)
+	
+	def setUp(self):
+		cooldown.clear()
+		self.conf = {
+			"static-cooldown": 0,
+			"match-timeout": 0.5,
+			"statics": {
+				"(a+)+$": "slow",
+				"ping": {"response": "pong", "search": True},
+			},
+		}
+		config.configs["regex"] = self.conf
+		regex.compose_regexes(self.conf)
+	
+	def tearDown(self):
+		regex._pool.close()
+		regex._pool.timeouts.clear()
+		regex._pool.quarantined.clear()
+	
+	def trigger(self, text):
+		return regex.regex_msg_handler(TriggerMessage(text))
+	
+	def test_matches_in_workers(self):
+		self.assertEqual(self.trigger("a ping"), "Steve - pong")
+		self.assertEqual(self.trigger("aaa"), "Steve - slow")
+	
+	def test_catastrophic_backtracking_times_out(self):
+		with self.assertLogs(level="WARNING"):
+			self.assertIsNone(self.trigger("a" * 40 + "!"))
+		
+		self.assertEqual(self.trigger("a ping"), "Steve - pong")
@@ -0,0 +1,62 @@
+from os.path import dirname, join
+from unittest import TestCase
+import yaml
+
+from imps.role_groups import RoleGroups
+
+DEFAULT_CONF = join(
+	dirname(dirname(__file__)),
+	"configs",
+	"defs",
+	"discord.yml.def",
+)
+
+
+class TestRoleGroups(TestCase):
+	
+	def setUp(self):
+		self.groups = RoleGroups()
+		self.groups.load({
+			"admin": [1],
+			"mod": [2, "3"],
+			"trusted": [3, 4],
+			"empty": None,
+		})
+	
+	def test_single_role(self):
+		self.assertEqual(self.groups.group_for([2]), "mod")
+		self.assertEqual(self.groups.group_for([4]), "trusted")
+	
+	def test_earliest_listed_group_wins(self):
+		self.assertEqual(self.groups.group_for([4, 2]), "mod")
+		self.assertEqual(self.groups.group_for([4, 2, 1]), "admin")
+		self.assertEqual(self.groups.group_for(iter([1, 4])), "admin")
+	
+	def test_role_listed_twice_gives_earliest_group(self):
+		self.assertEqual(self.groups.group_for([3]), "mod")
+	
+	def test_unknown_roles(self):
+		self.assertIsNone(self.groups.group_for([]))
+		self.assertIsNone(self.groups.group_for([5, 6]))
+		self.assertEqual(self.groups.group_for([5, 4]), "trusted")
+	
+	def test_role_ids_are_ints(self):
+		self.assertEqual(len(self.groups), 4)
+		self.assertIsNone(self.groups.group_for(["3"]))
+	
+	def test_reload_replaces_index(self):
+		self.groups.load({"mod": [4]})
+		self.assertEqual(self.groups.group_for([1, 4]), "mod")
+		self.groups.load(None)
+		self.assertIsNone(self.groups.group_for([4]))
+	
+	def test_default_config_gives_devs_priority(self):
+		with open(DEFAULT_CONF) as f:
+			conf = yaml.load(f, Loader=yaml.FullLoader)
+		
+		self.groups.load(conf["perm-roles"])
+		staff, = conf["perm-roles"]["staff"]
+		devs, = conf["perm-roles"]["devs"]
+		self.assertEqual(self.groups.group_for([staff, devs]), "devs")
+		self.assertEqual(self.groups.group_for([devs, staff]), "devs")
+		self.assertEqual(self.groups.group_for([staff]), "staff")
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from imps.send_queue import SendQueue
+
+
+class FakeChannel:
+	def __init__(self, id):
+		self.id = id
+		self.sent = []
+	
+	async def send(self, text):
+		self.sent.append((time.monotonic(), text))
+
+
+class TestSendQueue(TestCase):
+	
+	def run_queue(self, queue, puts):
+		async def main():
+			for channel, text in puts:
+				if channel is None:
+					# Let the queue catch up.
+					await asyncio.sleep(0)
+				else:
+					queue.put(channel, text)
+			await queue.join()
+		
+		loop = asyncio.new_event_loop()
+		try:
+			loop.run_until_complete(main())
+		finally:
+			loop.close()
+	
+	def texts(self, channel):
+		return [text for _, text in channel.sent]
+	
+	def test_single_message_is_sent(self):
+		channel = FakeChannel(1)
+		self.run_queue(SendQueue(), [(channel, "hello")])
+		self.assertEqual(self.texts(channel), ["hello"])
+	
+	def test_pending_messages_are_merged(self):
+		channel = FakeChannel(1)
+		self.run_queue(SendQueue(), [(channel, str(i)) for i in range(3)])
+		self.assertEqual(self.texts(channel), ["0\n1\n2"])
+	
+	def test_burst_beyond_limit_is_merged(self):
+		channel = FakeChannel(1)
+		queue = SendQueue(capacity=1, per=0.05)
+		puts = [(channel, "0"), (None, None)]
+		puts += [(channel, str(i)) for i in range(1, 5)]
+		self.run_queue(queue, puts)
+		self.assertEqual(self.texts(channel), ["0", "1\n2\n3\n4"])
+	
+	def test_rate_limit_spaces_out_sends(self):
+		channel = FakeChannel(1)
+		queue = SendQueue(capacity=1, per=0.05, max_length=1)
+		self.run_queue(queue, [(channel, "a"), (channel, "b"), (channel, "c")])
+		self.assertEqual(self.texts(channel), ["a", "b", "c"])
+		first, last = channel.sent[0][0], channel.sent[-1][0]
+		self.assertGreaterEqual(last - first, 0.09)
+	
+	def test_merged_sends_respect_max_length(self):
+		channel = FakeChannel(1)
+		queue = SendQueue(capacity=1, per=0.01, max_length=10)
+		self.run_queue(queue, [(channel, "aaaa")] * 5)
+		self.assertEqual(
+			self.texts(channel),
+			["aaaa\naaaa", "aaaa\naaaa", "aaaa"],
+		)
+	
+	def test_long_message_is_split(self):
+		channel = FakeChannel(1)
+		queue = SendQueue(capacity=5, per=0.01, max_length=4)
+		self.run_queue(queue, [(channel, "abcdefghij")])
+		self.assertEqual(self.texts(channel), ["abcd", "efgh", "ij"])
+	
+	def test_channels_are_limited_separately(self):
+		first, second = FakeChannel(1), FakeChannel(2)
+		queue = SendQueue(capacity=1, per=10)
+		
+		async def main():
+			queue.put(first, "a")
+			queue.put(second, "b")
+			await asyncio.sleep(0.05)
+		
+		loop = asyncio.new_event_loop()
+		try:
+			loop.run_until_complete(main())
+			self.assertEqual(self.texts(first), ["a"])
+			self.assertEqual(self.texts(second), ["b"])
+		finally:
+			for task in asyncio.all_tasks(loop):
+				task.cancel()
+			loop.close()
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+import stats
+from handlers import MessageHandler
+from stats import Histogram
+
+
+def nothing(_):
+	pass
+
+
+class TestHistogram(TestCase):
+
+	def test_empty_histogram(self):
+		hist = Histogram()
+		self.assertEqual(hist.percentile(50), 0.0)
+		self.assertEqual(hist.summary()["count"], 0)
+
+	def test_count_and_max_are_exact(self):
+		hist = Histogram()
+		for secs in (0.001, 0.002, 0.5, 0.003):
+			hist.record(secs)
+		self.assertEqual(hist.count, 4)
+		self.assertEqual(hist.max, 0.5)
+		self.assertAlmostEqual(hist.summary()["mean"], 0.1265)
+
+	def test_percentiles_within_a_bucket(self):
+		hist = Histogram()
+		for i in range(1, 1001):
+			hist.record(i / 1000)
+		for pct in (50, 95, 99):
+			expected = pct / 100
+			estimate = hist.percentile(pct)
+			self.assertGreaterEqual(estimate, expected)
+			self.assertLessEqual(estimate, expected * 1.2)
+		self.assertEqual(hist.percentile(100), 1.0)
+
+	def test_memory_is_fixed(self):
+		hist = Histogram()
+		for i in range(10000):
+			hist.record(i * 1e-4)
+		hist.record(10 ** 9)
+		hist.record(0)
+		self.assertEqual(len(hist.buckets), Histogram.NUM_BUCKETS)
+
+
+class TestRecording(TestCase):
+
+	def setUp(self):
+		stats.reset()
+		MessageHandler.handlers.clear()
+
+	def test_timed_records_on_exception(self):
+		with self.assertRaises(ValueError):
+			with stats.timed("test.raises"):
+				raise ValueError
+		self.assertEqual(stats.get_stats()["test.raises"]["count"], 1)
+
+	def test_get_stats_filters_by_prefix(self):
+		stats.record("cmd.a", 0.1)
+		stats.record("handler.b", 0.1)
+		self.assertEqual(list(stats.get_stats("cmd.")), ["cmd.a"])
+
+	def test_message_handlers_are_timed(self):
+		MessageHandler(nothing)
+		MessageHandler.fire_handlers(None)
+		MessageHandler.fire_handlers(None)
+		name = stats.handler_name(nothing)
+		self.assertEqual(stats.get_stats()[name]["count"], 2)
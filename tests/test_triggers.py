@@ -0,0 +1,299 @@
+import random
+import re
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import triggers
+from triggers import TriggerPool, TriggerSet
+
+
+def naive_match(patterns, text):
+	for ind, (pattern, search) in enumerate(patterns):
+		regex = re.compile(pattern, triggers.FLAGS)
+		if (regex.search if search else regex.match)(text):
+			return ind
+	
+	return None
+
+
+def random_pattern(rng, alphabet="abcSſİı", depth=2):
+	parts = []
+	for _ in range(rng.randint(1, 4)):
+		choice = rng.random()
+		if choice < 0.2 and depth:
+			# Groups aren't repeated, to avoid catastrophic backtracking.
+			group = random_pattern(rng, alphabet, depth - 1)
+			parts.append(rng.choice(["({})", "(?:{})", "(?:{})?"]).format(group))
+			continue
+		
+		if choice < 0.7:
+			atom = rng.choice(alphabet)
+		elif choice < 0.8:
+			atom = "."
+		else:
+			atom = f"[{rng.choice(alphabet)}{rng.choice(alphabet)}]"
+		
+		parts.append(atom + rng.choice(["", "", "", "?", "*", "+", "{2}"]))
+	
+	pattern = "".join(parts)
+	if rng.random() < 0.2 and depth:
+		pattern += "|" + random_pattern(rng, alphabet, depth - 1)
+	
+	return pattern
+
+
+class TestRequiredLiterals(TestCase):
+	
+	def test_literal_runs(self):
+		self.assertEqual(triggers.required_literals("beep"), {"beep"})
+		self.assertEqual(
+			triggers.required_literals(r"what'?s?(?: the)? bot'?s? name"),
+			{" name"},
+		)
+	
+	def test_branches_need_every_branch(self):
+		literals = triggers.required_literals("hello|howdy")
+		for word in ("hello", "howdy"):
+			self.assertTrue(any(lit in word for lit in literals))
+		self.assertFalse(any(lit in "hi" for lit in literals))
+		self.assertIsNone(triggers.required_literals("hello|.*"))
+	
+	def test_optional_parts_are_not_required(self):
+		self.assertIsNone(triggers.required_literals("(?:abc)?"))
+		self.assertIsNone(triggers.required_literals("x*"))
+		self.assertEqual(triggers.required_literals("(?:abc)+"), {"abc"})
+	
+	def test_literals_are_folded(self):
+		self.assertEqual(triggers.required_literals("BEEP"), {"beep"})
+		self.assertEqual(
+			triggers.required_literals("ſtop"),
+			triggers.required_literals("stop"),
+		)
+
+
+class TestTriggerSet(TestCase):
+	
+	def test_first_matching_trigger_wins(self):
+		trigger_set = TriggerSet([
+			("hello there", False),
+			("hello", False),
+			("there", True),
+		])
+		self.assertEqual(trigger_set.match("Hello there"), 0)
+		self.assertEqual(trigger_set.match("hello you"), 1)
+		self.assertEqual(trigger_set.match("you there"), 2)
+		self.assertIsNone(trigger_set.match("you"))
+	
+	def test_unmatchable_text_has_no_candidates(self):
+		trigger_set = TriggerSet(
+			(f"trigger{i} phrase", False)
+			for i in range(100)
+		)
+		self.assertEqual(trigger_set.candidates("just chatting"), [])
+		self.assertEqual(trigger_set.candidates("trigger42 phrase"), [42])
+	
+	def test_triggers_without_literals_are_always_candidates(self):
+		trigger_set = TriggerSet([("abc", False), (r"\d+", False)])
+		self.assertEqual(trigger_set.candidates("xyz"), [1])
+	
+	def test_case_insensitive_equivalents(self):
+		trigger_set = TriggerSet([("stop", True), ("kit", False)])
+		self.assertEqual(trigger_set.match("please ſTOP"), 0)
+		self.assertEqual(trigger_set.match("KIT"), 1)
+	
+	def test_unchanged_triggers_are_reused(self):
+		old = TriggerSet([("abc", False), ("def", True)], prefilter=True)
+		new = TriggerSet(
+			[("def", True), ("abc", True), ("ghi", False)],
+			prefilter=True,
+			reuse=old,
+		)
+		self.assertIs(new.triggers[0], old.triggers[1])
+		self.assertIsNot(new.triggers[1], old.triggers[0])
+		self.assertEqual(new.match("x abc"), 1)
+		self.assertEqual(new.match("ghi"), 2)
+	
+	def test_evaluate_times_each_trigger_tried(self):
+		trigger_set = TriggerSet(
+			[("ab", True), ("b", True), ("c$", True), ("x", True)],
+			prefilter=True,
+		)
+		ind, timings = trigger_set.evaluate("xbc")
+		self.assertEqual(ind, 1)
+		self.assertEqual(
+			[(ind, matched) for ind, _, matched in timings],
+			[(1, True)],
+		)
+		
+		ind, timings = trigger_set.evaluate("cx")
+		self.assertEqual(ind, 3)
+		self.assertEqual(
+			[(ind, matched) for ind, _, matched in timings],
+			[(2, False), (3, True)],
+		)
+		
+		self.assertEqual(trigger_set.evaluate("zzz"), (None, []))
+	
+	def test_alternation_charges_the_winner(self):
+		trigger_set = TriggerSet([("ab", True), ("b", True)], prefilter=False)
+		ind, timings = trigger_set.evaluate("xbc")
+		self.assertEqual(ind, 1)
+		self.assertEqual(
+			[(ind, matched) for ind, _, matched in timings],
+			[(1, True)],
+		)
+		self.assertEqual(trigger_set.evaluate("zzz"), (None, []))
+	
+	def test_clashing_group_names_are_not_combined(self):
+		trigger_set = TriggerSet(
+			[("(?P<x>a)b", False), ("(?P<x>c)d", False)],
+			prefilter=False,
+		)
+		self.assertEqual(trigger_set.match("cd"), 1)
+	
+	def test_backreferences_agree_with_and_without_prefilter(self):
+		patterns = [
+			("x", False),
+			(r"(b)\1", False),
+			(r"(?P<c>c)(?P=c)", True),
+			(r"(d)?(?(1)e|f)", False),
+			(r"(g)(h)\2", True),
+		]
+		trigger_sets = [
+			TriggerSet(patterns, prefilter=True),
+			TriggerSet(patterns, prefilter=False),
+		]
+		for text in ("bb", "b", "a cc", "de", "f", "e", "ghh", "gh", "x"):
+			expected = naive_match(patterns, text)
+			for trigger_set in trigger_sets:
+				self.assertEqual(
+					trigger_set.match(text),
+					expected,
+					msg=f"{text!r}",
+				)
+	
+	def test_without_the_regex_parser_every_trigger_is_tried(self):
+		patterns = [("abc", False), (r"(b)\1", True), ("d+", True)]
+		with patch.object(triggers, "sre_parse", None):
+			trigger_sets = [
+				TriggerSet(patterns, prefilter=True),
+				TriggerSet(patterns, prefilter=False),
+			]
+		
+		for trigger_set in trigger_sets:
+			self.assertEqual(trigger_set.candidates("zzz"), [0, 1, 2])
+			for text in ("abc", "xbb", "a dd", "b"):
+				self.assertEqual(
+					trigger_set.match(text),
+					naive_match(patterns, text),
+				)
+	
+	def test_empty_set_matches_nothing(self):
+		self.assertIsNone(TriggerSet([]).match("anything"))
+	
+	def test_random_triggers_match_naive_evaluation(self):
+		rng = random.Random(7)
+		alphabet = "abcSſİı"
+		for _ in range(200):
+			patterns = [
+				(random_pattern(rng), rng.random() < 0.5)
+				for _ in range(rng.randint(1, 8))
+			]
+			trigger_sets = [
+				TriggerSet(patterns, prefilter=True),
+				TriggerSet(patterns, prefilter=False),
+			]
+			evaluated = TriggerSet(patterns)
+			for _ in range(20):
+				text = "".join(
+					rng.choice(alphabet + "xyz ")
+					for _ in range(rng.randint(0, 10))
+				)
+				expected = naive_match(patterns, text)
+				for trigger_set in trigger_sets:
+					self.assertEqual(
+						trigger_set.match(text),
+						expected,
+						msg=f"{patterns!r} on {text!r}",
+					)
+				
+				self.assertEqual(
+					evaluated.evaluate(text)[0],
+					expected,
+					msg=f"{patterns!r} on {text!r}",
+				)
+
+
+class TestTriggerPool(TestCase):
+	
+	evil = "a" * 40 + "!"
+	
+	def setUp(self):
+		self.pool = TriggerPool(workers=1, timeout=0.5, quarantine_after=2)
+		self.triggers = self.pool.load([("(a+)+$", False), ("ok", True)])
+	
+	def tearDown(self):
+		self.pool.close()
+	
+	def test_matches_like_trigger_set(self):
+		self.assertEqual(self.triggers.match("it's ok"), 1)
+		self.assertEqual(self.triggers.match("aaa"), 0)
+		self.assertIsNone(self.triggers.match("nothing"))
+	
+	def test_overrunning_worker_is_replaced(self):
+		with self.assertLogs(level="WARNING"):
+			start = time.perf_counter()
+			self.assertIsNone(self.triggers.match(self.evil))
+		
+		self.assertLess(time.perf_counter() - start, 5)
+		self.assertEqual(self.pool.timeouts, {"(a+)+$": 1})
+		self.assertEqual(self.triggers.match("ok"), 1)
+	
+	def test_repeat_offenders_are_quarantined(self):
+		with self.assertLogs(level="WARNING") as logs:
+			self.triggers.match(self.evil)
+			self.triggers.match(self.evil)
+		
+		self.assertEqual(self.pool.quarantined, {"(a+)+$"})
+		self.assertIn("Quarantined", logs.output[-1])
+		
+		# The quarantined trigger is skipped, but others still match.
+		self.assertIsNone(self.triggers.match("aaa"))
+		self.assertEqual(self.triggers.match(self.evil + " ok"), 1)
+	
+	def test_quarantine_outlasts_reloads(self):
+		with self.assertLogs(level="WARNING"):
+			self.triggers.match(self.evil)
+			self.triggers.match(self.evil)
+		
+		reloaded = self.pool.load([("ok", False), ("(a+)+$", False)])
+		self.assertIsNone(reloaded.match("aaa"))
+		self.assertEqual(reloaded.match("ok"), 0)
+	
+	def test_loaded_sets_are_unaffected_by_later_loads(self):
+		reloaded = self.pool.load([("ok", False)])
+		self.assertEqual(self.triggers.match("it's ok"), 1)
+		self.assertEqual(reloaded.match("ok"), 0)
+		self.assertIsNone(reloaded.match("it's ok"))
+		self.assertEqual(self.triggers.match("aaa"), 0)
+	
+	def test_evaluate_blames_timeouts(self):
+		with self.assertLogs(level="WARNING"):
+			self.assertEqual(
+				self.triggers.evaluate(self.evil),
+				(None, [(0, 0.5, False)]),
+			)
+	
+	def test_evaluate_reports_timings(self):
+		ind, timings = self.triggers.evaluate("aaa")
+		self.assertEqual(ind, 0)
+		self.assertEqual([(ind, matched) for ind, _, matched in timings], [
+			(0, True),
+		])
+	
+	def test_invalid_patterns_are_rejected(self):
+		with self.assertRaises(re.error):
+			self.pool.load([("(", False)])
+		
+		self.assertEqual(self.triggers.match("ok"), 1)
@@ -0,0 +1,745 @@
+"""
+Module for matching text against large sets of regex triggers.
+
+Most text matches none of a set's triggers, so rather than trying every
+trigger on every message, the literal substrings that each trigger's matches
+must contain are found when the set is made. An index of short substrings of
+those literals then picks out the few triggers that could match a message,
+and only those are tried.
+
+Since triggers come from editable config, any of them may backtrack
+catastrophically on some text. A TriggerPool matches text in worker
+processes instead, under a time budget, killing any worker that runs over it
+and quarantining triggers which keep doing so.
+
+Either kind of set can also report how long each trigger it tried took.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import re
+import threading
+import time
+
+# Literals are found with the re module's private parser, which differs
+#   between versions of Python. Without it, every trigger is always tried.
+try:
+	from re import _parser as sre_parse
+	from re._casefix import _EXTRA_CASES
+
+except ImportError:
+	try:
+		import sre_parse
+		from sre_compile import _ignorecase_fixes as _EXTRA_CASES
+
+	except ImportError:
+		sre_parse = None
+		_EXTRA_CASES = {}
+
+# The flags every trigger is compiled with.
+FLAGS = re.IGNORECASE
+
+# The length of the substrings that triggers are indexed by.
+GRAM_LENGTH = 4
+
+# Sets with fewer triggers than this are matched as a single alternation,
+#   which is faster than prefiltering so few.
+PREFILTER_MIN = 50
+
+# The default number of seconds a TriggerPool may spend matching one text.
+MATCH_TIMEOUT = 0.25
+
+# The default number of timeouts after which a TriggerPool quarantines the
+#   trigger being tried at the time.
+QUARANTINE_AFTER = 3
+
+# The opcodes of repeats, some of which only newer versions of Python have.
+_REPEATS = tuple(
+	getattr(sre_parse, name)
+	for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+	if hasattr(sre_parse, name)
+)
+
+
+def _fold_table():
+	"""
+	Make a str.translate() table for folding lowercased text.
+
+	Characters which IGNORECASE treats as equal, beyond their lowercase
+	forms, are all mapped to the same character.
+	"""
+
+	table = {}
+	for char, equivalents in _EXTRA_CASES.items():
+		canonical = min((char,) + tuple(equivalents))
+		if canonical != char:
+			table[char] = canonical
+
+	return table
+
+
+_FOLD_TABLE = _fold_table()
+
+# Characters whose full lowercase form differs from what IGNORECASE uses.
+_PRE_FOLD_TABLE = {0x130: "i"}
+
+
+def fold(text):
+	"""
+	Fold text so that it equals any text it would match under IGNORECASE.
+	"""
+
+	return text.translate(_PRE_FOLD_TABLE).lower().translate(_FOLD_TABLE)
+
+
+def _required(parsed):
+	"""
+	Find literals, one of which must be in every match of a parsed regex.
+
+	Args:
+		parsed: a sequence of sre_parse (opcode, argument) pairs.
+
+	Returns: a set of literal strings, or None if none could be found.
+	"""
+
+	options = []
+	run = []
+
+	def end_run():
+		if run:
+			options.append({"".join(run)})
+			run.clear()
+
+	for op, av in parsed:
+		if op is sre_parse.LITERAL:
+			run.append(chr(av))
+			continue
+
+		end_run()
+
+		if op is sre_parse.SUBPATTERN:
+			found = _required(av[-1])
+
+		elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+			found = _required(av)
+
+		elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+			# Negative lookarounds don't require anything.
+			found = _required(av[1]) if op is sre_parse.ASSERT else None
+
+		elif op in _REPEATS:
+			low, _, item = av
+			found = _required(item) if low else None
+
+		elif op is sre_parse.BRANCH:
+			# Each branch has to require something for the branches to.
+			found = set()
+			for branch in av[1]:
+				branch_found = _required(branch)
+				if not branch_found:
+					found = None
+					break
+
+				found |= branch_found
+
+		else:
+			found = None
+
+		if found:
+			options.append(found)
+
+	end_run()
+
+	if not options:
+		return None
+
+	# Prefer the option whose shortest literal is longest, since longer
+	#   literals rule out more text.
+	return max(options, key=lambda lits: (min(map(len, lits)), -len(lits)))
+
+
+def _refers_to_groups(parsed):
+	"""
+	Return whether a parsed regex refers to any group by its number.
+
+	Named references are parsed into numbers too, so they count as well.
+
+	Args:
+		parsed: a sequence of sre_parse (opcode, argument) pairs, or an
+			argument which may contain some.
+	"""
+
+	for op, av in parsed:
+		if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+			return True
+
+		nested = av if isinstance(av, (tuple, list)) else (av,)
+		for item in nested:
+			if isinstance(item, sre_parse.SubPattern):
+				if _refers_to_groups(item):
+					return True
+
+			elif isinstance(item, (tuple, list)):
+				for sub in item:
+					if isinstance(sub, sre_parse.SubPattern):
+						if _refers_to_groups(sub):
+							return True
+
+	return False
+
+
+def required_literals(pattern):
+	"""
+	Find literals, one of which must be in any text the pattern matches.
+
+	Args:
+		pattern: a regex pattern, as compiled with FLAGS.
+
+	Returns: a set of folded literal strings, or None if there's no literal
+		that every match must contain, or the regex parser is unavailable.
+	"""
+
+	if sre_parse is None:
+		return None
+
+	found = _required(sre_parse.parse(pattern, FLAGS))
+	if not found:
+		return None
+
+	return {fold(lit) for lit in found}
+
+
+class Trigger:
+	"""
+	A single regex trigger.
+
+	Attributes:
+		pattern: the trigger's regex pattern.
+		search: whether the trigger may match anywhere in the text, rather
+			than only at its start.
+		regex: the compiled pattern.
+		literals: folded literals, one of which is in any text the trigger
+			matches, or None if there are none.
+		groupref: whether the pattern refers to its own groups, e.g. with a
+			backreference, so can't be embedded in a larger pattern, where
+			its groups would be numbered differently.
+	"""
+
+	__slots__ = ("pattern", "search", "regex", "literals", "groupref")
+
+	def __init__(self, pattern, search=False):
+		self.pattern = pattern
+		self.search = search
+		self.regex = re.compile(pattern, FLAGS)
+		self.literals = required_literals(pattern)
+
+		if sre_parse is None:
+			# A pattern can only refer to groups it has.
+			self.groupref = self.regex.groups > 0
+		else:
+			self.groupref = _refers_to_groups(sre_parse.parse(pattern, FLAGS))
+
+	@property
+	def anchored(self):
+		"""
+		Return a pattern which matches at the start of any text this trigger
+		matches.
+		"""
+
+		if self.search:
+			return f"(?s:.*?)(?:{self.pattern})"
+
+		return self.pattern
+
+	def matches(self, text):
+		"""
+		Return whether the trigger matches the given text.
+		"""
+
+		if self.search:
+			return self.regex.search(text) is not None
+
+		return self.regex.match(text) is not None
+
+
+class TriggerSet:
+	"""
+	An ordered set of triggers, of which the first that matches text wins.
+
+	Attributes:
+		triggers: the Triggers, in priority order.
+	"""
+
+	def __init__(self, triggers, prefilter=None, reuse=None):
+		"""
+		Make a trigger set, and index its triggers by their literals.
+
+		Args:
+			triggers: an iterable of (pattern, search) pairs, in priority
+				order.
+			prefilter: whether to match text by prefiltering, rather than by
+				a single alternation. By default, only sets of at least
+				PREFILTER_MIN triggers are prefiltered.
+			reuse: a previous TriggerSet, whose compiled Triggers are reused
+				for any of the same triggers, rather than compiled again.
+		"""
+
+		compiled = {}
+		if reuse is not None:
+			compiled = {
+				(trigger.pattern, trigger.search): trigger
+				for trigger in reuse.triggers
+			}
+
+		self.triggers = [
+			compiled.get((pattern, search)) or Trigger(pattern, search)
+			for pattern, search in triggers
+		]
+
+		# Indices of triggers without literals, which are always tried.
+		self._always = []
+		# Substrings of literals mapped to the indices of triggers which
+		#   need one of those literals.
+		self._index = {}
+
+		for ind, trigger in enumerate(self.triggers):
+			if not trigger.literals or "" in trigger.literals:
+				self._always.append(ind)
+				continue
+
+			for lit in trigger.literals:
+				grams = [
+					lit[start:start + GRAM_LENGTH]
+					for start in range(max(1, len(lit) - GRAM_LENGTH + 1))
+				]
+
+				# Index each literal by its least shared substring, to keep
+				#   the number of candidates for any text low.
+				gram = min(grams, key=lambda g: len(self._index.get(g, ())))
+				posting = self._index.setdefault(gram, [])
+				if not posting or posting[-1] != ind:
+					posting.append(ind)
+
+		self._gram_lengths = sorted({len(gram) for gram in self._index})
+
+		if prefilter is None:
+			prefilter = len(self.triggers) >= PREFILTER_MIN
+
+		self._combined = None
+		if self.triggers and not prefilter:
+			self._combined = self._compile_alternation()
+
+	def _compile_alternation(self):
+		"""
+		Compile every trigger into a single alternation.
+
+		Each trigger is wrapped in its own named group, so the trigger that
+		matched is the match's lastgroup. Alternatives are tried in order, so
+		the first trigger that matches wins.
+
+		Returns: the compiled alternation, or None if the triggers can't be
+			combined, e.g. because more than one defines the same group name,
+			or one refers to its groups by number.
+		"""
+
+		if any(trigger.groupref for trigger in self.triggers):
+			return None
+
+		try:
+			return re.compile(
+				"|".join(
+					f"(?P<_t{ind}>{trigger.anchored})"
+					for ind, trigger in enumerate(self.triggers)
+				),
+				FLAGS,
+			)
+
+		except re.error:
+			return None
+
+	def __len__(self):
+		return len(self.triggers)
+
+	def candidates(self, text):
+		"""
+		Return the indices of the triggers which might match text, in order.
+		"""
+
+		folded = fold(text)
+
+		found = set(self._always)
+		index = self._index
+		for length in self._gram_lengths:
+			for start in range(len(folded) - length + 1):
+				posting = index.get(folded[start:start + length])
+				if posting:
+					found.update(posting)
+
+		triggers = self.triggers
+		return sorted(
+			ind
+			for ind in found
+			if triggers[ind].literals is None
+			or any(lit in folded for lit in triggers[ind].literals)
+		)
+
+	def evaluate(self, text, before_try=None):
+		"""
+		Find the first trigger that matches text, timing each trigger tried.
+
+		A set matched as a single alternation can't tell which trigger took
+		the time, so the whole match is charged to the trigger that wins,
+		and nothing is timed when none do.
+
+		Args:
+			text: the text to match.
+			before_try: a function called with the index of each trigger
+				just before it's tried.
+
+		Returns: an (index, timings) pair, where index is that of the first
+			trigger that matches, or None if none do, and timings is a list
+			of (index, seconds, matched) triples for each trigger tried.
+		"""
+
+		if self._combined is not None:
+			start = time.perf_counter()
+			ind = self.match(text)
+			if ind is None:
+				return None, []
+
+			return ind, [(ind, time.perf_counter() - start, True)]
+
+		timings = []
+		for ind in self.candidates(text):
+			if before_try is not None:
+				before_try(ind)
+
+			start = time.perf_counter()
+			matched = self.triggers[ind].matches(text)
+			timings.append((ind, time.perf_counter() - start, matched))
+
+			if matched:
+				return ind, timings
+
+		return None, timings
+
+	def match(self, text):
+		"""
+		Find the first trigger that matches text.
+
+		Returns: the index of the trigger, or None if none match.
+		"""
+
+		if self._combined is not None:
+			m = self._combined.match(text)
+			if m is None:
+				return None
+
+			return int(m.lastgroup[2:])
+
+		for ind in self.candidates(text):
+			if self.triggers[ind].matches(text):
+				return ind
+
+		return None
+
+
+def _serve(conn, current):
+	"""
+	Match texts against triggers for a TriggerPool, until its pipe is closed.
+
+	Requests are either ("load", [(index, pattern, search), ...]) to replace
+	the worker's triggers, which is acknowledged with None, or
+	("match", text), which is answered as from TriggerSet.evaluate(), with
+	indices as given in the load.
+
+	Args:
+		conn: the worker's end of a multiprocessing Pipe.
+		current: a shared multiprocessing Value, set to the index of the
+			trigger being tried, or -1 while none is.
+	"""
+
+	indices = []
+	trigger_set = TriggerSet([], prefilter=True)
+
+	def before_try(ind):
+		current.value = indices[ind]
+
+	while True:
+		try:
+			kind, arg = conn.recv()
+
+		except EOFError:
+			return
+
+		if kind == "load":
+			indices = [ind for ind, _, _ in arg]
+			trigger_set = TriggerSet(
+				((pattern, search) for _, pattern, search in arg),
+				prefilter=True,
+				reuse=trigger_set,
+			)
+			conn.send(None)
+			continue
+
+		result, timings = trigger_set.evaluate(arg, before_try)
+		current.value = -1
+		conn.send((
+			None if result is None else indices[result],
+			[
+				(indices[ind], secs, matched)
+				for ind, secs, matched in timings
+			],
+		))
+
+
+class _Worker:
+	"""
+	A worker process of a TriggerPool.
+
+	Attributes:
+		process: the worker's multiprocessing Process.
+		conn: the pool's end of the pipe to the worker.
+		current: the index of the trigger the worker is trying, or -1.
+		loaded: the version of the triggers that the worker has loaded.
+	"""
+
+	def __init__(self, context):
+		self.conn, child_conn = context.Pipe()
+		self.current = context.Value("i", -1, lock=False)
+		self.process = context.Process(
+			target=_serve,
+			args=(child_conn, self.current),
+			daemon=True,
+		)
+		self.process.start()
+		child_conn.close()
+		self.loaded = None
+
+	def kill(self):
+		"""
+		Kill the worker process.
+		"""
+
+		self.process.kill()
+		self.process.join()
+		self.conn.close()
+
+
+class TriggerPool:
+	"""
+	A pool of worker processes which match text against triggers under a
+	time budget.
+
+	Triggers are loaded into a pool as a PooledTriggerSet. A worker that
+	overruns the budget while matching text against one is killed and
+	replaced, and the text is treated as matching nothing. The trigger being
+	tried at the time is blamed for the timeout, and once a trigger has been
+	blamed for quarantine_after timeouts, it's quarantined, i.e. no longer
+	tried. A trigger stays quarantined across loads for as long as its
+	pattern is unchanged.
+
+	Workers are started as they're needed, and each matches one text at a
+	time, so at most `workers` texts are matched at once. Each keeps the
+	compiled triggers of the last set it matched against, so that switching
+	to a set loaded after an edit only compiles the edited triggers.
+
+	Attributes:
+		timeout: the number of seconds that matching one text may take.
+		quarantine_after: the number of timeouts after which a trigger is
+			quarantined.
+		timeouts: patterns mapped to the number of timeouts they've caused.
+		quarantined: the set of quarantined patterns.
+	"""
+
+	def __init__(
+		self,
+		workers=2,
+		timeout=MATCH_TIMEOUT,
+		quarantine_after=QUARANTINE_AFTER,
+	):
+		self.timeout = timeout
+		self.quarantine_after = quarantine_after
+		self.timeouts = {}
+		self.quarantined = set()
+
+		self._context = multiprocessing.get_context("spawn")
+		self._lock = threading.Lock()
+		self._serials = itertools.count()
+		# Patterns which are known to compile.
+		self._valid = set()
+
+		# Idle workers, with None in place of those not yet started.
+		self._idle = queue.LifoQueue()
+		for _ in range(workers):
+			self._idle.put(None)
+
+	def load(self, triggers):
+		"""
+		Load triggers to be matched in the pool.
+
+		Args:
+			triggers: an iterable of (pattern, search) pairs, in priority
+				order.
+
+		Returns: a PooledTriggerSet of the triggers.
+
+		Raises:
+			re.error: if any of the patterns is invalid.
+		"""
+
+		triggers = list(triggers)
+
+		valid = set()
+		for pattern, _ in triggers:
+			if pattern not in self._valid:
+				re.compile(pattern, FLAGS)
+
+			valid.add(pattern)
+
+		self._valid = valid
+		return PooledTriggerSet(self, next(self._serials), triggers)
+
+	def _spec(self, trigger_set):
+		"""
+		Return what workers need to load to match against a trigger set.
+
+		Returns: a (version, [(index, pattern, search), ...]) pair, for the
+			set's unquarantined triggers.
+		"""
+
+		with self._lock:
+			version = (trigger_set.serial, len(self.quarantined))
+			if trigger_set._spec is None or trigger_set._spec[0] != version:
+				trigger_set._spec = (version, [
+					(ind, pattern, search)
+					for ind, (pattern, search) in enumerate(trigger_set.triggers)
+					if pattern not in self.quarantined
+				])
+
+			return trigger_set._spec
+
+	def evaluate(self, trigger_set, text):
+		"""
+		Find the first trigger of a PooledTriggerSet that matches text.
+
+		Returns: an (index, timings) pair, as from TriggerSet.evaluate(). The
+			index is None if matching ran out of time, in which case the
+			trigger blamed for it is timed at the whole time budget.
+		"""
+
+		worker = self._idle.get()
+		try:
+			if worker is None:
+				worker = _Worker(self._context)
+
+			version, spec = self._spec(trigger_set)
+			if worker.loaded != version:
+				worker.conn.send(("load", spec))
+				worker.conn.recv()
+				worker.loaded = version
+
+			worker.conn.send(("match", text))
+			if worker.conn.poll(self.timeout):
+				return worker.conn.recv()
+
+			blamed = worker.current.value
+			worker.kill()
+			worker = None
+
+			if blamed < 0:
+				return None, []
+
+			self._blame(trigger_set.triggers[blamed][0])
+			return None, [(blamed, self.timeout, False)]
+
+		except (EOFError, OSError):
+			# The worker died, so start a new one in its place next time.
+			if worker is not None:
+				worker.kill()
+				worker = None
+
+			return None, []
+
+		finally:
+			self._idle.put(worker)
+
+	def _blame(self, pattern):
+		"""
+		Record a timeout against a trigger, and quarantine it if it's due.
+		"""
+
+		with self._lock:
+			count = self.timeouts.get(pattern, 0) + 1
+			self.timeouts[pattern] = count
+			logging.warning(
+				f"Regex trigger {pattern!r} timed out "
+				f"({count}/{self.quarantine_after})."
+			)
+
+			if count >= self.quarantine_after:
+				self.quarantined.add(pattern)
+				logging.warning(f"Quarantined regex trigger {pattern!r}.")
+
+	def close(self):
+		"""
+		Kill every idle worker process.
+		"""
+
+		workers = []
+		while True:
+			try:
+				workers.append(self._idle.get_nowait())
+
+			except queue.Empty:
+				break
+
+		for worker in workers:
+			if worker is not None:
+				worker.kill()
+
+			self._idle.put(None)
+
+
+class PooledTriggerSet:
+	"""
+	An ordered set of triggers, matched in a TriggerPool's workers.
+
+	Loading new triggers into the pool doesn't affect a set already loaded,
+	so text is matched against one consistent set of triggers even while
+	another is being loaded.
+
+	Attributes:
+		pool: the TriggerPool the set is matched in.
+		serial: a number identifying the set among those of its pool.
+		triggers: the (pattern, search) pairs, in priority order.
+	"""
+
+	def __init__(self, pool, serial, triggers):
+		self.pool = pool
+		self.serial = serial
+		self.triggers = triggers
+		# What workers load, as made by TriggerPool._spec().
+		self._spec = None
+
+	def __len__(self):
+		return len(self.triggers)
+
+	def evaluate(self, text):
+		"""
+		Find the first trigger that matches text, as TriggerPool.evaluate().
+		"""
+
+		return self.pool.evaluate(self, text)
+
+	def match(self, text):
+		"""
+		Find the first trigger that matches text.
+
+		Returns: the index of the trigger, or None if none match, or matching
+			ran out of time.
+		"""
+
+		return self.pool.evaluate(self, text)[0]